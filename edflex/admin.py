@@ -1,11 +1,37 @@
 from django.contrib import admin
-from .models import Category, Resource
+from django.db.models import Q
+from .models import Category, EdflexBlock, Resource, ResourceCategory, SyncState
+from .search import search
+
+
+class ResourceCategoryInline(admin.TabularInline):
+    model = ResourceCategory
+    raw_id_fields = ('category',)
+    extra = 0
 
 
 class ResourceAdmin(admin.ModelAdmin):
+    inlines = (ResourceCategoryInline,)
     list_filter = ('language', 'r_type', 'categories__name')
     search_fields = ('resource_id', 'title')
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        matches = search(queryset, search_term).values('id')
+        return queryset.filter(Q(resource_id=search_term.strip()) | Q(id__in=matches)), False
+
+
+class EdflexBlockAdmin(admin.ModelAdmin):
+    list_display = ('usage_key', 'resource_id', 'catalog_id', 'modified')
+    search_fields = ('course_key', 'usage_key', 'resource_id')
+
+
+class SyncStateAdmin(admin.ModelAdmin):
+    list_display = ('base_api_url', 'client_id', 'locale', 'started', 'catalog_id', 'resources_synced', 'finished')
+
 
 admin.site.register(Category)
+admin.site.register(EdflexBlock, EdflexBlockAdmin)
 admin.site.register(Resource, ResourceAdmin)
+admin.site.register(SyncState, SyncStateAdmin)
@@ -1,96 +1,568 @@
+import codecs
+import hashlib
+import json
 import logging
+import random
+import re
+import threading
+import time
+from email.utils import mktime_tz, parsedate_tz
+from multiprocessing.pool import ThreadPool
 from urlparse import urljoin
 
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import six
 from oauthlib.oauth2 import BackendApplicationClient, TokenExpiredError
-from requests import HTTPError
+from oauthlib.oauth2.rfc6749.errors import OAuth2Error
+from requests import ConnectionError, HTTPError, RequestException, Timeout
+from requests.adapters import HTTPAdapter
 from requests_oauthlib import OAuth2Session
 
+from . import metrics
+
 
 log = logging.getLogger('edflex_xblock')
 
+# Process-wide token cache shared by all clients, backed by the Django cache
+# so that the other workers can reuse the token as well.
+_token_cache = {}
+_token_cache_lock = threading.Lock()
+# locks of the token refreshes of the process, by token cache key
+_token_refresh_locks = {}
+
+# returned by conditional requests when the data didn't change
+NOT_MODIFIED = object()
+
+# timeout in seconds of the requests to the Edflex API
+EDFLEX_API_TIMEOUT = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_API_TIMEOUT', 30)
+# max number of retries of a request failing with a connection error, 429 or 5xx
+EDFLEX_API_MAX_RETRIES = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_API_MAX_RETRIES', 3)
+# timeout in seconds and max number of retries of the requests made by the Studio and LMS handlers,
+# which keep a web worker busy while they wait
+EDFLEX_API_HANDLER_TIMEOUT = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_API_HANDLER_TIMEOUT', 5)
+EDFLEX_API_HANDLER_MAX_RETRIES = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get(
+    'EDFLEX_API_HANDLER_MAX_RETRIES', 0
+)
+# base delay in seconds of the exponential backoff between retries
+EDFLEX_API_BACKOFF_FACTOR = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_API_BACKOFF_FACTOR', 0.5)
+# max number of pooled connections to the Edflex API per process
+EDFLEX_API_POOL_SIZE = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_API_POOL_SIZE', 10)
+# upper bound in seconds of the delay before a retry
+MAX_RETRY_DELAY = 60
+# max number of token refreshes of a request, a failing token endpoint doesn't loop forever
+TOKEN_MAX_REFRESHES = 2
+
+# size in bytes of the chunks read from the streamed responses
+STREAM_CHUNK_SIZE = 64 * 1024
+JSON_WHITESPACE = u' \t\n\r'
+# the rest of a buffer made of characters a JSON number may go on with after a chunk boundary
+JSON_NUMBER_TAIL_RE = re.compile(r'[0-9+\-.eE]*\Z')
+
+# Connection pools shared by all clients of the same API.
+_http_adapters = {}
+_http_adapters_lock = threading.Lock()
+
+
+class EdflexHTTPAdapter(HTTPAdapter):
+    """
+    Pooled adapter applying a default timeout to the requests.
+    """
+
+    def __init__(self, timeout, **kwargs):
+        self.timeout = timeout
+        super(EdflexHTTPAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super(EdflexHTTPAdapter, self).send(request, **kwargs)
+
+
+def get_http_adapter(base_api_url):
+    with _http_adapters_lock:
+        adapter = _http_adapters.get(base_api_url)
+
+        if adapter is None:
+            adapter = _http_adapters[base_api_url] = EdflexHTTPAdapter(
+                timeout=EDFLEX_API_TIMEOUT,
+                pool_connections=1,
+                pool_maxsize=EDFLEX_API_POOL_SIZE
+            )
+
+    return adapter
+
+
+class JSONStream(object):
+    """
+    Incremental reader of the JSON values of a text split into `chunks`.
+
+    Only the unread part of the current chunk and the value being decoded
+    are kept in memory.
+    """
+    decoder = json.JSONDecoder()
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = u''
+        self.position = 0
+
+    def read_chunk(self):
+        chunk = next(self.chunks, None)
+
+        if chunk is None:
+            return False
+
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """
+        Return the next non-whitespace character, an empty string at the end of the stream.
+        """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in JSON_WHITESPACE:
+                self.position += 1
+
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.read_chunk():
+                return u''
+
+    def expect(self, chars):
+        """
+        Consume the next character, which must be one of `chars`.
+        """
+        char = self.peek()
+
+        if not char or char not in chars:
+            raise ValueError(u"Expected one of {!r} in the JSON stream, got {!r}".format(chars, char))
+
+        self.position += 1
+        return char
+
+    def decode(self):
+        """
+        Decode the next JSON value, reading more chunks while it's incomplete.
+        """
+        self.peek()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                if self.read_chunk():
+                    continue
+                raise
+
+            # a number cut by a chunk boundary, after its '.' or 'e' too, is
+            # decoded as its prefix: it may go on until a delimiter is read
+            is_number = isinstance(value, six.integer_types + (float,)) and not isinstance(value, bool)
+            if is_number and JSON_NUMBER_TAIL_RE.match(self.buffer, end) and self.read_chunk():
+                continue
+
+            self.position = end
+            return value
+
+
+def iter_json_array(chunks, key):
+    """
+    Yield the elements of the `key` array of a JSON object read from text `chunks`.
+
+    The other values of the object are skipped, nothing is yielded when
+    `key` is missing.
+    """
+    stream = JSONStream(chunks)
+    stream.expect(u'{')
+
+    if stream.peek() == u'}':
+        return
+
+    while True:
+        name = stream.decode()
+        stream.expect(u':')
+
+        if name == key and stream.peek() == u'[':
+            stream.expect(u'[')
+            if stream.peek() == u']':
+                return
+            while True:
+                yield stream.decode()
+                if stream.expect(u',]') == u']':
+                    return
+
+        stream.decode()
+        if stream.expect(u',}') == u'}':
+            return
+
+
+def iter_response_array(resp, key):
+    """
+    Yield the elements of the `key` array of a streamed JSON response.
+    """
+    decoder = codecs.getincrementaldecoder(resp.encoding or 'utf-8')()
+
+    try:
+        for item in iter_json_array(
+            (decoder.decode(chunk) for chunk in resp.iter_content(STREAM_CHUNK_SIZE)), key
+        ):
+            yield item
+    finally:
+        resp.close()
+
 
 class EdflexOauthClient(object):
     """
     Client to consume Edflex service API.
+
+    The requests time out after `timeout` seconds and are retried
+    `max_retries` times, EDFLEX_API_TIMEOUT and EDFLEX_API_MAX_RETRIES by
+    default.
     """
     TOKEN_URL = '/api/oauth/v2/token'
     CATALOGS_URL = '/api/selection/catalogs'
     CATALOG_URL = '/api/selection/catalogs/{id}'
     RESOURCE_URL = '/api/resource/resources/{id}'
+    TOKEN_CACHE_KEY = u'edflex.oauth_token.{base_api_url}.{client_id}.{locale}'
+    # refresh the token a little before it actually expires
+    TOKEN_EXPIRY_MARGIN = 60
+    TOKEN_REFRESH_LOCK_KEY = u'edflex.oauth_token_refresh.{}'
+    # how long the other workers wait for the one refreshing the token, in seconds
+    TOKEN_REFRESH_TIMEOUT = 30
+    TOKEN_REFRESH_POLL_INTERVAL = 0.1
+    VALIDATORS_CACHE_KEY = u'edflex.validators.{}'
+    VALIDATORS_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
 
-    def __init__(self, config):
+    def __init__(self, config, timeout=None, max_retries=None):
         self.client_id = config['client_id']
         self.client_secret = config['client_secret']
         self.locale = config['locale']
         self.base_api_url = config['base_api_url']
+        self.timeout = EDFLEX_API_TIMEOUT if timeout is None else timeout
+        self.max_retries = EDFLEX_API_MAX_RETRIES if max_retries is None else max_retries
         client = BackendApplicationClient(client_id=self.client_id)
         self.oauth_client = OAuth2Session(client=client)
-        self.fetch_token()
+        self.oauth_client.mount(self.base_api_url, get_http_adapter(self.base_api_url))
+        self.pending_validators = {}
+        token = self.get_cached_token()
+
+        if token:
+            self.oauth_client.token = token
+        else:
+            self.refresh_token(None)
+
+    @property
+    def token_cache_key(self):
+        return self.TOKEN_CACHE_KEY.format(
+            base_api_url=self.base_api_url,
+            client_id=self.client_id,
+            locale=self.locale
+        )
+
+    def is_token_valid(self, token):
+        return bool(token) and token['expires_at'] - self.TOKEN_EXPIRY_MARGIN > time.time()
+
+    def get_cached_token(self):
+        """
+        Return the cached token if it is still valid, otherwise None.
+        """
+        key = self.token_cache_key
+
+        with _token_cache_lock:
+            token = _token_cache.get(key)
+
+        if not self.is_token_valid(token):
+            # another process may have refreshed it
+            token = cache.get(key)
+
+        if self.is_token_valid(token):
+            with _token_cache_lock:
+                _token_cache[key] = token
+            return token
+
+        return None
+
+    def cache_token(self, token):
+        expires_in = int(token.get('expires_in') or 0)
+
+        if not expires_in:
+            return
+
+        token = dict(token, expires_at=time.time() + expires_in)
+        timeout = expires_in - self.TOKEN_EXPIRY_MARGIN
+
+        if timeout > 0:
+            key = self.token_cache_key
+            with _token_cache_lock:
+                _token_cache[key] = token
+            cache.set(key, token, timeout)
 
     def fetch_token(self):
         token_url = urljoin(self.base_api_url, self.TOKEN_URL)
-        self.oauth_client.fetch_token(
+        metrics.increment('api_token_fetches')
+        token = self.oauth_client.fetch_token(
             token_url=token_url,
             client_id=self.client_id,
             client_secret=self.client_secret,
+            timeout=self.timeout,
         )
+        self.cache_token(token)
+        return token
+
+    def token_expires_soon(self):
+        expires_at = (self.oauth_client.token or {}).get('expires_at')
+        return expires_at is not None and expires_at - self.TOKEN_EXPIRY_MARGIN <= time.time()
+
+    def refresh_token(self, expired_token):
+        """
+        Replace the `expired_token` of the client by a new token.
+
+        A single worker fetches the new token, the others reuse it: the
+        threads of the process wait on a lock, the other processes wait for
+        the token to be cached while a lock is held in the Django cache.
+        """
+        expired_access_token = (expired_token or {}).get('access_token')
+
+        with _token_cache_lock:
+            refresh_lock = _token_refresh_locks.setdefault(self.token_cache_key, threading.Lock())
+
+        with refresh_lock:
+            if (self.oauth_client.token or {}).get('access_token') != expired_access_token:
+                return
+
+            token = self.get_cached_token()
+            if token is not None and token['access_token'] != expired_access_token:
+                self.oauth_client.token = token
+                return
+
+            lock_key = self.TOKEN_REFRESH_LOCK_KEY.format(self.token_cache_key)
+            if cache.add(lock_key, True, self.TOKEN_REFRESH_TIMEOUT):
+                try:
+                    self.fetch_token()
+                finally:
+                    cache.delete(lock_key)
+                return
+
+            deadline = time.time() + min(self.TOKEN_REFRESH_TIMEOUT, self.timeout)
+            while time.time() < deadline:
+                time.sleep(self.TOKEN_REFRESH_POLL_INTERVAL)
+                token = self.get_cached_token()
+                if token is not None and token['access_token'] != expired_access_token:
+                    self.oauth_client.token = token
+                    return
+
+            log.warning(u"No token refreshed by another worker, fetching new token...")
+            self.fetch_token()
+
+    def refresh_request_token(self, token, endpoint):
+        """
+        Refresh the `token` of a request, return False when the token endpoint failed.
+        """
+        try:
+            self.refresh_token(token)
+        except (RequestException, OAuth2Error) as err:
+            log.error(u"Edflex token refresh failed: {}".format(err))
+            metrics.increment('api_errors', endpoint=endpoint, reason='token')
+            return False
+
+        return True
+
+    def validators_cache_key(self, url, scope=None):
+        """
+        Return the cache key of the validators of `url` for this tenant.
+
+        The validators match the data stored by a tenant, a resource listed in
+        several catalogs is stored once per catalog: its `scope`.
+        """
+        url_hash = hashlib.md5(u'{}?locale={}&client_id={}&scope={}'.format(
+            url, self.locale, self.client_id, scope or u''
+        ).encode('utf-8')).hexdigest()
+        return self.VALIDATORS_CACHE_KEY.format(url_hash)
+
+    def stash_validators(self, url, headers, scope=None):
+        validators = {}
+
+        if headers.get('ETag'):
+            validators['If-None-Match'] = headers['ETag']
+        if headers.get('Last-Modified'):
+            validators['If-Modified-Since'] = headers['Last-Modified']
+
+        if validators:
+            self.pending_validators[self.validators_cache_key(url, scope)] = validators
+
+    def discard_catalog_validators(self, catalog_id):
+        """
+        Forget the validators of a catalog received so far, its next conditional request downloads it again.
+        """
+        catalog_url = urljoin(self.base_api_url, self.CATALOG_URL.format(id=catalog_id))
+        self.pending_validators.pop(self.validators_cache_key(catalog_url), None)
+
+    def commit_validators(self):
+        """
+        Store the validators of the conditional responses received so far.
+
+        Call it once the data of these responses is saved, so that a failed
+        sync doesn't skip them the next time.
+        """
+        if self.pending_validators:
+            cache.set_many(self.pending_validators, self.VALIDATORS_CACHE_TIMEOUT)
+            self.pending_validators = {}
+
+    def get_retry_delay(self, attempt, resp=None):
+        """
+        Return the delay before a retry: the Retry-After of the response if
+        any, otherwise an exponential backoff with full jitter.
+        """
+        retry_after = resp.headers.get('Retry-After') if resp is not None else None
+
+        if retry_after:
+            if retry_after.isdigit():
+                return min(int(retry_after), MAX_RETRY_DELAY)
+            retry_date = parsedate_tz(retry_after)
+            if retry_date:
+                return min(max(mktime_tz(retry_date) - time.time(), 0), MAX_RETRY_DELAY)
+
+        return random.uniform(0, min(EDFLEX_API_BACKOFF_FACTOR * 2 ** attempt, MAX_RETRY_DELAY))
+
+    def get(self, url, default, conditional=False, stream=False, endpoint='other', scope=None):
+        """
+        GET the JSON data of `url`, `default` is returned on HTTP errors.
+
+        Connection errors, 429 and 5xx responses are retried with a backoff.
+        Conditional requests send the stored ETag/Last-Modified validators
+        of `url` in `scope` and return NOT_MODIFIED when the data didn't change.
+        Streamed requests return the response with its body left unread.
+        The metrics of the request are reported under the `endpoint` name.
+        """
+        headers = {'content-type': 'application/json'}
+
+        if conditional:
+            headers.update(cache.get(self.validators_cache_key(url, scope)) or {})
+
+        attempt = 0
+        refreshes = 0
+
+        while True:
+            can_retry = attempt < self.max_retries
+            token = self.oauth_client.token
+            if refreshes < TOKEN_MAX_REFRESHES and self.token_expires_soon():
+                refreshes += 1
+                if not self.refresh_request_token(token, endpoint):
+                    return default
+                token = self.oauth_client.token
+            try:
+                with metrics.timer('api_request_seconds', endpoint=endpoint):
+                    resp = self.oauth_client.get(
+                        url=url,
+                        headers=headers,
+                        params={'locale': self.locale},
+                        stream=stream,
+                        timeout=self.timeout
+                    )
+                metrics.increment('api_requests', endpoint=endpoint, status=resp.status_code)
+                if resp.status_code == 401 and refreshes < TOKEN_MAX_REFRESHES:
+                    log.info(u"Token rejected, fetching new token...")
+                    resp.close()
+                    refreshes += 1
+                    if not self.refresh_request_token(token, endpoint):
+                        return default
+                    continue
+                if can_retry and resp.status_code in self.RETRY_STATUSES:
+                    log.warning(u"Edflex API responded {} to {}, retrying...".format(resp.status_code, url))
+                    metrics.increment('api_retries', endpoint=endpoint)
+                    resp.close()
+                    time.sleep(self.get_retry_delay(attempt, resp))
+                    attempt += 1
+                    continue
+                resp.raise_for_status()
+            except (ConnectionError, Timeout) as err:
+                if can_retry:
+                    log.warning(u"Edflex API request to {} failed: {}, retrying...".format(url, err))
+                    metrics.increment('api_retries', endpoint=endpoint)
+                    time.sleep(self.get_retry_delay(attempt))
+                    attempt += 1
+                    continue
+                log.error(err)
+                metrics.increment('api_errors', endpoint=endpoint, reason='connection')
+                return default
+            except HTTPError as err:
+                log.error(err)
+                metrics.increment('api_errors', endpoint=endpoint, reason='status')
+                resp.close()
+                return default
+            except TokenExpiredError:
+                if refreshes >= TOKEN_MAX_REFRESHES:
+                    log.error(u"Edflex token of {} still expired after {} refreshes".format(url, refreshes))
+                    metrics.increment('api_errors', endpoint=endpoint, reason='token')
+                    return default
+                log.info(u"Token expired, fetching new token...")
+                refreshes += 1
+                if not self.refresh_request_token(token, endpoint):
+                    return default
+                continue
+            break
+
+        if conditional:
+            if resp.status_code == 304:
+                resp.close()
+                return NOT_MODIFIED
+            self.stash_validators(url, resp.headers, scope)
+
+        if stream:
+            return resp
+
+        return resp.json()
 
     def get_catalogs(self):
         catalogs_url = urljoin(self.base_api_url, self.CATALOGS_URL)
-        try:
-            resp = self.oauth_client.get(
-                url=catalogs_url,
-                headers={'content-type': 'application/json'},
-                params={'locale': self.locale}
-            )
-            resp.raise_for_status()
-        except HTTPError as err:
-            log.error(err)
-            catalogs = []
-        except TokenExpiredError:
-            log.info(u"Token expired, fetching new token...")
-            self.fetch_token()
-            catalogs = self.get_catalogs()
-        else:
-            catalogs = resp.json()
-        return catalogs
+        return self.get(catalogs_url, [], endpoint='catalogs')
 
-    def get_catalog(self, catalog_id):
+    def get_catalog(self, catalog_id, conditional=False):
         catalog_url = urljoin(self.base_api_url, self.CATALOG_URL.format(id=catalog_id))
-        try:
-            resp = self.oauth_client.get(
-                url=catalog_url,
-                headers={'content-type': 'application/json'},
-                params={'locale': self.locale}
-            )
-            resp.raise_for_status()
-        except HTTPError as err:
-            log.error(err)
-            catalog = {'items': []}
-        except TokenExpiredError:
-            log.info(u"Token expired, fetching new token...")
-            self.fetch_token()
-            catalog = self.get_catalog(catalog_id)
-        else:
-            catalog = resp.json()
-        return catalog
+        return self.get(catalog_url, None, conditional, endpoint='catalog')
+
+    def get_catalog_items(self, catalog_id, conditional=False):
+        """
+        Return an iterator over the items of a catalog, parsed while they are downloaded.
+
+        As with `get_catalog`, None is returned on HTTP errors and NOT_MODIFIED
+        when the catalog didn't change. Errors happening while the items are
+        streamed are raised by the iterator.
+        """
+        catalog_url = urljoin(self.base_api_url, self.CATALOG_URL.format(id=catalog_id))
+        resp = self.get(catalog_url, None, conditional, stream=True, endpoint='catalog_items')
+
+        if resp is None or resp is NOT_MODIFIED:
+            return resp
 
-    def get_resource(self, resource_id):
+        return iter_response_array(resp, 'items')
+
+    def get_resource(self, resource_id, conditional=False, catalog_id=None):
         resource_url = urljoin(self.base_api_url, self.RESOURCE_URL.format(id=resource_id))
+        return self.get(resource_url, None, conditional, endpoint='resource', scope=catalog_id)
+
+    def get_resources(self, resource_ids, conditional_ids=(), concurrency=1, rate_limiter=None, catalog_id=None):
+        """
+        Fetch a batch of resources over `concurrency` pooled connections.
+
+        (resource_id, resource) pairs are yielded in the order of
+        `resource_ids`, the resources are None on errors. The resources in
+        `conditional_ids` are only downloaded if they changed, NOT_MODIFIED
+        is yielded otherwise, their validators are those of the resources
+        stored in `catalog_id`. The requests wait for the `rate_limiter`.
+        """
+        def fetch(resource_id):
+            if rate_limiter is not None:
+                rate_limiter.wait()
+            conditional = six.text_type(resource_id) in conditional_ids
+            return resource_id, self.get_resource(resource_id, conditional=conditional, catalog_id=catalog_id)
+
+        pool = ThreadPool(max(concurrency, 1))
         try:
-            resp = self.oauth_client.get(
-                url=resource_url,
-                headers={'content-type': 'application/json'},
-                params={'locale': self.locale}
-            )
-            resp.raise_for_status()
-        except HTTPError as err:
-            log.error(err)
-            resource = None
-        except TokenExpiredError:
-            log.info(u"Token expired, fetching new token...")
-            self.fetch_token()
-            resource = self.get_resource(resource_id)
-        else:
-            resource = resp.json()
-        return resource
+            for r_resource in pool.imap(fetch, resource_ids):
+                yield r_resource
+        finally:
+            pool.terminate()
+            pool.join()
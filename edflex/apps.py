@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class EdflexConfig(AppConfig):
+    name = 'edflex'
+
+    def ready(self):
+        from . import signals  # pylint: disable=unused-variable
@@ -0,0 +1,427 @@
+"""
+Benchmarks of the Edflex synchronization and of the Studio and LMS hot paths.
+
+A local stand-in of the Edflex API serves synthetic catalogs of a given
+size with a configurable latency and error rate, so that the paths are
+measured offline and reproducibly. The benchmarks are run by the
+`benchmark_edflex` management command, in a test database.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import resource
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from collections import namedtuple
+
+import mock
+from django.db import connection
+from django.db.backends.utils import CursorWrapper
+from opaque_keys.edx.keys import UsageKey
+from webob import Request
+from xblock.field_data import DictFieldData
+from xblock.fields import ScopeIds
+from xblock.test.tools import TestRuntime
+
+from . import edflex, metrics
+from .edflex import EdflexXBlock
+from .models import Category, Resource
+from .tasks import fetch_new_resources_and_delete_old_resources, fetch_resources
+
+RESOURCE_TYPES = ('article', 'video', 'mooc', 'podcast', 'book', 'interactive')
+LANGUAGES = ('en', 'fr', 'de', 'es', 'pt')
+WORDS = (
+    u'agile', u'budget', u'coaching', u'data', u'design', u'digital', u'feedback', u'finance', u'innovation',
+    u'leadership', u'learning', u'management', u'marketing', u'negotiation', u'product', u'project', u'python',
+    u'sales', u'security', u'strategy', u'team', u'thinking', u'writing', u'communication', u'cloud',
+)
+CATEGORY_COUNT = 40
+# interval in seconds between two samples of the memory of the process
+MEMORY_SAMPLE_INTERVAL = 0.01
+
+BenchmarkResult = namedtuple(
+    'BenchmarkResult', ['size', 'path', 'seconds', 'items', 'queries', 'api_requests', 'memory_growth']
+)
+
+
+class FakeEdflexData(object):
+    """
+    Synthetic Edflex catalogs of `resource_count` resources spread over `catalog_count` catalogs.
+
+    The resources are generated from their index, the same `seed` always
+    gives the same data.
+    """
+
+    def __init__(self, resource_count, catalog_count=1, seed=0):
+        self.resource_count = resource_count
+        self.catalog_count = catalog_count
+        self.seed = seed
+        self.version = 0
+
+    def catalog_id(self, index):
+        return u'benchmark-catalog-{}'.format(index % self.catalog_count)
+
+    def catalogs(self):
+        return [
+            {'id': self.catalog_id(index), 'title': u'Benchmark catalog {}'.format(index)}
+            for index in range(self.catalog_count)
+        ]
+
+    def catalog(self, catalog_id):
+        if catalog_id not in {catalog['id'] for catalog in self.catalogs()}:
+            return None
+
+        return {
+            'id': catalog_id,
+            'title': catalog_id,
+            'items': [
+                {'resource': {'id': u'benchmark-resource-{}'.format(index)}}
+                for index in range(self.resource_count)
+                if self.catalog_id(index) == catalog_id
+            ]
+        }
+
+    def resource(self, resource_id):
+        match = re.match(r'^benchmark-resource-(\d+)$', resource_id)
+        if match is None or int(match.group(1)) >= self.resource_count:
+            return None
+
+        index = int(match.group(1))
+        rand = random.Random(u'{}-{}'.format(self.seed, index))
+        categories = rand.sample(range(CATEGORY_COUNT), rand.randint(1, 3))
+
+        return {
+            'id': resource_id,
+            'title': u' '.join(rand.choice(WORDS) for _ in range(rand.randint(2, 8))).capitalize(),
+            'type': RESOURCE_TYPES[index % len(RESOURCE_TYPES)],
+            'language': LANGUAGES[index % len(LANGUAGES)],
+            'description': u' '.join(rand.choice(WORDS) for _ in range(60)),
+            'url': u'https://example.com/resources/{}'.format(index),
+            'embed_url': u'https://example.com/embed/{}'.format(index),
+            'image': {'medium': u'https://example.com/images/{}.jpg'.format(index)},
+            'duration': u'PT{}M'.format(rand.randint(1, 120)),
+            'price': {'amount': 0},
+            'is_certifying': False,
+            'note': {'global': rand.randint(0, 10) / 2.0, 'total_reviews': rand.randint(0, 500)},
+            'categories': [
+                {'id': u'benchmark-category-{}'.format(category), 'name': u'{} {}'.format(
+                    WORDS[category % len(WORDS)].capitalize(), category
+                )}
+                for category in categories
+            ],
+        }
+
+    def add_resources(self, count):
+        self.resource_count += count
+        self.version += 1
+
+
+class FakeEdflexRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def send_json(self, data):
+        body = json.dumps(data)
+        etag = u'"{}"'.format(hashlib.md5(body).hexdigest())
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_response(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.send_json({'access_token': 'benchmark', 'token_type': 'Bearer', 'expires_in': 3600})
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+
+        if server.should_fail():
+            self.send_error_response(503)
+            return
+
+        path = self.path.split('?', 1)[0]
+        data = server.data
+
+        if path == '/api/selection/catalogs':
+            response = data.catalogs()
+        elif path.startswith('/api/selection/catalogs/'):
+            response = server.catalog(path.rsplit('/', 1)[1])
+        elif path.startswith('/api/resource/resources/'):
+            response = data.resource(path.rsplit('/', 1)[1])
+        else:
+            response = None
+
+        if response is None:
+            self.send_error_response(404)
+        else:
+            self.send_json(response)
+
+
+class FakeEdflexServer(ThreadingMixIn, HTTPServer):
+    """
+    Local stand-in of the Edflex API serving `data`.
+
+    Every GET is delayed by `latency` seconds and fails with a 503 at the
+    `error_rate` probability. Use it as a context manager to run it in a
+    background thread.
+    """
+    daemon_threads = True
+
+    def __init__(self, data, latency=0, error_rate=0, seed=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FakeEdflexRequestHandler)
+        self.data = data
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.catalogs_cache = {}
+        self.thread = None
+
+    @property
+    def url(self):
+        return u'http://{}:{}'.format(*self.server_address)
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def catalog(self, catalog_id):
+        # the big catalogs are built once per version of the data
+        key = (catalog_id, self.data.version)
+        with self.lock:
+            if key not in self.catalogs_cache:
+                self.catalogs_cache[key] = self.data.catalog(catalog_id)
+            return self.catalogs_cache[key]
+
+    def __enter__(self):
+        # the fake API is served over plain HTTP
+        os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+
+class BenchmarkRuntime(TestRuntime):
+
+    def local_resource_url(self, block, uri):
+        return u'/static/{}'.format(uri)
+
+
+def current_memory():
+    """
+    Return the resident memory of the process in MB.
+
+    Without /proc, the peak memory of the process is returned instead: it
+    never decreases.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0)
+    except (IOError, OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class MemorySampler(object):
+    """
+    Sample the memory of the process in a background thread while the block runs.
+
+    `growth` is the peak of the samples above the memory at the start of
+    the block, in MB.
+    """
+
+    def __init__(self, interval=MEMORY_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start = self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @property
+    def growth(self):
+        return max(self.peak - self.start, 0)
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, current_memory())
+
+    def __enter__(self):
+        self.start = self.peak = current_memory()
+        self.thread = threading.Thread(target=self.sample)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, current_memory())
+
+
+class CountingCursorWrapper(CursorWrapper):
+    """
+    Cursor counting its queries into a QueryCounter.
+    """
+
+    def __init__(self, cursor, db, counter):
+        super(CountingCursorWrapper, self).__init__(cursor, db)
+        self.counter = counter
+
+    def execute(self, sql, params=None):
+        self.counter.count += 1
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.counter.count += 1
+        return self.cursor.executemany(sql, param_list)
+
+
+class QueryCounter(object):
+    """
+    Count the queries run on the `db` connection while the block runs.
+
+    Every cursor of the connection is wrapped: unlike the query log of
+    Django, capped and cleared by the per catalog counters of the syncs,
+    the count covers all the queries of the block.
+    """
+
+    def __init__(self, db=connection):
+        self.db = db
+        self.count = 0
+        self.patchers = []
+
+    def wrap(self, make_cursor):
+        return lambda cursor: CountingCursorWrapper(make_cursor(cursor), self.db, self)
+
+    def __enter__(self):
+        self.patchers = [
+            mock.patch.object(self.db, name, self.wrap(getattr(self.db, name)))
+            for name in ('make_cursor', 'make_debug_cursor')
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for patcher in self.patchers:
+            patcher.stop()
+
+
+def measure(size, path, run):
+    """
+    Run the `run` function and return its BenchmarkResult, `run` returns its number of processed items.
+
+    The memory growth is the peak of the memory of the process during the
+    run above the memory before it, measured apart for every path. The
+    queries are every query of the run, those of the sync state and of the
+    cleanups of the syncs included.
+    """
+    backend = metrics.InMemoryBackend()
+    metrics.set_backend(backend)
+
+    try:
+        with MemorySampler() as memory, QueryCounter() as queries:
+            start = time.time()
+            items = run()
+            seconds = time.time() - start
+    finally:
+        metrics.set_backend(None)
+
+    return BenchmarkResult(
+        size=size,
+        path=path,
+        seconds=seconds,
+        items=items,
+        queries=queries.count,
+        api_requests=sum(value for (name, _), value in backend.counters.items() if name == 'api_requests'),
+        memory_growth=memory.growth,
+    )
+
+
+def make_block(resource_data):
+    runtime = BenchmarkRuntime()
+    block = runtime.construct_xblock_from_class(
+        EdflexXBlock,
+        ScopeIds('user', 'edflex', 'definition', 'usage'),
+        field_data=DictFieldData({'resource': resource_data, 'format': resource_data['type']})
+    )
+    block.location = UsageKey.from_string('block-v1:Benchmark+Edflex+Run+type@edflex+block@benchmark')
+    return block
+
+
+def run_benchmarks(size, catalog_count=4, latency=0, error_rate=0, iterations=20, seed=0):
+    """
+    Benchmark the sync and view paths on catalogs of `size` resources, yield a BenchmarkResult per path.
+    """
+    data = FakeEdflexData(size, catalog_count, seed)
+
+    with FakeEdflexServer(data, latency, error_rate, seed) as server:
+        config = {'client_id': 'benchmark', 'client_secret': 'benchmark', 'locale': 'en', 'base_api_url': server.url}
+        credentials = (config['client_id'], config['client_secret'], config['locale'], config['base_api_url'])
+
+        yield measure(size, 'fetch_resources (cold)', lambda: fetch_resources(*credentials))
+        yield measure(size, 'fetch_resources (unchanged)', lambda: fetch_resources(*credentials))
+
+        data.add_resources(max(size // 100, 1))
+        yield measure(size, 'fetch_new_resources (1% new)', lambda: fetch_new_resources_and_delete_old_resources(
+            *credentials
+        ))
+
+        block = make_block(data.resource(u'benchmark-resource-0'))
+        list_request = json.dumps({'format': block.format})
+
+        def get_list_resources():
+            item_count = 0
+            for _ in range(iterations):
+                request = Request.blank('/', method='POST', body=list_request)
+                item_count += len(json.loads(block.get_list_resources(request).body)['resources'])
+            return item_count
+
+        def search_resources():
+            item_count = 0
+            for i in range(iterations):
+                # a search term every other run, the first page of the list otherwise
+                term = WORDS[i % len(WORDS)] if i % 2 else u''
+                request = Request.blank('/', method='POST', body=json.dumps({'format': block.format, 'term': term}))
+                item_count += len(json.loads(block.search_resources(request).body)['resources'])
+            return item_count
+
+        with mock.patch.object(edflex, 'get_edflex_configuration_for_org', return_value=config):
+            yield measure(size, 'get_list_resources', get_list_resources)
+            yield measure(size, 'search_resources', search_resources)
+
+        def student_view():
+            for _ in range(iterations):
+                block.student_view({})
+            return iterations
+
+        yield measure(size, 'student_view', student_view)
+
+    Resource.objects.filter(catalog_id__in=[catalog['id'] for catalog in data.catalogs()]).delete()
+    Category.objects.filter(catalog_id__in=[catalog['id'] for catalog in data.catalogs()]).delete()
@@ -1,6 +1,10 @@
+import json
 import logging
-import pkg_resources
+from datetime import timedelta
 
+from django.db.models import Q
+from django.template import Context, Template
+from django.utils import timezone
 from web_fragments.fragment import Fragment
 
 from xblock.core import XBlock
@@ -8,9 +12,16 @@ from xblock.fields import String, Scope, Dict, Float
 from xblockutils.resources import ResourceLoader
 from xblockutils.studio_editable import StudioEditableXBlockMixin
 
-from .api import EdflexOauthClient
-from .models import Category, Resource
-from .utils import get_edflex_configuration_for_org
+from .api import EDFLEX_API_HANDLER_MAX_RETRIES, EDFLEX_API_HANDLER_TIMEOUT, EdflexOauthClient
+from .models import Category, Resource, ResourceCategory
+from .search import search
+from .utils import (
+    EDFLEX_INLINE_SVG_SPRITE,
+    EDFLEX_RESOURCE_DATA_MAX_AGE,
+    EDFLEX_RESOURCES_PAGE_SIZE,
+    get_catalog_ids,
+    get_edflex_configuration_for_org
+)
 
 # Make '_' a no-op so we can scrape strings
 _ = lambda text: text
@@ -18,6 +29,36 @@ _ = lambda text: text
 log = logging.getLogger('edflex_xblock')
 loader = ResourceLoader(__name__)
 
+SVG_SPRITE_PATH = 'public/images/sprite.svg'
+
+# Packaged assets and compiled templates, loaded lazily once per process.
+_resources = {}
+_templates = {}
+
+
+def load_resource(path):
+    """
+    Return the decoded content of a packaged resource.
+    """
+    resource = _resources.get(path)
+
+    if resource is None:
+        resource = _resources[path] = loader.load_unicode(path)
+
+    return resource
+
+
+def render_template(template_path, context):
+    """
+    Render a Django template of the package, compiling it only once.
+    """
+    template = _templates.get(template_path)
+
+    if template is None:
+        template = _templates[template_path] = Template(load_resource(template_path))
+
+    return template.render(Context(context))
+
 
 class EdflexXBlock(StudioEditableXBlockMixin, XBlock):
 
@@ -46,8 +87,17 @@ class EdflexXBlock(StudioEditableXBlockMixin, XBlock):
 
     def resource_string(self, path):
         """Handy helper for getting resources from our kit."""
-        data = pkg_resources.resource_string(__name__, path)
-        return data.decode("utf8")
+        return load_resource(path)
+
+    def get_svg_sprite_context(self):
+        """
+        Reference the SVG sprite as a cacheable static asset, or inline it
+        into the fragment if EDFLEX_INLINE_SVG_SPRITE is set.
+        """
+        if EDFLEX_INLINE_SVG_SPRITE:
+            return {'svg_sprite': self.resource_string(SVG_SPRITE_PATH), 'svg_sprite_url': ''}
+
+        return {'svg_sprite_url': self.runtime.local_resource_url(self, SVG_SPRITE_PATH)}
 
     def student_view(self, context=None):
         """
@@ -57,19 +107,16 @@ class EdflexXBlock(StudioEditableXBlockMixin, XBlock):
         if context is None:
             context = {}
 
-        context.update({
-            'svg_sprite': self.resource_string('public/images/sprite.svg'),
-        })
-
+        context.update(self.get_svg_sprite_context())
         self.update_student_context(context)
         fragment = Fragment()
-        fragment.content = loader.render_django_template('static/html/edflex.html', context)
+        fragment.content = render_template('static/html/edflex.html', context)
         fragment.add_css(self.resource_string("static/css/edflex.css"))
 
         if self.resource.get('type', '') == 'video':
             fragment.add_javascript_url('https://www.youtube.com/iframe_api')
 
-        fragment.add_javascript(loader.load_unicode('static/js/src/parse_duration.js'))
+        fragment.add_javascript(load_resource('static/js/src/parse_duration.js'))
         fragment.add_javascript(self.resource_string("static/js/src/edflex.js"))
         fragment.initialize_js('EdflexXBlock')
         return fragment
@@ -93,11 +140,14 @@ class EdflexXBlock(StudioEditableXBlockMixin, XBlock):
         return context
 
     def author_view(self, context=None):
+        if context is None:
+            context = {}
+
+        context.update(self.get_svg_sprite_context())
         context.update({
-            'svg_sprite': self.resource_string('public/images/sprite.svg'),
             'resource': self.resource,
         })
-        html = loader.render_django_template("static/html/author_view.html", context)
+        html = render_template("static/html/author_view.html", context)
         fragment = Fragment(html)
         fragment.add_css(self.resource_string("static/css/edflex.css"))
         return fragment
@@ -113,35 +163,35 @@ class EdflexXBlock(StudioEditableXBlockMixin, XBlock):
             'language': self.language,
             'resource': self.resource,
         }
-        context.update({
-            'svg_sprite': self.resource_string('public/images/sprite.svg'),
-        })
+        svg_sprite_context = self.get_svg_sprite_context()
+        context.update(svg_sprite_context)
         self.update_studio_context(context)
         fragment = Fragment()
-        fragment.content = loader.render_django_template('static/html/studio_edit.html', context)
+        fragment.content = render_template('static/html/studio_edit.html', context)
         fragment.add_css(self.resource_string("static/css/edflex.css"))
         fragment.add_css(self.resource_string("static/css/select2.css"))
-        fragment.add_javascript(loader.load_unicode('static/js/src/parse_duration.js'))
-        fragment.add_javascript(loader.load_unicode('static/js/src/studio_edit.js'))
+        fragment.add_javascript(load_resource('static/js/src/parse_duration.js'))
+        fragment.add_javascript(load_resource('static/js/src/studio_edit.js'))
         fragment.initialize_js(
             'StudioEditableEdflexXBlock',
             json_args={
                 'url_select2': self.runtime.local_resource_url(self, 'public/js/select2.min'),
+                'svg_sprite_url': svg_sprite_context['svg_sprite_url'],
                 'init_values': init_values
             }
         )
         return fragment
 
     def update_studio_context(self, context):
-        edflex_client = EdflexOauthClient(get_edflex_configuration_for_org(self.location.org))
-        r_catalogs = edflex_client.get_catalogs()
-        catalog_ids = [r_catalog['id'] for r_catalog in r_catalogs]
+        catalog_ids = get_catalog_ids(get_edflex_configuration_for_org(self.location.org))
         categories = Category.objects.filter(
-            resources__catalog_id__in=catalog_ids
+            id__in=ResourceCategory.objects.filter(
+                resource__catalog_id__in=catalog_ids
+            ).values('category_id')
         ).order_by(
             'catalog_title',
             'name'
-        ).distinct().values()
+        ).values()
         languages = Resource.objects.filter(
             catalog_id__in=catalog_ids,
             language__isnull=False
@@ -158,18 +208,11 @@ class EdflexXBlock(StudioEditableXBlockMixin, XBlock):
         })
         return context
 
-    @XBlock.json_handler
-    def get_list_resources(self, data, suffix=''):
-        r_type = data.get('format')
-        category_id = data.get('category_id')
-        language = data.get('language')
-
-        if not r_type:
-            return {'resources': []}
-
-        edflex_client = EdflexOauthClient(get_edflex_configuration_for_org(self.location.org))
-        r_catalogs = edflex_client.get_catalogs()
-        catalog_ids = [r_catalog['id'] for r_catalog in r_catalogs]
+    def filter_resources(self, r_type, category_id=None, language=None):
+        """
+        Return the resources of the block's catalogs matching the Studio filters.
+        """
+        catalog_ids = get_catalog_ids(get_edflex_configuration_for_org(self.location.org))
         resources = Resource.objects.filter(
             r_type=r_type,
         )
@@ -184,7 +227,9 @@ class EdflexXBlock(StudioEditableXBlockMixin, XBlock):
                 )
             else:
                 resources = resources.filter(
-                    categories__id=category.id,
+                    id__in=ResourceCategory.objects.filter(
+                        category_id=category.id
+                    ).values('resource_id'),
                     catalog_id=category.catalog_id
                 )
         else:
@@ -197,15 +242,99 @@ class EdflexXBlock(StudioEditableXBlockMixin, XBlock):
                 language=language
             )
 
+        return resources
+
+    @XBlock.json_handler
+    def get_list_resources(self, data, suffix=''):
+        r_type = data.get('format')
+
+        if not r_type:
+            return {'resources': []}
+
+        resources = self.filter_resources(r_type, data.get('category_id'), data.get('language'))
+
+        return {
+            'resources': list(resources.order_by('title').values('resource_id', 'title'))
+        }
+
+    @XBlock.json_handler
+    def search_resources(self, data, suffix=''):
+        """
+        Return a page of the resources matching the Studio filters and the search `term`.
+
+        Pages are ordered by title and id, after the search rank when there is
+        a `term`. The `next_cursor` of a page is sent back as `cursor` to get
+        the next one.
+        """
+        r_type = data.get('format')
+
+        if not r_type:
+            return {'resources': [], 'next_cursor': None}
+
+        resources = self.filter_resources(r_type, data.get('category_id'), data.get('language'))
+
+        if data.get('resource_id'):
+            resources = resources.filter(resource_id=data['resource_id'])
+
+        term = (data.get('term') or '').strip()
+        if term:
+            resources = search(resources, term, data.get('language'))
+            fields = ('rank', 'title', 'id')
+            order = ('-rank', 'title', 'id')
+        else:
+            fields = order = ('title', 'id')
+
+        cursor = data.get('cursor')
+        if isinstance(cursor, dict) and all(field in cursor for field in fields):
+            after_cursor = Q(title__gt=cursor['title']) | Q(title=cursor['title'], id__gt=cursor['id'])
+            if term:
+                after_cursor = Q(rank__lt=cursor['rank']) | Q(after_cursor, rank=cursor['rank'])
+            resources = resources.filter(after_cursor)
+
+        try:
+            limit = int(data.get('limit') or EDFLEX_RESOURCES_PAGE_SIZE)
+        except (TypeError, ValueError):
+            limit = EDFLEX_RESOURCES_PAGE_SIZE
+        limit = min(max(limit, 1), EDFLEX_RESOURCES_PAGE_SIZE)
+
+        page = list(resources.order_by(*order).values('resource_id', *fields)[:limit + 1])
+        next_cursor = None
+
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = {field: page[-1][field] for field in fields}
+
         return {
-            'resources': list(resources.distinct().order_by('title').values('resource_id', 'title'))
+            'resources': [{'resource_id': r['resource_id'], 'title': r['title']} for r in page],
+            'next_cursor': next_cursor,
         }
 
     @XBlock.json_handler
     def get_resource(self, data, suffix=''):
+        """
+        Return the resource stored by the sync, Edflex is only called when it's missing or stale.
+        """
         resource_id = data.get('resource')
-        edflex_client = EdflexOauthClient(get_edflex_configuration_for_org(self.location.org))
+        config = get_edflex_configuration_for_org(self.location.org)
+        resources = Resource.objects.filter(
+            resource_id=resource_id,
+            catalog_id__in=get_catalog_ids(config)
+        )
+        stored_data = resources.filter(
+            data_fetched__gte=timezone.now() - timedelta(seconds=EDFLEX_RESOURCE_DATA_MAX_AGE)
+        ).values_list('data', flat=True).first()
+
+        if stored_data:
+            return json.loads(stored_data)
+
+        edflex_client = EdflexOauthClient(
+            config, timeout=EDFLEX_API_HANDLER_TIMEOUT, max_retries=EDFLEX_API_HANDLER_MAX_RETRIES
+        )
         resource = edflex_client.get_resource(resource_id)
+
+        if resource:
+            resources.update(data=json.dumps(resource, sort_keys=True), data_fetched=timezone.now())
+
         return resource
 
     @XBlock.json_handler
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, teardown_databases
+
+from edflex.benchmark import run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the Edflex synchronization, the Studio resource list and search and the student view against a "
+        "local stand-in of the Edflex API. The benchmarks run in a test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help="Comma separated numbers of resources of the synthetic catalogs.")
+        parser.add_argument('--catalogs', type=int, default=4, help="Number of catalogs the resources are spread over.")
+        parser.add_argument('--latency', type=float, default=0, help="Latency in seconds of the fake API responses.")
+        parser.add_argument('--error-rate', type=float, default=0,
+                            help="Probability of a 503 response of the fake API, between 0 and 1.")
+        parser.add_argument('--iterations', type=int, default=20, help="Number of runs of the view paths.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic data and of the errors.")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the test database between the runs.")
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+
+        try:
+            self.stdout.write(u'{:>8} {:<30} {:>9} {:>8} {:>10} {:>8} {:>9} {:>8}'.format(
+                'size', 'path', 'seconds', 'items', 'items/s', 'queries', 'API calls', 'mem +MB'
+            ))
+            for size in [int(size) for size in options['sizes'].split(',')]:
+                for result in run_benchmarks(
+                    size,
+                    catalog_count=options['catalogs'],
+                    latency=options['latency'],
+                    error_rate=options['error_rate'],
+                    iterations=options['iterations'],
+                    seed=options['seed'],
+                ):
+                    self.stdout.write(u'{:>8} {:<30} {:>9.2f} {:>8} {:>10.1f} {:>8} {:>9} {:>8.1f}'.format(
+                        result.size,
+                        result.path,
+                        result.seconds,
+                        result.items,
+                        result.items / result.seconds if result.seconds else 0,
+                        result.queries,
+                        result.api_requests,
+                        result.memory_growth,
+                    ))
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
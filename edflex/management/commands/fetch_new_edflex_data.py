@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 
-from edflex.tasks import fetch_new_edflex_data
+from edflex.tasks import fetch_new_tenant_resources, get_tenant_configurations, log_sync_results
 
 import logging
 import time
@@ -26,6 +26,8 @@ class Command(BaseCommand):
         logger.info("Starting fetching the new edflex data...")
         start_time = datetime.now()
 
-        fetch_new_edflex_data()
+        # the tenants are synced one after the other in this process, without the celery workers
+        results = [fetch_new_tenant_resources(config) for config in get_tenant_configurations()]
+        log_sync_results(results, 'fetch_new_edflex_data')
 
         logger.info("Finished fetching the new edflex data after {}".format(datetime.now() - start_time))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+
+from edflex.tasks import index_course_blocks
+
+import logging
+import time
+from datetime import datetime
+
+
+logger = logging.getLogger("edflex_xblock")
+log_handler = logging.handlers.TimedRotatingFileHandler('/edx/var/log/lms/edflex_xblock_update.log',
+                                                        when='D',
+                                                        interval=10,
+                                                        backupCount=4,
+                                                        encoding='utf-8')
+log_formatter = logging.Formatter(u'%(asctime)s [%(name)s] [%(filename)s:%(lineno)d] %(levelname)s  - %(message)s')
+log_formatter.converter = time.gmtime
+log_handler.setFormatter(log_formatter)
+log_handler.setLevel(logging.INFO)
+logger.addHandler(log_handler)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the index of the Edflex blocks of all the courses."
+
+    def handle(self, *args, **options):
+        logger.info("Starting indexing the edflex blocks...")
+        start_time = datetime.now()
+
+        for course_key in CourseOverview.objects.values_list('id', flat=True):
+            index_course_blocks(course_key)
+
+        logger.info("Finished indexing the edflex blocks after {}".format(datetime.now() - start_time))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from edflex.models import Resource
+from edflex.search import index_resources
+
+import logging
+import time
+from datetime import datetime
+
+
+logger = logging.getLogger("edflex_xblock")
+log_handler = logging.handlers.TimedRotatingFileHandler('/edx/var/log/lms/edflex_xblock_update.log',
+                                                        when='D',
+                                                        interval=10,
+                                                        backupCount=4,
+                                                        encoding='utf-8')
+log_formatter = logging.Formatter(u'%(asctime)s [%(name)s] [%(filename)s:%(lineno)d] %(levelname)s  - %(message)s')
+log_formatter.converter = time.gmtime
+log_handler.setFormatter(log_formatter)
+log_handler.setLevel(logging.INFO)
+logger.addHandler(log_handler)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search index of all the Edflex resources."
+
+    def handle(self, *args, **options):
+        logger.info("Starting indexing the edflex resources...")
+        start_time = datetime.now()
+
+        index_resources(Resource.objects.values_list('id', flat=True))
+
+        logger.info("Finished indexing the edflex resources after {}".format(datetime.now() - start_time))
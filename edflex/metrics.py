@@ -0,0 +1,298 @@
+"""
+Metrics of the Edflex API client and of the synchronization tasks.
+
+Counters, gauges and timings are sent to the backend chosen by the
+`EDFLEX_METRICS` setting: statsd, a Prometheus text file or memory. They
+are dropped when no backend is configured.
+"""
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+log = logging.getLogger('edflex_xblock')
+
+EDFLEX_METRICS = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_METRICS', {})
+# upper bounds in seconds of the buckets of the Prometheus histograms
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+NAME_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def _tags_key(tags):
+    return tuple(sorted(tags.items()))
+
+
+class NullBackend(object):
+    """
+    Backend dropping the metrics.
+    """
+    enabled = False
+
+    def __init__(self, **options):
+        self.prefix = options.get('PREFIX', 'edflex')
+
+    def increment(self, name, value, tags):
+        pass
+
+    def gauge(self, name, value, tags):
+        pass
+
+    def timing(self, name, seconds, tags):
+        pass
+
+    def flush(self):
+        pass
+
+
+class InMemoryBackend(NullBackend):
+    """
+    Backend keeping the metrics in memory, used by the tests.
+    """
+    enabled = True
+
+    def __init__(self, **options):
+        super(InMemoryBackend, self).__init__(**options)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        self.timings = defaultdict(list)
+
+    def increment(self, name, value, tags):
+        with self.lock:
+            self.counters[(name, _tags_key(tags))] += value
+
+    def gauge(self, name, value, tags):
+        with self.lock:
+            self.gauges[(name, _tags_key(tags))] = value
+
+    def timing(self, name, seconds, tags):
+        with self.lock:
+            self.timings[(name, _tags_key(tags))].append(seconds)
+
+    def counter_value(self, name, **tags):
+        return self.counters.get((name, _tags_key(tags)), 0)
+
+
+class StatsdBackend(NullBackend):
+    """
+    Backend sending the metrics over UDP to a statsd server.
+
+    Statsd has no tags, their values are appended to the metric name.
+    """
+    enabled = True
+
+    def __init__(self, **options):
+        super(StatsdBackend, self).__init__(**options)
+        self.address = (options.get('HOST', 'localhost'), int(options.get('PORT', 8125)))
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def metric_name(self, name, tags):
+        parts = [self.prefix, name] + [NAME_RE.sub('_', u'{}'.format(value)) for _, value in _tags_key(tags)]
+        return u'.'.join(part for part in parts if part)
+
+    def send(self, name, value, metric_type, tags):
+        try:
+            self.socket.sendto(
+                u'{}:{}|{}'.format(self.metric_name(name, tags), value, metric_type).encode('utf-8'),
+                self.address
+            )
+        except socket.error as err:
+            log.debug(u"Edflex metric {} not sent: {}".format(name, err))
+
+    def increment(self, name, value, tags):
+        self.send(name, value, 'c', tags)
+
+    def gauge(self, name, value, tags):
+        self.send(name, value, 'g', tags)
+
+    def timing(self, name, seconds, tags):
+        self.send(name, int(round(seconds * 1000)), 'ms', tags)
+
+
+class PrometheusBackend(InMemoryBackend):
+    """
+    Backend writing the metrics of the process to a file in the Prometheus text format.
+
+    The file is meant for the textfile collector of the node exporter, it's
+    rewritten on every flush. `PATH` may contain `{pid}` to give a file to
+    each worker process.
+    """
+
+    def __init__(self, **options):
+        super(PrometheusBackend, self).__init__(**options)
+        self.path = options.get('PATH', 'edflex.prom')
+
+    def reset(self):
+        super(PrometheusBackend, self).reset()
+        self.histograms = {}
+
+    def timing(self, name, seconds, tags):
+        with self.lock:
+            key = (name, _tags_key(tags))
+            if key not in self.histograms:
+                self.histograms[key] = [[0] * len(HISTOGRAM_BUCKETS), 0, 0.0]
+            buckets, _, _ = histogram = self.histograms[key]
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            histogram[1] += 1
+            histogram[2] += seconds
+
+    def metric_name(self, name):
+        return NAME_RE.sub('_', u'{}_{}'.format(self.prefix, name) if self.prefix else name)
+
+    @staticmethod
+    def labels(tags, **extra):
+        tags = _tags_key(dict(tags, **extra))
+        if not tags:
+            return u''
+        return u'{{{}}}'.format(u','.join(
+            u'{}="{}"'.format(key, u'{}'.format(value).replace('\\', '\\\\').replace('"', '\\"'))
+            for key, value in tags
+        ))
+
+    def render(self):
+        lines = []
+
+        with self.lock:
+            for metric_type, metrics in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({name for name, _ in metrics}):
+                    metric_name = self.metric_name(name)
+                    lines.append(u'# TYPE {} {}'.format(metric_name, metric_type))
+                    for (key_name, tags), value in sorted(metrics.items()):
+                        if key_name == name:
+                            lines.append(u'{}{} {}'.format(metric_name, self.labels(tags), value))
+
+            for name in sorted({name for name, _ in self.histograms}):
+                metric_name = self.metric_name(name)
+                lines.append(u'# TYPE {} histogram'.format(metric_name))
+                for (key_name, tags), (buckets, count, total) in sorted(self.histograms.items()):
+                    if key_name != name:
+                        continue
+                    for bound, bucket_count in zip(HISTOGRAM_BUCKETS, buckets):
+                        lines.append(u'{}_bucket{} {}'.format(metric_name, self.labels(tags, le=bound), bucket_count))
+                    lines.append(u'{}_bucket{} {}'.format(metric_name, self.labels(tags, le='+Inf'), count))
+                    lines.append(u'{}_sum{} {}'.format(metric_name, self.labels(tags), total))
+                    lines.append(u'{}_count{} {}'.format(metric_name, self.labels(tags), count))
+
+        return u'\n'.join(lines) + u'\n'
+
+    def flush(self):
+        path = self.path.format(pid=os.getpid())
+        tmp_path = u'{}.tmp'.format(path)
+
+        try:
+            with open(tmp_path, 'wb') as metrics_file:
+                metrics_file.write(self.render().encode('utf-8'))
+            # the collector never reads a partly written file
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as err:
+            log.error(u"Edflex metrics not written to {}: {}".format(path, err))
+
+
+BACKENDS = {
+    'memory': InMemoryBackend,
+    'prometheus': PrometheusBackend,
+    'statsd': StatsdBackend,
+}
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+
+    if _backend is None:
+        options = dict(EDFLEX_METRICS)
+        _backend = BACKENDS.get(options.pop('BACKEND', None), NullBackend)(**options)
+
+    return _backend
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def increment(name, value=1, **tags):
+    get_backend().increment(name, value, tags)
+
+
+def gauge(name, value, **tags):
+    get_backend().gauge(name, value, tags)
+
+
+def timing(name, seconds, **tags):
+    get_backend().timing(name, seconds, tags)
+
+
+def flush():
+    get_backend().flush()
+
+
+@contextmanager
+def timer(name, **tags):
+    """
+    Report the duration of the block as a `name` timing.
+    """
+    start = time.time()
+
+    try:
+        yield
+    finally:
+        timing(name, time.time() - start, **tags)
+
+
+def timed_iter(iterable, name, **tags):
+    """
+    Yield the items of `iterable`, the time spent producing them is reported once as a `name` timing.
+    """
+    iterator = iter(iterable)
+    elapsed = 0.0
+
+    try:
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.time() - start
+            yield item
+    finally:
+        timing(name, elapsed, **tags)
+
+
+@contextmanager
+def count_queries(name, **tags):
+    """
+    Report the number of database queries run in the block as a `name` counter.
+
+    Django 1.11 only records the queries with its debug cursor, which is
+    forced in the block when a backend is enabled.
+    """
+    if not get_backend().enabled:
+        yield
+        return
+
+    force_debug_cursor = connection.force_debug_cursor
+    connection.force_debug_cursor = True
+    connection.queries_log.clear()
+
+    try:
+        yield
+    finally:
+        connection.force_debug_cursor = force_debug_cursor
+        increment(name, len(connection.queries_log), **tags)
+        connection.queries_log.clear()
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edflex', '0003_auto_20210222_0201'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EdflexBlock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course_key', models.CharField(db_index=True, max_length=255)),
+                ('usage_key', models.CharField(max_length=255, unique=True)),
+                ('resource_id', models.CharField(blank=True, db_index=True, max_length=255, null=True)),
+                ('catalog_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('modified', models.DateTimeField(auto_now=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Edflex block',
+                'verbose_name_plural': 'Edflex blocks',
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edflex', '0004_edflexblock'),
+    ]
+
+    operations = [
+        # Resource.categories keeps its existing table, only the state learns about the explicit through model
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ResourceCategory',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='edflex.Category')),
+                        ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='edflex.Resource')),
+                    ],
+                    options={
+                        'db_table': 'edflex_resource_categories',
+                    },
+                ),
+                migrations.AlterUniqueTogether(
+                    name='resourcecategory',
+                    unique_together=set([('resource', 'category')]),
+                ),
+                migrations.AlterField(
+                    model_name='resource',
+                    name='categories',
+                    field=models.ManyToManyField(
+                        related_name='resources', through='edflex.ResourceCategory', to='edflex.Category'
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['catalog_id', 'r_type', 'language'], name='edflex_res_cat_type_lang_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['catalog_id', 'language'], name='edflex_res_cat_lang_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resourcecategory',
+            index=models.Index(fields=['category', 'resource'], name='edflex_res_cat_category_idx'),
+        ),
+    ]
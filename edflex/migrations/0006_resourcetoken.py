@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edflex', '0005_resource_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('resource', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name='tokens', to='edflex.Resource'
+                )),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='resourcetoken',
+            unique_together=set([('resource', 'token')]),
+        ),
+        migrations.AddIndex(
+            model_name='resourcetoken',
+            index=models.Index(fields=['token', 'resource'], name='edflex_res_token_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edflex', '0006_resourcetoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resource',
+            name='data',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='data_fetched',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edflex', '0007_resource_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['catalog_id', 'last_seen'], name='edflex_res_cat_seen_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edflex', '0008_last_seen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_api_url', models.CharField(max_length=255)),
+                ('client_id', models.CharField(max_length=255)),
+                ('locale', models.CharField(max_length=255)),
+                ('started', models.DateTimeField()),
+                ('completed_catalogs', models.TextField(default='[]')),
+                ('catalog_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('resources_synced', models.PositiveIntegerField(default=0)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('modified', models.DateTimeField(auto_now=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Sync state',
+                'verbose_name_plural': 'Sync states',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='syncstate',
+            unique_together=set([('base_api_url', 'client_id', 'locale')]),
+        ),
+    ]
@@ -7,6 +7,8 @@ class Category(models.Model):
     name = models.CharField(max_length=255)
     catalog_id = models.CharField(max_length=255, null=True, blank=True)
     catalog_title = models.CharField(max_length=255, null=True, blank=True)
+    # last time a sync found the category, the ones not seen by a full sync are deleted
+    last_seen = models.DateTimeField(null=True, blank=True, db_index=True)
     created = models.DateTimeField(auto_now_add=True, db_index=True, null=True)
     modified = models.DateTimeField(auto_now=True, db_index=True, null=True)
 
@@ -23,16 +25,98 @@ class Resource(models.Model):
     resource_id = models.CharField(max_length=255)
     title = models.TextField()
     r_type = models.CharField(max_length=255, null=True, blank=True)
-    categories = models.ManyToManyField(Category, related_name='resources')
+    categories = models.ManyToManyField(Category, related_name='resources', through='ResourceCategory')
     language = models.CharField(max_length=255, null=True, blank=True)
+    # JSON payload of the resource from Edflex and the last time the sync confirmed it
+    data = models.TextField(null=True, blank=True)
+    data_fetched = models.DateTimeField(null=True, blank=True)
+    # last time a sync found the resource in its catalog, the ones not seen are deleted
+    last_seen = models.DateTimeField(null=True, blank=True)
     created = models.DateTimeField(auto_now_add=True, db_index=True, null=True)
     modified = models.DateTimeField(auto_now=True, db_index=True, null=True)
 
     class Meta:
         unique_together = ['catalog_id', 'resource_id']
+        indexes = [
+            models.Index(fields=['catalog_id', 'r_type', 'language'], name='edflex_res_cat_type_lang_idx'),
+            models.Index(fields=['catalog_id', 'language'], name='edflex_res_cat_lang_idx'),
+            models.Index(fields=['catalog_id', 'last_seen'], name='edflex_res_cat_seen_idx'),
+        ]
 
     def __unicode__(self):
         return u"catalog_id - {}, {}".format(self.catalog_id, self.title)
 
 
+class ResourceCategory(models.Model):
+    """
+    Through table of Resource.categories, indexed by category for the Studio filters.
+    """
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
 
+    class Meta:
+        db_table = 'edflex_resource_categories'
+        unique_together = ['resource', 'category']
+        indexes = [
+            models.Index(fields=['category', 'resource'], name='edflex_res_cat_category_idx'),
+        ]
+
+
+class EdflexBlock(models.Model):
+    """
+    Index of the published Edflex blocks, kept up to date on course publish.
+    """
+    course_key = models.CharField(max_length=255, db_index=True)
+    usage_key = models.CharField(max_length=255, unique=True)
+    resource_id = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    catalog_id = models.CharField(max_length=255, null=True, blank=True)
+    modified = models.DateTimeField(auto_now=True, null=True)
+
+    class Meta:
+        verbose_name = _("Edflex block")
+        verbose_name_plural = _("Edflex blocks")
+
+    def __unicode__(self):
+        return u"{} - {}".format(self.usage_key, self.resource_id)
+
+
+class ResourceToken(models.Model):
+    """
+    Search index of the words of the resource titles and category names.
+    """
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='tokens')
+    token = models.CharField(max_length=64)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        unique_together = ['resource', 'token']
+        indexes = [
+            models.Index(fields=['token', 'resource'], name='edflex_res_token_idx'),
+        ]
+
+
+class SyncState(models.Model):
+    """
+    Checkpoint of the full sync of a tenant, an interrupted sync resumes from it.
+    """
+    base_api_url = models.CharField(max_length=255)
+    client_id = models.CharField(max_length=255)
+    locale = models.CharField(max_length=255)
+    # start of the pass, the rows seen since then are synced
+    started = models.DateTimeField()
+    # JSON list of the ids of the catalogs synced by the pass
+    completed_catalogs = models.TextField(default='[]')
+    # JSON list of the ids of the catalogs of the tenant at the end of the last complete pass
+    catalog_ids = models.TextField(default='[]')
+    catalog_id = models.CharField(max_length=255, null=True, blank=True)
+    resources_synced = models.PositiveIntegerField(default=0)
+    finished = models.DateTimeField(null=True, blank=True)
+    modified = models.DateTimeField(auto_now=True, null=True)
+
+    class Meta:
+        verbose_name = _("Sync state")
+        verbose_name_plural = _("Sync states")
+        unique_together = ['base_api_url', 'client_id', 'locale']
+
+    def __unicode__(self):
+        return u"{} - {} - {}".format(self.base_api_url, self.client_id, self.locale)
@@ -0,0 +1,135 @@
+"""
+Search index of the Edflex resources.
+
+The titles and category names of the resources are split into normalized
+tokens stored in ResourceToken, and a query matches the resources having
+a token starting with each of its words.
+"""
+import operator
+import re
+import unicodedata
+from functools import reduce
+
+from django.db.models import IntegerField, OuterRef, Q, Subquery, Sum, Value
+
+from .models import Resource, ResourceCategory, ResourceToken
+from .utils import BULK_BATCH_SIZE, chunks
+
+TOKEN_MAX_LENGTH = 64
+TITLE_WEIGHT = 3
+CATEGORY_WEIGHT = 1
+
+# scripts written without spaces between the words, indexed by character bigrams
+CJK_RE = re.compile(u'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+')
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# stop words of the resource languages, without accents
+STOP_WORDS = {
+    'de': frozenset(u'am auf das der die ein eine fur im in ist mit und von zu'.split()),
+    'en': frozenset(u'an and are as at be by for from how in is it of on or the to with you your'.split()),
+    'es': frozenset(u'con de del el en es la las los para por que un una'.split()),
+    'fr': frozenset(u'au aux avec ce ces dans de des du en est et la le les ou par pour sur un une vos votre'.split()),
+    'pt': frozenset(u'com da das de do dos em na no os para por que um uma'.split()),
+}
+ALL_STOP_WORDS = frozenset().union(*STOP_WORDS.values())
+
+
+def _word_tokens(text, stop_words):
+    text = u''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+    return [
+        word[:TOKEN_MAX_LENGTH]
+        for word in WORD_RE.findall(text.lower())
+        if len(word) > 1 and word not in stop_words
+    ]
+
+
+def tokenize(text, language=None):
+    """
+    Return the normalized tokens of a `text` written in `language`.
+
+    Case and accents are folded and the stop words of the language (of all
+    the known languages when it's unknown) are dropped. The runs of CJK
+    characters are split into bigrams.
+    """
+    if not text:
+        return []
+
+    stop_words = STOP_WORDS.get((language or '')[:2].lower(), ALL_STOP_WORDS)
+    tokens = []
+    position = 0
+
+    for match in CJK_RE.finditer(text):
+        tokens.extend(_word_tokens(text[position:match.start()], stop_words))
+        run = match.group()
+        tokens.extend([run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)])
+        position = match.end()
+
+    tokens.extend(_word_tokens(text[position:], stop_words))
+    return tokens
+
+
+def index_resources(resource_pks):
+    """
+    Update the search tokens of the resources with the `resource_pks` primary keys.
+    """
+    for pks in chunks(resource_pks):
+        weights = {}
+        languages = {}
+
+        for pk, title, language in Resource.objects.filter(id__in=pks).values_list('id', 'title', 'language'):
+            languages[pk] = language
+            for token in tokenize(title, language):
+                weights[(pk, token)] = weights.get((pk, token), 0) + TITLE_WEIGHT
+
+        for pk, name in ResourceCategory.objects.filter(
+            resource_id__in=pks
+        ).values_list('resource_id', 'category__name'):
+            for token in tokenize(name, languages.get(pk)):
+                weights[(pk, token)] = weights.get((pk, token), 0) + CATEGORY_WEIGHT
+
+        existing_tokens = {}
+        for token_pk, pk, token, weight in ResourceToken.objects.filter(
+            resource_id__in=pks
+        ).values_list('id', 'resource_id', 'token', 'weight'):
+            existing_tokens[(pk, token)] = (token_pk, weight)
+
+        for token_pks in chunks(
+            token_pk for key, (token_pk, weight) in existing_tokens.items() if weights.get(key) != weight
+        ):
+            ResourceToken.objects.filter(id__in=token_pks).delete()
+
+        ResourceToken.objects.bulk_create(
+            [
+                ResourceToken(resource_id=pk, token=token, weight=weight)
+                for (pk, token), weight in weights.items()
+                if existing_tokens.get((pk, token), (None, None))[1] != weight
+            ],
+            batch_size=BULK_BATCH_SIZE
+        )
+
+
+def search(resources, query, language=None):
+    """
+    Filter the `resources` queryset on the words of `query` and annotate their `rank`.
+
+    Every word must start a token of a resource, the rank sums the weights of
+    the matched tokens. Queries made only of stop words fall back to a title
+    lookup.
+    """
+    terms = set(tokenize(query, language))
+
+    if not terms:
+        return resources.filter(title__icontains=query.strip()).annotate(rank=Value(0, output_field=IntegerField()))
+
+    # prefixes as ranges, so the lookups use the token index on every database
+    term_filters = [Q(token__gte=term, token__lt=term + u'\uffff') for term in terms]
+
+    for term_filter in term_filters:
+        resources = resources.filter(id__in=ResourceToken.objects.filter(term_filter).values('resource_id'))
+
+    rank = ResourceToken.objects.filter(
+        reduce(operator.or_, term_filters),
+        resource=OuterRef('pk')
+    ).order_by().values('resource').annotate(rank=Sum('weight')).values('rank')
+
+    return resources.annotate(rank=Subquery(rank, output_field=IntegerField()))
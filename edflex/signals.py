@@ -0,0 +1,14 @@
+from django.dispatch import receiver
+from xmodule.modulestore.django import SignalHandler
+
+from .tasks import index_course_blocks, delete_course_index
+
+
+@receiver(SignalHandler.course_published)
+def update_edflex_blocks_index(sender, course_key, **kwargs):
+    index_course_blocks(course_key)
+
+
+@receiver(SignalHandler.course_deleted)
+def delete_edflex_blocks_index(sender, course_key, **kwargs):
+    delete_course_index(course_key)
@@ -8,6 +8,7 @@ function StudioEditableEdflexXBlock(runtime, element, jsonArgs) {
       },
   });
   var initValues = jsonArgs.init_values;
+  var svgSpriteUrl = jsonArgs.svg_sprite_url;
   var isInit = !!initValues.resource.id;
   var resourceData = {};
   var $format = $('[name = "format"]', element);
@@ -18,68 +19,47 @@ function StudioEditableEdflexXBlock(runtime, element, jsonArgs) {
   var $saveButton = $('.save-button', element);
   var $featuresBlock = $('.features-block', element);
 
-  var renderResources = function(resources) {
-    if (resources.length) {
-      var optionHtml = '<option value="">-------</option>';
-      resources.forEach(function(resource){
-        optionHtml += `<option value="${resource.resource_id}">${resource.title}</option>`;
-      });
-      $resource.prop('disabled', false);
-      $resource.html(optionHtml);
-    } else {
-      $resource.empty();
-      $resource.prop('disabled', true);
-      $featuresBlock.html(
-        `<div class="ef-title">
-          <span class="title-help">
-            ${gettext("There is no content available for this category or language at the moment")}
-          </span>
-        </div>`
-      );
-    }
-  };
-
-  var initResourse = function() {
-    if (isInit) {
-      $resource.val(initValues.resource.id);
-      renderResource(initValues.resource);
-      if (!$resource.val()) {
-        $('.js-old-resource', element).prop('hidden', false);
-      }
-      isInit = false;
-    }
-  };
-
-  var getListResources = function(formatValue, categoryValue, languageValue) {
-    var data = {
-      format: formatValue,
-      category_id: categoryValue,
-      language: languageValue
+  var getFilters = function() {
+    return {
+      format: $format.filter(":checked").val(),
+      category_id: $category.val(),
+      language: $language.val()
     };
+  };
 
-    $.ajax({
+  var searchResources = function(data, success) {
+    return $.ajax({
       type: "POST",
-      url: runtime.handlerUrl(element, 'get_list_resources'),
-      data: JSON.stringify(data),
+      url: runtime.handlerUrl(element, 'search_resources'),
+      data: JSON.stringify($.extend(getFilters(), data)),
       dataType: "json",
-      success: function(response) {
-        renderResources(response.resources);
-        initResourse();
-      }
-    })
+      success: success
+    });
+  };
+
+  var renderNoResources = function() {
+    $featuresBlock.html(
+      `<div class="ef-title">
+        <span class="title-help">
+          ${gettext("There is no content available for this category or language at the moment")}
+        </span>
+      </div>`
+    );
   };
 
   var checkResources = function() {
     $saveButton.addClass('is-disabled');
     $featuresBlock.empty();
-    var formatValue = $format.filter(":checked").val();
-    var categoryValue = $category.val();
-    var languageValue = $language.val();
-
-    if (formatValue) {
-      getListResources(formatValue, categoryValue, languageValue);
-    } else {
-      $resource.prop('disabled', true)
+    $resource.empty().prop('disabled', true).trigger('change');
+
+    if (getFilters().format) {
+      searchResources({limit: 1}, function(response) {
+        if (response.resources.length) {
+          $resource.prop('disabled', false);
+        } else {
+          renderNoResources();
+        }
+      });
     }
   };
 
@@ -126,7 +106,14 @@ function StudioEditableEdflexXBlock(runtime, element, jsonArgs) {
       `[data-category_id = "${initValues.category}"][data-catalog_id = "${initValues.catalog}"]`
     ).prop("selected", true);
     $language.val(initValues.language);
-    getListResources(initValues.format, $category.val(), initValues.language)
+    $resource.append(new Option(initValues.resource.title, initValues.resource.id, true, true));
+    renderResource(initValues.resource);
+    searchResources({resource_id: initValues.resource.id, limit: 1}, function(response) {
+      $resource.prop('disabled', false);
+      if (!response.resources.length) {
+        $('.js-old-resource', element).prop('hidden', false);
+      }
+    });
   }
 
   $format.on('change', checkResources);
@@ -184,7 +171,7 @@ function StudioEditableEdflexXBlock(runtime, element, jsonArgs) {
     });
   });
 
-  $('.modal-header').append('<a class="cancel-button"><svg><use xlink:href="#icon-close"></use></svg></a>');
+  $('.modal-header').append('<a class="cancel-button"><svg><use xlink:href="' + svgSpriteUrl + '#icon-close"></use></svg></a>');
 
   $('.cancel-button').on('click', function(e) {
     e.preventDefault();
@@ -213,7 +200,7 @@ function StudioEditableEdflexXBlock(runtime, element, jsonArgs) {
     function langFlag(langName) {
       return $(
         '<span class="select2-flex">' +
-        '<svg class="img-flag"><use xlink:href="#lang-' + langName.text + '"></use></svg>'
+        '<svg class="img-flag"><use xlink:href="' + svgSpriteUrl + '#lang-' + langName.text + '"></use></svg>'
         + getTitleLang(langName.text) + '</span>'
       );
     }
@@ -225,8 +212,30 @@ function StudioEditableEdflexXBlock(runtime, element, jsonArgs) {
       templateSelection: langFlag
     });
 
+    // the resources are loaded page by page, `nextCursor` points after the last loaded one
+    var nextCursor = null;
+
     $resource.select2({
       placeholder: gettext("Select the content of your choice"),
+      ajax: {
+        delay: 250,
+        transport: function(params, success, failure) {
+          var page = params.data.page || 1;
+          return searchResources({
+            term: params.data.term || '',
+            cursor: page > 1 ? nextCursor : null
+          }, success).fail(failure);
+        },
+        processResults: function(response) {
+          nextCursor = response.next_cursor;
+          return {
+            results: response.resources.map(function(resource) {
+              return {id: resource.resource_id, text: resource.title};
+            }),
+            pagination: {more: !!nextCursor}
+          };
+        }
+      }
     });
   });
 }
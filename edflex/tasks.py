@@ -1,25 +1,45 @@
+import json
 import logging
-import emoji
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+
+from celery import chord, task
 from celery.decorators import periodic_task
 from celery.schedules import crontab
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
 from django.db.models import Q
-from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+from django.utils import six, timezone
+from opaque_keys.edx.keys import CourseKey, UsageKey
 from openedx.core.djangoapps.site_configuration.models import SiteConfiguration
+from requests import RequestException
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore import ModuleStoreEnum
-from courseware.courses import get_course
+from xmodule.modulestore.exceptions import ItemNotFoundError
 
-from .api import EdflexOauthClient
-from .models import Category, Resource
+from . import metrics
+from .api import NOT_MODIFIED, EdflexOauthClient
+from .models import Category, EdflexBlock, Resource, SyncState
+from .search import index_resources
 from .utils import (
+    BULK_BATCH_SIZE,
     EDFLEX_CLIENT_ID,
     EDFLEX_CLIENT_SECRET,
     EDFLEX_LOCALE,
     EDFLEX_BASE_API_URL,
-    get_edflex_configuration_for_org
+    EDFLEX_FETCH_CONCURRENCY,
+    EDFLEX_FETCH_RATE_LIMIT,
+    EDFLEX_SYNC_LEASE_TIMEOUT,
+    EDFLEX_SYNC_RESUME_MAX_AGE,
+    RateLimiter,
+    cache_catalog_ids,
+    chunks,
+    clean_text,
+    get_edflex_configuration_for_org,
+    sync_lock
 )
 
 log = logging.getLogger('edflex_xblock')
@@ -59,39 +79,131 @@ fetch_new_edflex_data_cron = {
 }
 
 
-@periodic_task(run_every=crontab(**fetch_edflex_data_cron))
-def fetch_edflex_data():
-    if EDFLEX_CLIENT_ID and EDFLEX_CLIENT_SECRET and EDFLEX_BASE_API_URL:
-        fetch_resources(EDFLEX_CLIENT_ID, EDFLEX_CLIENT_SECRET, EDFLEX_LOCALE, EDFLEX_BASE_API_URL)
+def get_tenant_configurations():
+    """
+    Return the distinct Edflex configurations of the default settings and of the enabled sites.
+    """
+    credentials = [(EDFLEX_CLIENT_ID, EDFLEX_CLIENT_SECRET, EDFLEX_LOCALE, EDFLEX_BASE_API_URL)]
 
     for site_configuration in SiteConfiguration.objects.filter(enabled=True):
-        client_id = site_configuration.get_value('EDFLEX_CLIENT_ID')
-        client_secret = site_configuration.get_value('EDFLEX_CLIENT_SECRET')
-        locale = site_configuration.get_value('EDFLEX_LOCALE', EDFLEX_LOCALE)
-        base_api_url = site_configuration.get_value('EDFLEX_BASE_API_URL')
-
+        credentials.append((
+            site_configuration.get_value('EDFLEX_CLIENT_ID'),
+            site_configuration.get_value('EDFLEX_CLIENT_SECRET'),
+            site_configuration.get_value('EDFLEX_LOCALE', EDFLEX_LOCALE),
+            site_configuration.get_value('EDFLEX_BASE_API_URL'),
+        ))
+
+    configs = OrderedDict()
+    for client_id, client_secret, locale, base_api_url in credentials:
         if client_id and client_secret and base_api_url:
-            fetch_resources(client_id, client_secret, locale, base_api_url)
+            configs.setdefault((base_api_url, client_id, client_secret, locale), {
+                'client_id': client_id,
+                'client_secret': client_secret,
+                'locale': locale,
+                'base_api_url': base_api_url
+            })
 
+    return list(configs.values())
 
-@periodic_task(run_every=crontab(**fetch_new_edflex_data_cron))
-def fetch_new_edflex_data():
-    if EDFLEX_CLIENT_ID and EDFLEX_CLIENT_SECRET and EDFLEX_BASE_API_URL:
-        fetch_new_resources_and_delete_old_resources(
-            EDFLEX_CLIENT_ID,
-            EDFLEX_CLIENT_SECRET,
-            EDFLEX_LOCALE,
-            EDFLEX_BASE_API_URL
-        )
 
-    for site_configuration in SiteConfiguration.objects.filter(enabled=True):
-        client_id = site_configuration.get_value('EDFLEX_CLIENT_ID')
-        client_secret = site_configuration.get_value('EDFLEX_CLIENT_SECRET')
-        locale = site_configuration.get_value('EDFLEX_LOCALE', EDFLEX_LOCALE)
-        base_api_url = site_configuration.get_value('EDFLEX_BASE_API_URL')
+def sync_tenant(sync_name, sync, config):
+    """
+    Run the `sync` function for the tenant with the `config` credentials.
 
-        if client_id and client_secret and base_api_url:
-            fetch_new_resources_and_delete_old_resources(client_id, client_secret, locale, base_api_url)
+    The sync is skipped while another sync of the tenant holds its lease: a
+    delta sync then has nothing left to do, and overlapping syncs would
+    request the same resources and race on their rows.
+    """
+    tenant = u'{base_api_url} {client_id} {locale}'.format(**config)
+
+    with sync_lock(config) as acquired:
+        if not acquired:
+            log.info(u"Sync of the Edflex tenant <{}> skipped, another sync is running".format(tenant))
+            metrics.increment('sync_runs', sync=sync_name, status='locked')
+            return {'tenant': tenant, 'status': 'locked'}
+
+        start = time.time()
+        try:
+            resource_count = sync(
+                config['client_id'], config['client_secret'], config['locale'], config['base_api_url']
+            )
+        except Exception:  # pylint: disable=broad-except
+            log.exception(u"Sync of the Edflex tenant <{}> failed".format(tenant))
+            metrics.increment('sync_runs', sync=sync_name, status='failed')
+            metrics.flush()
+            return {'tenant': tenant, 'status': 'failed'}
+
+    elapsed = time.time() - start
+    metrics.increment('sync_runs', sync=sync_name, status='done')
+    metrics.timing('sync_seconds', elapsed, sync=sync_name)
+    metrics.gauge('sync_resources_per_second', resource_count / elapsed if elapsed else 0, sync=sync_name)
+    metrics.flush()
+
+    return {'tenant': tenant, 'status': 'done'}
+
+
+@task(bind=True, ignore_result=False, max_retries=12)
+def fetch_tenant_resources(self, config, requested=None):
+    tenant = u'{base_api_url} {client_id} {locale}'.format(**config)
+
+    # a postponed full sync is covered by any pass of the tenant finished since it was first run
+    if requested is not None and SyncState.objects.filter(
+        base_api_url=config['base_api_url'],
+        client_id=config['client_id'],
+        locale=config['locale'],
+        finished__gte=datetime.fromtimestamp(requested, timezone.utc),
+    ).exists():
+        log.info(u"Sync of the Edflex tenant <{}> skipped, another sync finished since it was requested".format(tenant))
+        return {'tenant': tenant, 'status': 'locked'}
+
+    requested = requested or time.time()
+    result = sync_tenant('fetch_resources', fetch_resources, config)
+
+    # the full sync isn't covered by a running delta sync, it's postponed instead of skipped
+    if result['status'] == 'locked' and not self.request.called_directly and self.request.retries < self.max_retries:
+        raise self.retry(kwargs={'config': config, 'requested': requested}, countdown=EDFLEX_SYNC_LEASE_TIMEOUT)
+
+    return result
+
+
+@task(ignore_result=False)
+def fetch_new_tenant_resources(config):
+    return sync_tenant('fetch_new_resources', fetch_new_resources_and_delete_old_resources, config)
+
+
+@task
+def log_sync_results(results, sync_name):
+    statuses = Counter(result['status'] for result in results)
+    log.info(u"Edflex {name}: {done} tenants synced, {locked} skipped, {failed} failed".format(
+        name=sync_name,
+        done=statuses['done'],
+        locked=statuses['locked'],
+        failed=statuses['failed'],
+    ))
+
+    for result in results:
+        if result['status'] == 'failed':
+            log.error(u"Edflex {name} failed for the tenant <{tenant}>".format(name=sync_name, **result))
+
+
+def fan_out_sync(tenant_task, sync_name):
+    """
+    Enqueue one `tenant_task` per distinct tenant, their results are collected by a chord.
+    """
+    configs = get_tenant_configurations()
+
+    if configs:
+        chord([tenant_task.s(config) for config in configs])(log_sync_results.s(sync_name))
+
+
+@periodic_task(run_every=crontab(**fetch_edflex_data_cron))
+def fetch_edflex_data():
+    fan_out_sync(fetch_tenant_resources, 'fetch_edflex_data')
+
+
+@periodic_task(run_every=crontab(**fetch_new_edflex_data_cron))
+def fetch_new_edflex_data():
+    fan_out_sync(fetch_new_tenant_resources, 'fetch_new_edflex_data')
 
 
 @periodic_task(run_every=crontab(**update_resources_cron))
@@ -104,154 +216,524 @@ def update_resources():
         log.error('The system must have a User is_active=True and staff or superuser')
         return
 
-    for course_overview in CourseOverview.objects.all():
-        try:
-            course = get_course(course_overview.id, depth=4)
-        except ValueError:
+    # collect the distinct resources of every tenant and the blocks using them
+    org_configs = {}
+    tenants = OrderedDict()
+    for course_key, usage_key, resource_id in EdflexBlock.objects.filter(
+        resource_id__isnull=False
+    ).order_by(
+        'course_key'
+    ).values_list(
+        'course_key', 'usage_key', 'resource_id'
+    ):
+        org = CourseKey.from_string(course_key).org
+
+        if org not in org_configs:
+            try:
+                org_configs[org] = get_edflex_configuration_for_org(org)
+            except ImproperlyConfigured as er:
+                log.error(er)
+                org_configs[org] = None
+
+        config = org_configs[org]
+        if config is None:
             continue
 
-        try:
-            edflex_client = EdflexOauthClient(get_edflex_configuration_for_org(course.location.org))
-        except ImproperlyConfigured as er:
-            log.error(er)
+        tenant_key = (config['base_api_url'], config['client_id'], config['locale'])
+        _, resource_usage_keys = tenants.setdefault(tenant_key, (config, OrderedDict()))
+        resource_usage_keys.setdefault(resource_id, []).append(usage_key)
+
+    # fetch each resource once and update all the blocks using it
+    for config, resource_usage_keys in tenants.values():
+        edflex_client = EdflexOauthClient(config)
+        resource_ids = list(resource_usage_keys)
+        r_resources = metrics.timed_iter(
+            fetch_resource_details(edflex_client, resource_ids),
+            'sync_phase_seconds', sync='update_resources', phase='detail'
+        )
+
+        with metrics.timer('sync_phase_seconds', sync='update_resources', phase='persist'):
+            for resource_id, resource in r_resources:
+                if not resource:
+                    continue
+
+                for usage_key in resource_usage_keys[resource_id]:
+                    update_block_resource(usage_key, resource, user)
+                    metrics.increment('sync_blocks', sync='update_resources')
+
+    metrics.flush()
+
+
+def update_block_resource(usage_key, resource, user):
+    """
+    Save and publish the Edflex block if its resource has changed.
+    """
+    try:
+        xblock = modulestore().get_item(UsageKey.from_string(usage_key))
+    except ItemNotFoundError:
+        log.warning(u"Edflex block <{}> is indexed but not found".format(usage_key))
+        return
+
+    if six.text_type(xblock.resource.get('id')) != six.text_type(resource['id']) or xblock.resource == resource:
+        return
+
+    xblock.resource = resource
+    old_xblock_location = xblock.location
+    xblock.location = xblock.location.for_branch(ModuleStoreEnum.BranchName.draft)
+    xblock.save()
+    modulestore().update_item(xblock, user.id, asides=[])
+    xblock.location = old_xblock_location
+    modulestore().publish(xblock.location, user.id)
+
+
+def index_course_blocks(course_key):
+    """
+    Rebuild the index of the published Edflex blocks of a course.
+    """
+    store = modulestore()
+    with store.branch_setting(ModuleStoreEnum.Branch.published_only, course_key):
+        xblocks = store.get_items(course_key, qualifiers={'category': 'edflex'})
+
+    with transaction.atomic():
+        delete_course_index(course_key)
+        EdflexBlock.objects.bulk_create([
+            EdflexBlock(
+                course_key=six.text_type(course_key),
+                usage_key=six.text_type(xblock.location.for_branch(None)),
+                resource_id=xblock.resource.get('id'),
+                catalog_id=xblock.catalog,
+            )
+            for xblock in xblocks
+        ], batch_size=BULK_BATCH_SIZE)
+
+
+def delete_course_index(course_key):
+    EdflexBlock.objects.filter(course_key=six.text_type(course_key)).delete()
+
+
+def fetch_resource_details(edflex_client, resource_ids, conditional_ids=(), catalog_id=None):
+    """
+    Fetch resources with the configured concurrency and rate limit.
+
+    (resource_id, resource) pairs are yielded in the order of `resource_ids`,
+    so the caller keeps writing them to the database from a single thread.
+    Resources in `conditional_ids` are only downloaded if they changed since
+    they were stored in `catalog_id`.
+    """
+    return edflex_client.get_resources(
+        resource_ids,
+        conditional_ids=conditional_ids,
+        concurrency=EDFLEX_FETCH_CONCURRENCY,
+        rate_limiter=RateLimiter(EDFLEX_FETCH_RATE_LIMIT),
+        catalog_id=catalog_id
+    )
+
+
+def bulk_upsert(model, key_field, catalog_id, rows, keep=()):
+    """
+    Create or update the `rows` ({key: fields}) of a catalog in bulk.
+
+    Existing objects are loaded with one query per batch of keys and only the
+    changed ones are updated (Django 1.11 has no `bulk_update`). Returns
+    {key: pk} of the `rows` and of the existing objects in `keep`, left
+    untouched.
+    """
+    field_names = set()
+    for fields in rows.values():
+        field_names.update(fields)
+
+    key_lookup = '{}__in'.format(key_field)
+    existing = {}
+    for keys in chunks(set(rows) | set(keep)):
+        for obj in model.objects.filter(catalog_id=catalog_id, **{key_lookup: keys}).values(
+            'id', key_field, *field_names
+        ):
+            existing[obj[key_field]] = obj
+    new_objs = []
+
+    for key, fields in rows.items():
+        obj = existing.get(key)
+
+        if obj is None:
+            new_objs.append(model(catalog_id=catalog_id, **dict(fields, **{key_field: key})))
+        elif any(obj[name] != value for name, value in fields.items()):
+            model.objects.filter(id=obj['id']).update(modified=timezone.now(), **fields)
+
+    pks = {key: obj['id'] for key, obj in existing.items()}
+
+    if new_objs:
+        model.objects.bulk_create(new_objs, batch_size=BULK_BATCH_SIZE)
+        for keys in chunks(getattr(obj, key_field) for obj in new_objs):
+            pks.update(model.objects.filter(catalog_id=catalog_id, **{key_lookup: keys}).values_list(key_field, 'id'))
+
+    return pks
+
+
+def save_catalog_resources(catalog, r_resources):
+    """
+    Persist a batch of resources of a catalog and their categories in bulk.
+
+    `r_resources` are (resource_id, resource) pairs, NOT_MODIFIED resources
+    are kept as they are. The stored resources which failed to be fetched
+    (None) are kept too, without refreshing their `data_fetched`. Returns the
+    ids of the saved or kept `Resource` objects and of their `Category`
+    objects.
+    """
+    resources = OrderedDict()
+    categories = {}
+    unchanged = set()
+    failed = set()
+
+    for resource_id, r_resource in r_resources:
+        if r_resource is NOT_MODIFIED:
+            unchanged.add(six.text_type(resource_id))
+            continue
+        if r_resource is None:
+            failed.add(six.text_type(resource_id))
+            continue
+        if not r_resource:
+            continue
+        if not r_resource.get('title'):
+            log.warning(u"Ignoring Resource <{id}>: no title".format(id=r_resource['id']))
             continue
 
-        for section in course.get_children():
-            for subsection in section.get_children():
-                for unit in subsection.get_children():
-                    for xblock in unit.get_children():
-                        if xblock.location.block_type == 'edflex':
-                            resource_id = xblock.resource.get('id')
-                            if resource_id:
-                                resource = edflex_client.get_resource(resource_id)
-                                if resource and xblock.resource != resource:
-                                    xblock.resource = resource
-                                    old_xblock_location = xblock.location
-                                    xblock.location = xblock.location.for_branch(ModuleStoreEnum.BranchName.draft)
-                                    xblock.save()
-                                    modulestore().update_item(xblock, user.id, asides=[])
-                                    xblock.location = old_xblock_location
-                                    modulestore().publish(xblock.location, user.id)
+        category_keys = []
+        for r_category in r_resource.get('categories', []):
+            if not r_category.get('name'):
+                log.warning(u"Ignoring Category <{id}>: no name".format(id=r_category['id']))
+                continue
+            category_key = six.text_type(r_category['id'])
+            categories[category_key] = {
+                'name': clean_text(r_category['name']),
+                'catalog_title': clean_text(catalog['title']),
+            }
+            category_keys.append(category_key)
+
+        resources[six.text_type(r_resource['id'])] = ({
+            'title': clean_text(r_resource['title'], max_length=None),
+            'r_type': r_resource['type'],
+            'language': r_resource['language'],
+            'data': json.dumps(r_resource, sort_keys=True),
+        }, category_keys)
+
+    with transaction.atomic():
+        category_pks = bulk_upsert(Category, 'category_id', catalog['id'], categories)
+        resource_pks = bulk_upsert(
+            Resource, 'resource_id', catalog['id'],
+            OrderedDict((key, fields) for key, (fields, _) in resources.items()),
+            keep=unchanged | failed
+        )
+
+        links = set()
+        for key, (_, category_keys) in resources.items():
+            for category_key in category_keys:
+                links.add((resource_pks[key], category_pks[category_key]))
+
+        through = Resource.categories.through
+        saved_resource_pks = {resource_pks[key] for key in resources}
+        kept_resource_pks = set(resource_pks.values()) - saved_resource_pks
+        kept_category_pks = set()
+        existing_links = {}
+        for link_id, resource_pk, category_pk in through.objects.filter(
+            resource_id__in=list(resource_pks.values())
+        ).values_list('id', 'resource_id', 'category_id'):
+            if resource_pk in saved_resource_pks:
+                existing_links[(resource_pk, category_pk)] = link_id
+            elif resource_pk in kept_resource_pks:
+                kept_category_pks.add(category_pk)
+
+        for link_ids in chunks(link_id for link, link_id in existing_links.items() if link not in links):
+            through.objects.filter(id__in=link_ids).delete()
+
+        through.objects.bulk_create(
+            [
+                through(resource_id=resource_pk, category_id=category_pk)
+                for resource_pk, category_pk in links
+                if (resource_pk, category_pk) not in existing_links
+            ],
+            batch_size=BULK_BATCH_SIZE
+        )
+
+        index_resources(saved_resource_pks)
+
+        # mark the rows seen by this sync, the others are swept at its end
+        now = timezone.now()
+        all_category_pks = {category_pk for _, category_pk in links} | kept_category_pks
+        failed_pks = {resource_pks[key] for key in failed - unchanged - set(resources) if key in resource_pks}
+        for pks in chunks(pk for pk in resource_pks.values() if pk not in failed_pks):
+            Resource.objects.filter(id__in=pks).update(data_fetched=now, last_seen=now)
+        # a transient error doesn't sweep the row, its data is fetched again by the next sync
+        for pks in chunks(failed_pks):
+            Resource.objects.filter(id__in=pks).update(last_seen=now)
+        for pks in chunks(all_category_pks):
+            Category.objects.filter(id__in=pks).update(last_seen=now)
+
+    return list(resource_pks.values()), list(all_category_pks)
+
+
+def delete_in_batches(queryset):
+    """
+    Delete the rows of `queryset` by batches of primary keys, keeping each statement short.
+    """
+    while True:
+        pks = list(queryset.values_list('id', flat=True)[:BULK_BATCH_SIZE])
+        if not pks:
+            break
+        queryset.model.objects.filter(id__in=pks).delete()
+
+
+def delete_stale(queryset, seen_since):
+    """
+    Delete the rows of `queryset` not seen by a sync since `seen_since`.
+    """
+    delete_in_batches(queryset.filter(Q(last_seen__lt=seen_since) | Q(last_seen__isnull=True)))
+
+
+def save_resource_batch(sync_name, edflex_client, catalog, resource_ids, conditional_ids=()):
+    """
+    Fetch and persist a batch of resources of a catalog, return the number of fetched resources.
+    """
+    with metrics.timer('sync_phase_seconds', sync=sync_name, phase='detail'):
+        r_resources = list(fetch_resource_details(
+            edflex_client, resource_ids, conditional_ids=conditional_ids, catalog_id=catalog['id']
+        ))
+
+    failed_ids = [resource_id for resource_id, r_resource in r_resources if r_resource is None]
+    if failed_ids:
+        # the catalog is listed again by the next sync, which retries these resources
+        log.warning(u"Resources {ids} of catalog <{id}> not fetched".format(ids=failed_ids, id=catalog['id']))
+        edflex_client.discard_catalog_validators(catalog['id'])
+
+    with metrics.timer('sync_phase_seconds', sync=sync_name, phase='persist'), \
+            metrics.count_queries('sync_db_queries', sync=sync_name, catalog=catalog['id']):
+        save_catalog_resources(catalog, r_resources)
+
+    metrics.increment('sync_resources', len(r_resources), sync=sync_name)
+    return len(r_resources)
+
+
+def get_sync_state(config):
+    """
+    Return the SyncState of the full sync of a tenant.
+
+    An interrupted sync started less than EDFLEX_SYNC_RESUME_MAX_AGE ago is
+    resumed, a new pass is started otherwise.
+    """
+    now = timezone.now()
+    state, created = SyncState.objects.get_or_create(
+        base_api_url=config['base_api_url'],
+        client_id=config['client_id'],
+        locale=config['locale'],
+        defaults={'started': now}
+    )
+
+    if created:
+        return state
+
+    if state.finished is None and state.started > now - timedelta(seconds=EDFLEX_SYNC_RESUME_MAX_AGE):
+        log.info(u"Resuming the Edflex sync started at {} after catalog <{}>".format(state.started, state.catalog_id))
+        return state
+
+    state.started = now
+    state.completed_catalogs = '[]'
+    state.catalog_id = None
+    state.resources_synced = 0
+    state.finished = None
+    state.save()
+    return state
+
+
+def get_removed_catalog_ids(state, catalog_ids):
+    """
+    Return the ids of the catalogs of a tenant removed since its last full sync.
+
+    The tenants share the tables, the catalogs still listed by another
+    tenant are kept.
+    """
+    removed_catalog_ids = set(json.loads(state.catalog_ids)) - catalog_ids
+
+    if removed_catalog_ids:
+        for other_catalog_ids in SyncState.objects.exclude(id=state.id).values_list('catalog_ids', flat=True):
+            removed_catalog_ids -= set(json.loads(other_catalog_ids))
+
+    return removed_catalog_ids
 
 
 def fetch_resources(client_id, client_secret, locale, base_api_url):
-    edflex_client = EdflexOauthClient({
+    """
+    Synchronize all the resources of a tenant, return the number of fetched resources.
+    """
+    config = {
         'client_id': client_id,
         'client_secret': client_secret,
         'locale': locale,
         'base_api_url': base_api_url
-    })
-    r_catalogs = edflex_client.get_catalogs()
-    category_ids = []
+    }
+    edflex_client = EdflexOauthClient(config)
+    with metrics.timer('sync_phase_seconds', sync='fetch_resources', phase='list'):
+        r_catalogs = edflex_client.get_catalogs()
+    state = get_sync_state(config)
+    sync_started = state.started
+    completed_catalogs = set(json.loads(state.completed_catalogs))
+    resource_count = 0
+    complete = bool(r_catalogs)
 
     for catalog in r_catalogs:
-        resource_ids = []
-        r_catalog = edflex_client.get_catalog(catalog['id'])
+        if catalog['id'] in completed_catalogs:
+            continue
 
-        for resource in r_catalog['items']:
-            r_resource = edflex_client.get_resource(resource['resource']['id'])
+        existing_ids = set()
+        stored_ids = set()
+        # resources already saved by an interrupted run of this pass
+        synced_ids = set()
+        with metrics.count_queries('sync_db_queries', sync='fetch_resources', catalog=catalog['id']):
+            for resource_id, data_fetched, last_seen in Resource.objects.filter(
+                catalog_id=catalog['id']
+            ).values_list(
+                'resource_id', 'data_fetched', 'last_seen'
+            ):
+                existing_ids.add(resource_id)
+                if data_fetched:
+                    stored_ids.add(resource_id)
+                if last_seen and last_seen >= sync_started:
+                    synced_ids.add(resource_id)
+        # a catalog without stored rows is listed in full, its validators may
+        # outlive the rows, e.g. when it was removed and listed again
+        with metrics.timer('sync_phase_seconds', sync='fetch_resources', phase='list'):
+            r_items = edflex_client.get_catalog_items(catalog['id'], conditional=bool(existing_ids))
+
+        if r_items is None:
+            # the catalog is skipped, its resources aren't swept and are synced when the pass is resumed
+            log.warning(u"Catalog <{id}> not fetched, keeping its resources".format(id=catalog['id']))
+            Category.objects.filter(catalog_id=catalog['id']).update(last_seen=timezone.now())
+            complete = False
+            continue
 
-            if r_resource:
-                if not r_resource.get('title'):
-                    log.warning(u"Ignoring Resource <{id}>: no title".format(id=r_resource['id']))
-                    continue
-                clean_title = emoji.get_emoji_regexp().sub(r'', r_resource['title'])
-                resource, created = Resource.objects.update_or_create(
-                    catalog_id=catalog['id'],
-                    resource_id=r_resource['id'],
-                    defaults={
-                        'title': clean_title,
-                        'r_type': r_resource['type'],
-                        'language': r_resource['language']
-                    },
+        if r_items is NOT_MODIFIED:
+            item_ids = existing_ids
+        else:
+            item_ids = metrics.timed_iter(
+                (item['resource']['id'] for item in r_items),
+                'sync_phase_seconds', sync='fetch_resources', phase='list'
+            )
+
+        state.catalog_id = catalog['id']
+        state.resources_synced = len(synced_ids)
+        state.save(update_fields=['catalog_id', 'resources_synced', 'modified'])
+
+        try:
+            # the ids are read before the details are fetched, the catalog
+            # response would be closed by the server while left idle
+            item_ids = list(item_ids)
+            for item_ids_batch in chunks(
+                item_id for item_id in item_ids if six.text_type(item_id) not in synced_ids
+            ):
+                resource_count += save_resource_batch(
+                    'fetch_resources', edflex_client, catalog, item_ids_batch, conditional_ids=stored_ids
                 )
-                resource_ids.append(resource.id)
-                resource.categories.clear()
-
-                for r_category in r_resource.get('categories', []):
-                    if not r_category.get('name'):
-                        log.warning(u"Ignoring Category <{id}>: no name".format(id=r_category['id']))
-                        continue
-                    clean_name = emoji.get_emoji_regexp().sub(r'', r_category['name'])
-                    category, created = Category.objects.update_or_create(
-                        category_id=r_category['id'],
-                        catalog_id=catalog['id'],
-                        defaults={'name': clean_name,
-                                  'catalog_title': catalog['title']}
-                    )
-                    resource.categories.add(category)
-                    category_ids.append(category.id)
-
-        Resource.objects.filter(
-            catalog_id=catalog['id']
-        ).exclude(
-            id__in=resource_ids
-        ).delete()
-
-    Resource.objects.exclude(
-        catalog_id__in=[catalog['id'] for catalog in r_catalogs]
-    ).delete()
-
-    Category.objects.exclude(
-        id__in=category_ids
-    ).delete()
+                # checkpoint of the batch, the saved resources are skipped if the sync is resumed
+                state.resources_synced += len(item_ids_batch)
+                state.save(update_fields=['resources_synced', 'modified'])
+        except (ValueError, RequestException) as er:
+            log.error(u"Catalog <{id}> not fully fetched, keeping its resources: {er}".format(id=catalog['id'], er=er))
+            # its validators were received with the headers, the next sync must list it again
+            edflex_client.discard_catalog_validators(catalog['id'])
+            Category.objects.filter(catalog_id=catalog['id']).update(last_seen=timezone.now())
+            complete = False
+            continue
+
+        with metrics.timer('sync_phase_seconds', sync='fetch_resources', phase='cleanup'), \
+                metrics.count_queries('sync_db_queries', sync='fetch_resources', catalog=catalog['id']):
+            delete_stale(Resource.objects.filter(catalog_id=catalog['id']), sync_started)
+        edflex_client.commit_validators()
+
+        completed_catalogs.add(catalog['id'])
+        state.completed_catalogs = json.dumps(sorted(completed_catalogs))
+        state.catalog_id = None
+        state.save(update_fields=['completed_catalogs', 'catalog_id', 'modified'])
+
+    # the rows of the removed catalogs are only deleted once every catalog is synced
+    if complete:
+        catalog_ids = {catalog['id'] for catalog in r_catalogs}
+        removed_catalog_ids = get_removed_catalog_ids(state, catalog_ids)
+        with metrics.timer('sync_phase_seconds', sync='fetch_resources', phase='cleanup'):
+            delete_in_batches(Resource.objects.filter(catalog_id__in=removed_catalog_ids))
+            delete_stale(Category.objects.filter(catalog_id__in=catalog_ids | removed_catalog_ids), sync_started)
+        state.catalog_ids = json.dumps(sorted(catalog_ids))
+        state.finished = timezone.now()
+        state.save(update_fields=['catalog_ids', 'finished', 'modified'])
+    else:
+        log.warning(u"Edflex sync of {} incomplete, it will be resumed by the next run".format(base_api_url))
+
+    # get_catalogs returns no catalog on an error, the cached ids are kept
+    if r_catalogs:
+        cache_catalog_ids(config, [catalog['id'] for catalog in r_catalogs])
+    return resource_count
 
 
 def fetch_new_resources_and_delete_old_resources(client_id, client_secret, locale, base_api_url):
-    edflex_client = EdflexOauthClient({
+    """
+    Add the new resources of a tenant and delete the removed ones, return the number of fetched resources.
+    """
+    config = {
         'client_id': client_id,
         'client_secret': client_secret,
         'locale': locale,
         'base_api_url': base_api_url
-    })
-    r_catalogs = edflex_client.get_catalogs()
+    }
+    edflex_client = EdflexOauthClient(config)
+    with metrics.timer('sync_phase_seconds', sync='fetch_new_resources', phase='list'):
+        r_catalogs = edflex_client.get_catalogs()
+    resource_count = 0
 
     for catalog in r_catalogs:
-        resource_ids = []
-        r_catalog = edflex_client.get_catalog(catalog['id'])
-
-        for item_resource in r_catalog['items']:
-            resource = Resource.objects.filter(
-                resource_id=item_resource['resource']['id'],
+        with metrics.count_queries('sync_db_queries', sync='fetch_new_resources', catalog=catalog['id']):
+            existing_pks = dict(Resource.objects.filter(
                 catalog_id=catalog['id']
-            ).first()
-
-            if resource is None:
-                r_resource = edflex_client.get_resource(item_resource['resource']['id'])
-
-                if r_resource:
-                    if not r_resource.get('title'):
-                        log.warning(u"Ignoring Resource <{id}>: no title".format(id=r_resource['id']))
-                        continue
-                    clean_title = emoji.get_emoji_regexp().sub(r'', r_resource['title'])
-                    resource, created = Resource.objects.update_or_create(
-                        catalog_id=catalog['id'],
-                        resource_id=r_resource['id'],
-                        defaults={
-                            'title': clean_title,
-                            'r_type': r_resource['type'],
-                            'language': r_resource['language']
-                        },
-                    )
-                    resource.categories.clear()
-
-                    for r_category in r_resource.get('categories', []):
-                        if not r_category.get('name'):
-                            log.warning(u"Ignoring Category <{id}>: no name".format(id=r_category['id']))
-                            continue
-                        clean_name = emoji.get_emoji_regexp().sub(r'', r_category['name'])
-                        category, created = Category.objects.update_or_create(
-                            category_id=r_category['id'],
-                            catalog_id=catalog['id'],
-                            defaults={'name': clean_name,
-                                      'catalog_title': catalog['title']}
-                        )
-                        resource.categories.add(category)
-
-            resource_ids.append(resource.id)
-
-        Resource.objects.filter(
-            catalog_id=catalog['id']
-        ).exclude(
-            id__in=resource_ids
-        ).delete()
+            ).values_list(
+                'resource_id', 'id'
+            ))
+
+        # a catalog without stored rows is listed in full, its validators may
+        # outlive the rows, e.g. when it was removed and listed again
+        with metrics.timer('sync_phase_seconds', sync='fetch_new_resources', phase='list'):
+            r_items = edflex_client.get_catalog_items(catalog['id'], conditional=bool(existing_pks))
+
+        if r_items is None or r_items is NOT_MODIFIED:
+            continue
+        seen_ids = set()
+        item_ids = metrics.timed_iter(
+            (six.text_type(item['resource']['id']) for item in r_items),
+            'sync_phase_seconds', sync='fetch_new_resources', phase='list'
+        )
+
+        try:
+            # the ids are read before the details are fetched, the catalog
+            # response would be closed by the server while left idle
+            item_ids = list(item_ids)
+            for item_ids_batch in chunks(item_ids):
+                new_item_ids = []
+
+                for item_id in item_ids_batch:
+                    if item_id not in existing_pks and item_id not in seen_ids:
+                        new_item_ids.append(item_id)
+                    seen_ids.add(item_id)
+
+                if new_item_ids:
+                    resource_count += save_resource_batch('fetch_new_resources', edflex_client, catalog, new_item_ids)
+        except (ValueError, RequestException) as er:
+            log.error(u"Catalog <{id}> not fully fetched, keeping its resources: {er}".format(id=catalog['id'], er=er))
+            # its validators were received with the headers, the next sync must list it again
+            edflex_client.discard_catalog_validators(catalog['id'])
+            continue
+
+        with metrics.timer('sync_phase_seconds', sync='fetch_new_resources', phase='cleanup'), \
+                metrics.count_queries('sync_db_queries', sync='fetch_new_resources', catalog=catalog['id']):
+            for pks in chunks(pk for resource_id, pk in existing_pks.items() if resource_id not in seen_ids):
+                Resource.objects.filter(id__in=pks).delete()
+        edflex_client.commit_validators()
+
+    # get_catalogs returns no catalog on an error, the cached ids are kept
+    if r_catalogs:
+        cache_catalog_ids(config, [catalog['id'] for catalog in r_catalogs])
+    return resource_count
@@ -1,20 +1,45 @@
 import mock
 import json
+import requests
 import requests_oauthlib
+import time
 
+from datetime import datetime
 from unittest import TestCase
+from xml.dom import minidom
 
+from celery.exceptions import Retry
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from oauthlib.oauth2 import TokenExpiredError
 from requests import HTTPError
 from xblock.field_data import DictFieldData
 
-from .api import EdflexOauthClient
-from .utils import get_edflex_configuration, get_edflex_configuration_for_org
+from . import api, metrics
+from .api import NOT_MODIFIED, EdflexOauthClient
+from .benchmark import FakeEdflexData, MemorySampler, QueryCounter
+from .search import index_resources, search, tokenize
+from .utils import (
+    EDFLEX_SYNC_LEASE_TIMEOUT, RateLimiter, SyncLease, clean_text, get_catalog_ids, get_edflex_configuration,
+    get_edflex_configuration_for_org, get_sync_lock_key
+)
 from .tasks import (
-    fetch_edflex_data, fetch_resources, update_resources, fetch_new_edflex_data,
-    fetch_new_resources_and_delete_old_resources
+    fetch_edflex_data, fetch_resources, update_resources, fetch_new_edflex_data, fetch_tenant_resources,
+    fetch_new_tenant_resources, get_tenant_configurations,
+    fetch_new_resources_and_delete_old_resources, fetch_resource_details, save_catalog_resources, bulk_upsert,
+    index_course_blocks, delete_in_batches, delete_stale, get_sync_state, save_resource_batch
 )
-from .edflex import EdflexXBlock
+from . import edflex
+from .edflex import EdflexXBlock, load_resource, render_template
+from .models import Category, Resource
+
+
+def fetch_resource_details_in_order(edflex_client, resource_ids, conditional_ids=(), catalog_id=None):
+    return [
+        (resource_id, edflex_client.get_resource(resource_id, conditional=resource_id in conditional_ids))
+        for resource_id in resource_ids
+    ]
 
 
 @mock.patch('edflex.utils.get_edflex_configuration', return_value={
@@ -25,6 +50,10 @@ from .edflex import EdflexXBlock
 })
 class TestEdflexOauthClient(TestCase):
 
+    def setUp(self):
+        api._token_cache.clear()
+        cache.clear()
+
     @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
     def test_init(self, mock_fetch_token, mock_get_edflex_configuration):
         # act:
@@ -44,7 +73,9 @@ class TestEdflexOauthClient(TestCase):
         mock_token.start()
         test_instance = EdflexOauthClient(mock_get_edflex_configuration())
         mock_token.stop()
-        mock_auth_fetch_token = test_instance.oauth_client.fetch_token = mock.Mock()
+        mock_auth_fetch_token = test_instance.oauth_client.fetch_token = mock.Mock(
+            return_value={'access_token': 'token', 'token_type': 'Bearer', 'expires_in': 3600}
+        )
 
         # act:
         test_instance.fetch_token()
@@ -54,8 +85,38 @@ class TestEdflexOauthClient(TestCase):
         mock_auth_fetch_token.assert_called_with(
             client_secret='test_client_secret',
             token_url='https://test.base.url/api/oauth/v2/token',
-            client_id='100'
+            client_id='100',
+            timeout=30
         )
+        self.assertEqual(test_instance.get_cached_token()['access_token'], 'token')
+
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token')
+    def test_init_with_cached_token(self, mock_fetch_token, mock_get_edflex_configuration):
+        # arrange:
+        EdflexOauthClient(mock_get_edflex_configuration()).cache_token(
+            {'access_token': 'token', 'token_type': 'Bearer', 'expires_in': 3600}
+        )
+        mock_fetch_token.reset_mock()
+
+        # act:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+
+        # assert:
+        mock_fetch_token.assert_not_called()
+        self.assertEqual(test_instance.oauth_client.token['access_token'], 'token')
+
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token')
+    @mock.patch('edflex.api.time.time', return_value=1000)
+    def test_get_cached_token_when_expiring(self, mock_time, mock_fetch_token, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+        cache.set(test_instance.token_cache_key, {'access_token': 'token', 'expires_at': 1030})
+
+        # act:
+        result = test_instance.get_cached_token()
+
+        # assert:
+        self.assertIsNone(result)
 
     @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
     @mock.patch('edflex.api.urljoin', return_value='https://test.base.url/api/selection/catalogs')
@@ -75,7 +136,9 @@ class TestEdflexOauthClient(TestCase):
         mock_get.assert_called_once_with(
             url='https://test.base.url/api/selection/catalogs',
             headers={'content-type': 'application/json'},
-            params={'locale': 'en'}
+            params={'locale': 'en'},
+            stream=False,
+            timeout=30
         )
         self.assertEqual(test_catalogs_result, [{"id": "catalog_id", "title": "Catalog"}])
 
@@ -96,7 +159,9 @@ class TestEdflexOauthClient(TestCase):
         mock_get.assert_called_once_with(
             url='https://test.base.url/api/selection/catalogs',
             headers={'content-type': 'application/json'},
-            params={'locale': 'en'}
+            params={'locale': 'en'},
+            stream=False,
+            timeout=30
         )
         self.assertEqual(test_catalogs_result, [])
 
@@ -130,7 +195,9 @@ class TestEdflexOauthClient(TestCase):
         mock_get.assert_called_once_with(
             url='https://test.base.url/api/selection/catalogs/catalog_id',
             headers={'content-type': 'application/json'},
-            params={'locale': 'en'}
+            params={'locale': 'en'},
+            stream=False,
+            timeout=30
         )
         self.assertEqual(
             test_catalog_result,
@@ -164,9 +231,11 @@ class TestEdflexOauthClient(TestCase):
         mock_get.assert_called_once_with(
             url='https://test.base.url/api/selection/catalogs/catalog_id',
             headers={'content-type': 'application/json'},
-            params={'locale': 'en'}
+            params={'locale': 'en'},
+            stream=False,
+            timeout=30
         )
-        self.assertEqual(test_catalog_result, {'items': []})
+        self.assertEqual(test_catalog_result, None)
 
     @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
     @mock.patch('edflex.api.urljoin', return_value='https://test.base.url/api/resource/resources/resource_id')
@@ -222,7 +291,9 @@ class TestEdflexOauthClient(TestCase):
         mock_get.assert_called_once_with(
             url='https://test.base.url/api/resource/resources/resource_id',
             headers={'content-type': 'application/json'},
-            params={'locale': 'en'}
+            params={'locale': 'en'},
+            stream=False,
+            timeout=30
         )
         self.assertEqual(
             test_get_resource_result,
@@ -280,11 +351,339 @@ class TestEdflexOauthClient(TestCase):
         mock_get.assert_called_once_with(
             url='https://test.base.url/api/resource/resources/resource_id',
             headers={'content-type': 'application/json'},
-            params={'locale': 'en'}
+            params={'locale': 'en'},
+            stream=False,
+            timeout=30
         )
         self.assertEqual(test_get_resource_result, None)
 
 
+    @mock.patch('edflex.api.time.sleep')
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_get_resource_retries_on_server_errors(self, mock_token, mock_sleep, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+        mock_get = test_instance.oauth_client.get = mock.Mock(side_effect=[
+            requests.ConnectionError('connection reset'),
+            mock.Mock(status_code=429, headers={'Retry-After': '7'}),
+            mock.Mock(status_code=200, json=mock.Mock(return_value={'id': 'resource_id'})),
+        ])
+
+        # act:
+        result = test_instance.get_resource('resource_id')
+
+        # assert:
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+        mock_sleep.assert_called_with(7)
+        self.assertEqual(result, {'id': 'resource_id'})
+
+    @mock.patch('edflex.api.EDFLEX_API_MAX_RETRIES', 2)
+    @mock.patch('edflex.api.time.sleep')
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_get_resource_gives_up_after_max_retries(self, mock_token, mock_sleep, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+        mock_get = test_instance.oauth_client.get = mock.Mock(return_value=mock.Mock(
+            status_code=503, headers={}, raise_for_status=mock.Mock(side_effect=HTTPError)
+        ))
+
+        # act:
+        result = test_instance.get_resource('resource_id')
+
+        # assert:
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+        self.assertIsNone(result)
+
+    @mock.patch('edflex.api.time.sleep')
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_get_resource_with_handler_limits(self, mock_token, mock_sleep, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration(), timeout=5, max_retries=0)
+        mock_get = test_instance.oauth_client.get = mock.Mock(return_value=mock.Mock(
+            status_code=503, headers={'Retry-After': '60'}, raise_for_status=mock.Mock(side_effect=HTTPError)
+        ))
+
+        # act:
+        result = test_instance.get_resource('resource_id')
+
+        # assert:
+        mock_get.assert_called_once_with(
+            url='https://test.base.url/api/resource/resources/resource_id',
+            headers={'content-type': 'application/json'},
+            params={'locale': 'en'},
+            stream=False,
+            timeout=5
+        )
+        mock_sleep.assert_not_called()
+        self.assertIsNone(result)
+
+    @mock.patch('edflex.api.EDFLEX_API_BACKOFF_FACTOR', 0.5)
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_get_retry_delay(self, mock_token, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+
+        # act + assert:
+        for _ in range(20):
+            self.assertTrue(0 <= test_instance.get_retry_delay(2) <= 2)
+        self.assertEqual(test_instance.get_retry_delay(0, mock.Mock(headers={'Retry-After': '3600'})), 60)
+
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_clients_share_http_adapter(self, mock_token, mock_get_edflex_configuration):
+        # act:
+        first_client = EdflexOauthClient(mock_get_edflex_configuration())
+        second_client = EdflexOauthClient(mock_get_edflex_configuration())
+
+        # assert:
+        adapter = first_client.oauth_client.get_adapter('https://test.base.url/api/selection/catalogs')
+        self.assertIsInstance(adapter, api.EdflexHTTPAdapter)
+        self.assertIs(adapter, second_client.oauth_client.get_adapter('https://test.base.url/api/resource/resources/1'))
+
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_get_catalog_items(self, mock_token, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+        body = json.dumps({
+            'id': 'catalog_id',
+            'title': u'Catalog \u00e9t\u00e9',
+            'items': [{'resource': {'id': 'resource_id_{}'.format(i)}} for i in range(3)],
+        }).encode('utf-8')
+        mock_resp = mock.Mock(status_code=200, encoding=None, iter_content=mock.Mock(
+            return_value=[body[i:i + 7] for i in range(0, len(body), 7)]
+        ))
+        mock_get = test_instance.oauth_client.get = mock.Mock(return_value=mock_resp)
+
+        # act:
+        items = test_instance.get_catalog_items('catalog_id')
+
+        # assert:
+        self.assertEqual(mock_get.call_args[1]['stream'], True)
+        mock_resp.iter_content.assert_not_called()
+        self.assertEqual(
+            [item['resource']['id'] for item in items], ['resource_id_0', 'resource_id_1', 'resource_id_2']
+        )
+        mock_resp.close.assert_called_once_with()
+
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_get_catalog_items_error(self, mock_token, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+        test_instance.oauth_client.get = mock.Mock(return_value=mock.Mock(
+            status_code=404, raise_for_status=mock.Mock(side_effect=HTTPError)
+        ))
+
+        # act + assert:
+        self.assertIsNone(test_instance.get_catalog_items('catalog_id'))
+
+    def test_iter_json_array(self):
+        # arrange:
+        text = json.dumps({'title': '"items": [0]', 'meta': {'items': [0]}, 'items': [1, {'id': 23}, [3]], 'n': 4})
+
+        # act + assert:
+        for size in (1, 5, len(text)):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            self.assertEqual(list(api.iter_json_array(chunks, 'items')), [1, {'id': 23}, [3]])
+        self.assertEqual(list(api.iter_json_array(['{"items": [12', '34]}'], 'items')), [1234])
+        self.assertEqual(list(api.iter_json_array(['{"total": 1.', '5, "items": [1]}'], 'items')), [1])
+        self.assertEqual(list(api.iter_json_array(['{"items": [1e', '3, 2.', '5E-', '1]}'], 'items')), [1000.0, 0.25])
+        self.assertEqual(list(api.iter_json_array(['{"other": []}'], 'items')), [])
+        with self.assertRaises(ValueError):
+            list(api.iter_json_array(['{"items": [{"id": 1}, {"id"'], 'items'))
+
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_get_resource_conditional_not_modified(self, mock_token, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+        resource_url = 'https://test.base.url/api/resource/resources/resource_id'
+        cache.set(test_instance.validators_cache_key(resource_url, 'catalog_id'), {'If-None-Match': '"etag"'})
+        mock_get = test_instance.oauth_client.get = mock.Mock(return_value=mock.Mock(status_code=304))
+
+        # act:
+        result = test_instance.get_resource('resource_id', conditional=True, catalog_id='catalog_id')
+
+        # assert:
+        mock_get.assert_called_once_with(
+            url=resource_url,
+            headers={'content-type': 'application/json', 'If-None-Match': '"etag"'},
+            params={'locale': 'en'},
+            stream=False,
+            timeout=30
+        )
+        self.assertIs(result, NOT_MODIFIED)
+
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_get_catalog_conditional_stores_validators_on_commit(self, mock_token, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+        catalog_url = 'https://test.base.url/api/selection/catalogs/catalog_id'
+        test_instance.oauth_client.get = mock.Mock(return_value=mock.Mock(
+            status_code=200,
+            headers={'ETag': '"etag"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'},
+            json=mock.Mock(return_value={'id': 'catalog_id', 'items': []})
+        ))
+
+        # act:
+        result = test_instance.get_catalog('catalog_id', conditional=True)
+        stored_before_commit = cache.get(test_instance.validators_cache_key(catalog_url))
+        test_instance.commit_validators()
+
+        # assert:
+        self.assertEqual(result, {'id': 'catalog_id', 'items': []})
+        self.assertIsNone(stored_before_commit)
+        self.assertEqual(
+            cache.get(test_instance.validators_cache_key(catalog_url)),
+            {'If-None-Match': '"etag"', 'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+        )
+
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_validators_cache_key(self, mock_token, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+        other_tenant = EdflexOauthClient(dict(mock_get_edflex_configuration(), client_id='200'))
+        resource_url = 'https://test.base.url/api/resource/resources/resource_id'
+
+        # act:
+        key = test_instance.validators_cache_key(resource_url, 'catalog_id_1')
+
+        # assert:
+        self.assertEqual(key, test_instance.validators_cache_key(resource_url, 'catalog_id_1'))
+        self.assertNotEqual(key, test_instance.validators_cache_key(resource_url, 'catalog_id_2'))
+        self.assertNotEqual(key, other_tenant.validators_cache_key(resource_url, 'catalog_id_1'))
+
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_discard_catalog_validators(self, mock_token, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+        test_instance.stash_validators(
+            'https://test.base.url/api/selection/catalogs/catalog_id', {'ETag': '"catalog"'}
+        )
+        test_instance.stash_validators(
+            'https://test.base.url/api/resource/resources/resource_id', {'ETag': '"resource"'}, 'catalog_id'
+        )
+
+        # act:
+        test_instance.discard_catalog_validators('catalog_id')
+        test_instance.commit_validators()
+
+        # assert:
+        self.assertIsNone(cache.get(test_instance.validators_cache_key(
+            'https://test.base.url/api/selection/catalogs/catalog_id'
+        )))
+        self.assertEqual(
+            cache.get(test_instance.validators_cache_key(
+                'https://test.base.url/api/resource/resources/resource_id', 'catalog_id'
+            )),
+            {'If-None-Match': '"resource"'}
+        )
+
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_get_resources(self, mock_fetch_token, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+        test_instance.get_resource = mock.Mock(
+            side_effect=lambda resource_id, conditional, catalog_id: {'id': resource_id, 'conditional': conditional}
+        )
+        rate_limiter = mock.Mock()
+        resource_ids = ['resource_id_{}'.format(i) for i in range(10)]
+
+        # act:
+        result = list(test_instance.get_resources(
+            resource_ids, conditional_ids={'resource_id_0'}, concurrency=3, rate_limiter=rate_limiter,
+            catalog_id='catalog_id'
+        ))
+
+        # assert:
+        self.assertEqual(test_instance.get_resource.call_count, 10)
+        test_instance.get_resource.assert_any_call('resource_id_1', conditional=False, catalog_id='catalog_id')
+        self.assertEqual(rate_limiter.wait.call_count, 10)
+        self.assertEqual(
+            result,
+            [
+                (resource_id, {'id': resource_id, 'conditional': resource_id == 'resource_id_0'})
+                for resource_id in resource_ids
+            ]
+        )
+
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_refresh_token_once_for_concurrent_requests(self, mock_fetch_token, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+        expired_token = test_instance.oauth_client.token = {'access_token': 'expired', 'token_type': 'Bearer'}
+
+        def fetch_token():
+            test_instance.oauth_client.token = {'access_token': 'new', 'token_type': 'Bearer'}
+
+        mock_fetch_token.reset_mock()
+        mock_fetch_token.side_effect = fetch_token
+
+        # act:
+        test_instance.refresh_token(expired_token)
+        test_instance.refresh_token(expired_token)
+
+        # assert:
+        mock_fetch_token.assert_called_once_with()
+        self.assertEqual(test_instance.oauth_client.token['access_token'], 'new')
+
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_refresh_token_waits_for_another_worker(self, mock_fetch_token, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+        expired_token = test_instance.oauth_client.token = {'access_token': 'expired', 'token_type': 'Bearer'}
+        cache.add(test_instance.TOKEN_REFRESH_LOCK_KEY.format(test_instance.token_cache_key), True)
+        mock_fetch_token.reset_mock()
+
+        def refreshed_by_another_worker(delay):
+            test_instance.cache_token({'access_token': 'new', 'token_type': 'Bearer', 'expires_in': 3600})
+
+        # act:
+        with mock.patch('edflex.api.time.sleep', side_effect=refreshed_by_another_worker) as mock_sleep:
+            test_instance.refresh_token(expired_token)
+
+        # assert:
+        mock_sleep.assert_called_once_with(test_instance.TOKEN_REFRESH_POLL_INTERVAL)
+        mock_fetch_token.assert_not_called()
+        self.assertEqual(test_instance.oauth_client.token['access_token'], 'new')
+
+    @mock.patch('edflex.api.EdflexOauthClient.refresh_token')
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_get_gives_up_when_token_stays_expired(self, mock_fetch_token, mock_refresh_token,
+                                                   mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+        mock_refresh_token.reset_mock()
+        mock_get = test_instance.oauth_client.get = mock.Mock(side_effect=TokenExpiredError())
+
+        # act:
+        result = test_instance.get_resource('resource_id')
+
+        # assert:
+        self.assertIsNone(result)
+        self.assertEqual(mock_get.call_count, api.TOKEN_MAX_REFRESHES + 1)
+        self.assertEqual(mock_refresh_token.call_count, api.TOKEN_MAX_REFRESHES)
+
+    @mock.patch('edflex.api.EdflexOauthClient.refresh_token')
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_get_refreshes_expiring_token(self, mock_fetch_token, mock_refresh_token, mock_get_edflex_configuration):
+        # arrange:
+        test_instance = EdflexOauthClient(mock_get_edflex_configuration())
+        mock_refresh_token.reset_mock()
+        expiring_token = {'access_token': 'token', 'token_type': 'Bearer', 'expires_at': time.time() + 10}
+        test_instance.oauth_client.token = expiring_token
+        mock_get = test_instance.oauth_client.get = mock.Mock(
+            return_value=mock.Mock(status_code=200, json=mock.Mock(return_value={'id': 'resource_id'}))
+        )
+
+        # act:
+        result = test_instance.get_resource('resource_id')
+
+        # assert:
+        mock_refresh_token.assert_called_once_with(expiring_token)
+        mock_get.assert_called_once()
+        self.assertEqual(result, {'id': 'resource_id'})
+
+
 class TestUtils(TestCase):
 
     @mock.patch('openedx.core.djangoapps.site_configuration.helpers.get_value', return_value='test_value')
@@ -345,57 +744,709 @@ class TestUtils(TestCase):
         self.assertEqual(mock_get_value_for_org.call_count, 4)
         self.assertEqual(result, 'configuration')
 
+    @mock.patch('edflex.utils.cache')
+    @mock.patch('edflex.utils.EdflexOauthClient')
+    def test_get_catalog_ids_from_cache(self, mock_edflex_oauth_client, mock_cache):
+        # arrange:
+        mock_cache.get.return_value = ['catalog_id']
+        config = {'client_id': '100', 'locale': 'en', 'base_api_url': 'https://test.base.url'}
 
-class TestTasks(TestCase):
+        # act:
+        result = get_catalog_ids(config)
 
-    @mock.patch('edflex.tasks.EDFLEX_CLIENT_ID', None)
-    @mock.patch('edflex.tasks.EDFLEX_CLIENT_SECRET', None)
-    @mock.patch('edflex.tasks.EDFLEX_BASE_API_URL', None)
-    @mock.patch('edflex.tasks.fetch_resources')
-    def test_fetch_edflex_data_with_site_configurations(self, mock_fetch_resources):
+        # assert:
+        mock_cache.get.assert_called_once_with('edflex.catalog_ids.https://test.base.url.100.en')
+        mock_edflex_oauth_client.assert_not_called()
+        self.assertEqual(result, ['catalog_id'])
+
+    @mock.patch('edflex.utils.cache')
+    @mock.patch('edflex.utils.EdflexOauthClient', return_value=mock.Mock(
+        get_catalogs=mock.Mock(return_value=[{'id': 'catalog_id', 'title': 'Catalog'}])
+    ))
+    def test_get_catalog_ids_when_not_cached(self, mock_edflex_oauth_client, mock_cache):
         # arrange:
-        with mock.patch('openedx.core.djangoapps.site_configuration.models.SiteConfiguration.objects.filter',
-                        return_value=[mock.Mock(), mock.Mock(), mock.Mock()]) as site_configuration_filter:
-            # act:
-            fetch_edflex_data()
+        mock_cache.get.return_value = None
+        config = {'client_id': '100', 'locale': 'en', 'base_api_url': 'https://test.base.url'}
+
+        # act:
+        result = get_catalog_ids(config)
+
+        # assert:
+        mock_edflex_oauth_client.assert_called_once_with(config, timeout=5, max_retries=0)
+        mock_cache.set.assert_called_once_with(
+            'edflex.catalog_ids.https://test.base.url.100.en', ['catalog_id'], 60 * 60 * 24
+        )
+        self.assertEqual(result, ['catalog_id'])
+
+    @mock.patch('edflex.utils.time.sleep')
+    @mock.patch('edflex.utils.time.time', return_value=100)
+    def test_rate_limiter(self, mock_time, mock_sleep):
+        # arrange:
+        rate_limiter = RateLimiter(4)
+
+        # act:
+        rate_limiter.wait()
+        rate_limiter.wait()
+        rate_limiter.wait()
+
+        # assert:
+        self.assertEqual(mock_sleep.call_args_list, [mock.call(0.25), mock.call(0.5)])
+
+    @mock.patch('edflex.utils.time.sleep')
+    def test_rate_limiter_unlimited(self, mock_sleep):
+        # act:
+        RateLimiter(0).wait()
+
+        # assert:
+        mock_sleep.assert_not_called()
+
+    def test_clean_text(self):
+        # act + assert:
+        self.assertEqual(clean_text(u'Python \U0001F40D in 10 steps \u2705'), u'Python in 10 steps')
+        self.assertEqual(clean_text(u'Team \U0001F469\u200D\U0001F4BB  lead\n'), u'Team lead')
+        self.assertEqual(clean_text(u'\U0001F1EB\U0001F1F7 Keycap 1\uFE0F\u20E3 \u00A9'), u'Keycap')
+        self.assertEqual(clean_text(u'Caf\u00e9 \u2192 10 #1'), u'Caf\u00e9 \u2192 10 #1')
+        symbols = u'\u2713 \u2605 \u2717 \u266a \u2776'
+        self.assertEqual(clean_text(symbols + u' \u2714'), symbols)
+        self.assertEqual(clean_text(u'a' * 254 + u' b'), u'a' * 254)
+        self.assertEqual(clean_text(u'a' * 254 + u' b ', max_length=None), u'a' * 254 + u' b')
+        self.assertEqual(clean_text(None), None)
+
+    @mock.patch('edflex.utils.threading.Thread')
+    def test_sync_lease(self, mock_thread):
+        # arrange:
+        cache.clear()
+        config = {'client_id': 'client_id', 'locale': 'en', 'base_api_url': 'base_api_url'}
+        lease = SyncLease(config, timeout=60)
+
+        # act:
+        acquired = lease.acquire()
+
+        # assert:
+        self.assertTrue(acquired)
+        mock_thread.assert_called_once_with(target=lease.keep_alive)
+        mock_thread().start.assert_called_once_with()
+        self.assertFalse(SyncLease(config).acquire())
+        self.assertTrue(lease.renew())
+
+        lease.release()
+        self.assertIsNone(cache.get(get_sync_lock_key(config)))
+
+    @mock.patch('edflex.utils.threading.Thread')
+    def test_sync_lease_taken_over(self, mock_thread):
+        # arrange:
+        cache.clear()
+        config = {'client_id': 'client_id', 'locale': 'en', 'base_api_url': 'base_api_url'}
+        lease = SyncLease(config, timeout=60)
+        lease.acquire()
+        cache.set(get_sync_lock_key(config), 'other_token')
+
+        # act:
+        renewed = lease.renew()
+        lease.release()
+
+        # assert:
+        self.assertFalse(renewed)
+        self.assertEqual(cache.get(get_sync_lock_key(config)), 'other_token')
+
+
+class TestMetrics(TestCase):
+
+    def setUp(self):
+        self.backend = metrics.InMemoryBackend()
+        metrics.set_backend(self.backend)
+
+    def tearDown(self):
+        metrics.set_backend(None)
+
+    @mock.patch('edflex.metrics.time.time', side_effect=[10, 12.5])
+    def test_timer(self, mock_time):
+        # act:
+        with metrics.timer('sync_phase_seconds', sync='fetch_resources', phase='list'):
+            pass
+        metrics.increment('api_requests', endpoint='resource', status=200)
+        metrics.increment('api_requests', 2, endpoint='resource', status=200)
+
+        # assert:
+        self.assertEqual(
+            self.backend.timings[('sync_phase_seconds', (('phase', 'list'), ('sync', 'fetch_resources')))],
+            [2.5]
+        )
+        self.assertEqual(self.backend.counter_value('api_requests', endpoint='resource', status=200), 3)
+
+    def test_timed_iter(self):
+        # act:
+        items = list(metrics.timed_iter(iter([1, 2, 3]), 'sync_phase_seconds', phase='list'))
+
+        # assert:
+        self.assertEqual(items, [1, 2, 3])
+        self.assertEqual(len(self.backend.timings[('sync_phase_seconds', (('phase', 'list'),))]), 1)
+
+    def test_prometheus_render(self):
+        # arrange:
+        backend = metrics.PrometheusBackend(PREFIX='edflex')
+        backend.increment('api_requests', 2, {'endpoint': 'resource'})
+        backend.timing('api_request_seconds', 0.02, {'endpoint': 'resource'})
+
+        # act:
+        text = backend.render()
+
+        # assert:
+        self.assertIn(u'# TYPE edflex_api_requests counter\nedflex_api_requests{endpoint="resource"} 2\n', text)
+        self.assertIn(u'edflex_api_request_seconds_bucket{endpoint="resource",le="0.01"} 0\n', text)
+        self.assertIn(u'edflex_api_request_seconds_bucket{endpoint="resource",le="0.025"} 1\n', text)
+        self.assertIn(u'edflex_api_request_seconds_count{endpoint="resource"} 1\n', text)
+
+    def test_statsd_send(self):
+        # arrange:
+        backend = metrics.StatsdBackend(PREFIX='edflex', HOST='statsd', PORT=8125)
+        backend.socket = mock.Mock()
+
+        # act:
+        backend.timing('api_request_seconds', 0.25, {'endpoint': 'resource'})
+
+        # assert:
+        backend.socket.sendto.assert_called_once_with(b'edflex.api_request_seconds.resource:250|ms', ('statsd', 8125))
+
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token', return_value='mocked_token')
+    def test_api_request_metrics(self, mock_fetch_token):
+        # arrange:
+        edflex_client = EdflexOauthClient({
+            'client_id': '100', 'client_secret': 'secret', 'locale': 'en', 'base_api_url': 'https://test.base.url'
+        })
+        edflex_client.oauth_client.get = mock.Mock(side_effect=[
+            mock.Mock(status_code=503, headers={'Retry-After': '0'}),
+            mock.Mock(status_code=200, json=mock.Mock(return_value={'id': 'resource_id'})),
+        ])
+
+        # act:
+        with mock.patch('edflex.api.time.sleep'):
+            edflex_client.get_resource('resource_id')
+
+        # assert:
+        self.assertEqual(self.backend.counter_value('api_requests', endpoint='resource', status=503), 1)
+        self.assertEqual(self.backend.counter_value('api_requests', endpoint='resource', status=200), 1)
+        self.assertEqual(self.backend.counter_value('api_retries', endpoint='resource'), 1)
+        self.assertEqual(len(self.backend.timings[('api_request_seconds', (('endpoint', 'resource'),))]), 2)
+
+
+class TestBenchmark(TestCase):
+
+    def test_fake_edflex_data(self):
+        # arrange:
+        data = FakeEdflexData(10, catalog_count=3, seed=1)
+
+        # act:
+        catalog = data.catalog('benchmark-catalog-1')
+        data.add_resources(5)
+
+        # assert:
+        self.assertEqual([catalog['id'] for catalog in data.catalogs()], [
+            'benchmark-catalog-0', 'benchmark-catalog-1', 'benchmark-catalog-2'
+        ])
+        self.assertEqual(
+            [item['resource']['id'] for item in catalog['items']],
+            ['benchmark-resource-1', 'benchmark-resource-4', 'benchmark-resource-7']
+        )
+        self.assertEqual(
+            data.resource('benchmark-resource-4'),
+            FakeEdflexData(10, seed=1).resource('benchmark-resource-4')
+        )
+        self.assertEqual(data.resource('benchmark-resource-14')['id'], 'benchmark-resource-14')
+        self.assertIsNone(data.resource('benchmark-resource-15'))
+        self.assertEqual(data.version, 1)
+
+    @mock.patch('edflex.benchmark.current_memory', side_effect=[100.0, 150.0])
+    def test_memory_sampler(self, mock_current_memory):
+        # act:
+        with MemorySampler(interval=60) as memory:
+            pass
+
+        # assert:
+        self.assertEqual(mock_current_memory.call_count, 2)
+        self.assertEqual(memory.growth, 50.0)
+
+    def test_query_counter(self):
+        # arrange:
+        db = mock.Mock()
+        db.make_cursor.side_effect = db.make_debug_cursor.side_effect = lambda cursor: cursor
+        make_cursor = db.make_cursor
+
+        # act:
+        with QueryCounter(db) as queries:
+            db.make_cursor(mock.Mock()).execute('SELECT 1')
+            db.make_debug_cursor(mock.Mock()).executemany('INSERT 1', [(1,), (2,)])
+
+        # assert:
+        self.assertEqual(queries.count, 2)
+        self.assertIs(db.make_cursor, make_cursor)
+
+
+class TestSearch(TestCase):
+
+    def test_tokenize(self):
+        # act + assert:
+        self.assertEqual(
+            tokenize(u"L'apprentissage du Python pour les D\u00e9butants", 'fr'),
+            [u'apprentissage', u'python', u'debutants']
+        )
+        self.assertEqual(tokenize(u'The art of Leadership', 'en-US'), [u'art', u'leadership'])
+        self.assertEqual(tokenize(u'\u00dcber die F\u00fchrung'), [u'uber', u'fuhrung'])
+        self.assertEqual(
+            tokenize(u'Python \u5165\u95e8\u6559\u7a0b', 'zh'),
+            [u'python', u'\u5165\u95e8', u'\u95e8\u6559', u'\u6559\u7a0b']
+        )
+        self.assertEqual(tokenize(None), [])
 
-            # assert:
-            site_configuration_filter.assert_called_once_with(enabled=True)
-            self.assertEqual(mock_fetch_resources.call_count, 3)
+    @mock.patch('edflex.search.ResourceToken.objects')
+    @mock.patch('edflex.search.ResourceCategory.objects.filter')
+    @mock.patch('edflex.search.Resource.objects.filter')
+    def test_index_resources(self, mock_resource_filter, mock_resource_category_filter, mock_token_objects):
+        # arrange:
+        mock_resource_filter.return_value.values_list.return_value = [(1, u'Python for data science', 'en')]
+        mock_resource_category_filter.return_value.values_list.return_value = [(1, u'Data')]
+        mock_token_objects.filter.return_value.values_list.return_value = [
+            (10, 1, u'python', 3),
+            (11, 1, u'data', 3),
+            (12, 1, u'old', 3),
+        ]
+
+        # act:
+        index_resources([1])
+
+        # assert:
+        mock_resource_filter.assert_called_once_with(id__in=[1])
+        mock_resource_category_filter.assert_called_once_with(resource_id__in=[1])
+        mock_token_objects.filter.assert_any_call(resource_id__in=[1])
+        deleted_token_pks = [
+            kwargs['id__in'] for _, kwargs in mock_token_objects.filter.call_args_list if 'id__in' in kwargs
+        ]
+        self.assertEqual([sorted(token_pks) for token_pks in deleted_token_pks], [[11, 12]])
+        mock_token_objects.filter().delete.assert_called_once_with()
+        created_tokens = mock_token_objects.bulk_create.call_args[0][0]
+        self.assertEqual(
+            sorted((token.resource_id, token.token, token.weight) for token in created_tokens),
+            [(1, u'data', 4), (1, u'science', 3)]
+        )
+
+    def test_search_when_only_stop_words(self):
+        # arrange:
+        resources = mock.Mock()
+
+        # act:
+        result = search(resources, u' the ', 'en')
+
+        # assert:
+        resources.filter.assert_called_once_with(title__icontains=u'the')
+        self.assertEqual(result, resources.filter().annotate())
+
+
+class TestTasks(TestCase):
 
     @mock.patch('edflex.tasks.EDFLEX_CLIENT_ID', 'client_id')
     @mock.patch('edflex.tasks.EDFLEX_CLIENT_SECRET', 'client_secret')
-    @mock.patch('edflex.tasks.EDFLEX_LOCALE', ['en'])
+    @mock.patch('edflex.tasks.EDFLEX_LOCALE', 'en')
     @mock.patch('edflex.tasks.EDFLEX_BASE_API_URL', 'base_api_url')
+    def test_get_tenant_configurations(self):
+        # arrange:
+        site_values = [
+            {'EDFLEX_CLIENT_ID': 'client_id', 'EDFLEX_CLIENT_SECRET': 'client_secret',
+             'EDFLEX_BASE_API_URL': 'base_api_url'},
+            {'EDFLEX_CLIENT_ID': 'client_id_2', 'EDFLEX_CLIENT_SECRET': 'client_secret_2',
+             'EDFLEX_BASE_API_URL': 'base_api_url', 'EDFLEX_LOCALE': 'fr'},
+            {'EDFLEX_CLIENT_ID': 'client_id_2', 'EDFLEX_CLIENT_SECRET': 'client_secret_2',
+             'EDFLEX_BASE_API_URL': 'base_api_url', 'EDFLEX_LOCALE': 'fr'},
+            {'EDFLEX_CLIENT_ID': 'client_id_3'},
+        ]
+        site_configurations = [
+            mock.Mock(get_value=lambda name, default=None, values=values: values.get(name, default))
+            for values in site_values
+        ]
+
+        with mock.patch('openedx.core.djangoapps.site_configuration.models.SiteConfiguration.objects.filter',
+                        return_value=site_configurations) as site_configuration_filter:
+            # act:
+            configs = get_tenant_configurations()
+
+        # assert:
+        site_configuration_filter.assert_called_once_with(enabled=True)
+        self.assertEqual(configs, [
+            {'client_id': 'client_id', 'client_secret': 'client_secret', 'locale': 'en',
+             'base_api_url': 'base_api_url'},
+            {'client_id': 'client_id_2', 'client_secret': 'client_secret_2', 'locale': 'fr',
+             'base_api_url': 'base_api_url'},
+        ])
+
+    @mock.patch('edflex.tasks.chord')
+    @mock.patch('edflex.tasks.log_sync_results')
+    @mock.patch('edflex.tasks.fetch_tenant_resources')
+    @mock.patch('edflex.tasks.get_tenant_configurations', return_value=[{'client_id': '1'}, {'client_id': '2'}])
+    def test_fetch_edflex_data(
+            self,
+            mock_get_tenant_configurations,
+            mock_fetch_tenant_resources,
+            mock_log_sync_results,
+            mock_chord
+    ):
+        # act:
+        fetch_edflex_data()
+
+        # assert:
+        self.assertEqual(
+            mock_fetch_tenant_resources.s.call_args_list,
+            [mock.call({'client_id': '1'}), mock.call({'client_id': '2'})]
+        )
+        mock_chord.assert_called_once_with([mock_fetch_tenant_resources.s()] * 2)
+        mock_log_sync_results.s.assert_called_once_with('fetch_edflex_data')
+        mock_chord().assert_called_once_with(mock_log_sync_results.s())
+
+    @mock.patch('edflex.tasks.chord')
+    @mock.patch('edflex.tasks.get_tenant_configurations', return_value=[])
+    def test_fetch_edflex_data_without_tenants(self, mock_get_tenant_configurations, mock_chord):
+        # act:
+        fetch_edflex_data()
+
+        # assert:
+        mock_chord.assert_not_called()
+
+    @mock.patch('edflex.tasks.fetch_resources')
+    def test_fetch_tenant_resources(self, mock_fetch_resources):
+        # arrange:
+        cache.clear()
+        config = {'client_id': 'client_id', 'client_secret': 'client_secret', 'locale': 'en',
+                  'base_api_url': 'base_api_url'}
+
+        # act:
+        result = fetch_tenant_resources(config)
+
+        # assert:
+        mock_fetch_resources.assert_called_once_with('client_id', 'client_secret', 'en', 'base_api_url')
+        self.assertEqual(result, {'tenant': u'base_api_url client_id en', 'status': 'done'})
+        self.assertIsNone(cache.get(get_sync_lock_key(config)))
+
+    @mock.patch('edflex.tasks.fetch_resources', side_effect=ValueError)
+    def test_fetch_tenant_resources_when_sync_fails(self, mock_fetch_resources):
+        # arrange:
+        cache.clear()
+        config = {'client_id': 'client_id', 'client_secret': 'client_secret', 'locale': 'en',
+                  'base_api_url': 'base_api_url'}
+
+        # act:
+        result = fetch_tenant_resources(config)
+
+        # assert:
+        self.assertEqual(result['status'], 'failed')
+        self.assertIsNone(cache.get(get_sync_lock_key(config)))
+
+    @mock.patch('edflex.tasks.fetch_tenant_resources.retry', side_effect=Retry)
+    @mock.patch('edflex.tasks.time.time', return_value=100)
     @mock.patch('edflex.tasks.fetch_resources')
-    @mock.patch('openedx.core.djangoapps.site_configuration.models.SiteConfiguration.objects.filter', return_value=[])
-    def test_fetch_edflex_data_with_default_settings(self, mock_site_configuration_filter, mock_fetch_resources):
+    def test_fetch_tenant_resources_when_locked(self, mock_fetch_resources, mock_time, mock_retry):
+        # arrange:
+        cache.clear()
+        config = {'client_id': 'client_id', 'client_secret': 'client_secret', 'locale': 'en',
+                  'base_api_url': 'base_api_url'}
+        cache.add(get_sync_lock_key(config), True)
+
+        # act:
+        fetch_tenant_resources.apply(args=[config])
+
+        # assert:
+        mock_fetch_resources.assert_not_called()
+        mock_retry.assert_called_once_with(
+            kwargs={'config': config, 'requested': 100}, countdown=EDFLEX_SYNC_LEASE_TIMEOUT
+        )
+
+    @mock.patch('edflex.tasks.SyncState.objects.filter')
+    @mock.patch('edflex.tasks.fetch_resources')
+    def test_fetch_tenant_resources_when_another_sync_finished(self, mock_fetch_resources, mock_sync_state_filter):
+        # arrange:
+        cache.clear()
+        config = {'client_id': 'client_id', 'client_secret': 'client_secret', 'locale': 'en',
+                  'base_api_url': 'base_api_url'}
+        mock_sync_state_filter.return_value.exists.return_value = True
+
+        # act:
+        result = fetch_tenant_resources(config, requested=100)
+
+        # assert:
+        mock_fetch_resources.assert_not_called()
+        mock_sync_state_filter.assert_called_once_with(
+            base_api_url='base_api_url', client_id='client_id', locale='en',
+            finished__gte=datetime.fromtimestamp(100, timezone.utc)
+        )
+        self.assertEqual(result, {'tenant': u'base_api_url client_id en', 'status': 'locked'})
+
+    @mock.patch('edflex.tasks.fetch_new_resources_and_delete_old_resources')
+    def test_fetch_new_tenant_resources_when_locked(self, mock_fetch_new_resources_and_delete_old_resources):
+        # arrange:
+        cache.clear()
+        config = {'client_id': 'client_id', 'client_secret': 'client_secret', 'locale': 'en',
+                  'base_api_url': 'base_api_url'}
+        cache.add(get_sync_lock_key(config), True)
+
+        # act:
+        result = fetch_new_tenant_resources(config)
+
+        # assert:
+        mock_fetch_new_resources_and_delete_old_resources.assert_not_called()
+        self.assertEqual(result['status'], 'locked')
+        self.assertTrue(cache.get(get_sync_lock_key(config)))
+
+    @mock.patch('edflex.tasks.cache_catalog_ids')
+    @mock.patch('edflex.models.Resource.objects.filter')
+    @mock.patch('edflex.tasks.save_resource_batch')
+    @mock.patch('edflex.api.OAuth2Session.get')
+    @mock.patch('edflex.api.EdflexOauthClient.fetch_token')
+    def test_fetch_new_resources_discards_validators_of_failed_catalog_stream(
+            self,
+            mock_fetch_token,
+            mock_oauth_get,
+            mock_save_resource_batch,
+            mock_resource_filter,
+            mock_cache_catalog_ids,
+    ):
+        # arrange:
+        cache.clear()
+        base_api_url = 'https://test.base.url'
+        responses = {
+            base_api_url + '/api/selection/catalogs': mock.Mock(status_code=200, json=mock.Mock(return_value=[
+                {'id': 'catalog_id_1', 'title': 'Catalog title1'}, {'id': 'catalog_id_2', 'title': 'Catalog title2'}
+            ])),
+            # the stream of the first catalog is cut after its headers
+            base_api_url + '/api/selection/catalogs/catalog_id_1': mock.Mock(
+                status_code=200, headers={'ETag': '"catalog_1"'}, encoding='utf-8',
+                iter_content=mock.Mock(return_value=iter(['{"items": [{"resource": {"id": "res']))
+            ),
+            base_api_url + '/api/selection/catalogs/catalog_id_2': mock.Mock(
+                status_code=200, headers={'ETag': '"catalog_2"'}, encoding='utf-8',
+                iter_content=mock.Mock(return_value=iter(['{"items": []}']))
+            ),
+        }
+        mock_oauth_get.side_effect = lambda url, **kwargs: responses[url]
+        mock_resource_filter.return_value.values_list.return_value = [('resource_id', 7)]
+
+        # act:
+        fetch_new_resources_and_delete_old_resources('client_id', 'client_secret', 'en', base_api_url)
+
+        # assert:
+        edflex_client = EdflexOauthClient(
+            {'client_id': 'client_id', 'client_secret': 'client_secret', 'locale': 'en', 'base_api_url': base_api_url}
+        )
+        mock_save_resource_batch.assert_not_called()
+        self.assertIsNone(cache.get(edflex_client.validators_cache_key(
+            base_api_url + '/api/selection/catalogs/catalog_id_1'
+        )))
+        self.assertEqual(
+            cache.get(edflex_client.validators_cache_key(base_api_url + '/api/selection/catalogs/catalog_id_2')),
+            {'If-None-Match': '"catalog_2"'}
+        )
+
+    @mock.patch('edflex.tasks.get_sync_state', return_value=mock.Mock(started='now', completed_catalogs='[]'))
+    @mock.patch('edflex.tasks.cache_catalog_ids')
+    @mock.patch('edflex.tasks.timezone.now', return_value='now')
+    @mock.patch('edflex.tasks.delete_in_batches')
+    @mock.patch('edflex.tasks.delete_stale')
+    @mock.patch('edflex.models.Category.objects')
+    @mock.patch('edflex.models.Resource.objects.filter')
+    @mock.patch('edflex.tasks.save_catalog_resources', return_value=(['obj_resource_id'], ['obj_category_id']))
+    @mock.patch('edflex.tasks.EdflexOauthClient')
+    def test_fetch_resources_when_catalog_stream_fails(
+            self,
+            mock_edflex_oauth_client,
+            mock_save_catalog_resources,
+            mock_resource_filter,
+            mock_category_objects,
+            mock_delete_stale,
+            mock_delete_in_batches,
+            mock_now,
+            mock_cache_catalog_ids,
+            mock_get_sync_state,
+    ):
+        # arrange:
+        def r_items():
+            yield {'resource': {'id': 'resource_id'}}
+            raise requests.ConnectionError('connection reset')
+
+        mock_edflex_oauth_client().get_catalogs.return_value = [{'id': 'catalog_id', 'title': 'Catalog title'}]
+        mock_edflex_oauth_client().get_catalog_items.return_value = r_items()
+        mock_resource_filter.return_value.values_list.return_value = [('resource_id', None, None)]
+
+        # act:
+        fetch_resources('client_id', 'client_secret', 'en', 'base_api_url')
+
+        # assert:
+        mock_save_catalog_resources.assert_not_called()
+        mock_edflex_oauth_client().discard_catalog_validators.assert_called_once_with('catalog_id')
+        mock_edflex_oauth_client().commit_validators.assert_not_called()
+        mock_category_objects.filter.assert_called_once_with(catalog_id='catalog_id')
+        mock_category_objects.filter().update.assert_called_once_with(last_seen='now')
+        # the sync is incomplete, nothing is swept until it's resumed
+        mock_delete_stale.assert_not_called()
+        mock_delete_in_batches.assert_not_called()
+        self.assertEqual(mock_get_sync_state().completed_catalogs, '[]')
+
+    @mock.patch('edflex.tasks.cache_catalog_ids')
+    @mock.patch('edflex.tasks.timezone.now', return_value='now')
+    @mock.patch('edflex.tasks.delete_in_batches')
+    @mock.patch('edflex.tasks.delete_stale')
+    @mock.patch('edflex.models.Category.objects.filter')
+    @mock.patch('edflex.models.Resource.objects.filter')
+    @mock.patch('edflex.tasks.save_resource_batch')
+    @mock.patch('edflex.tasks.get_sync_state', return_value=mock.Mock(started='now', completed_catalogs='[]'))
+    @mock.patch('edflex.tasks.EdflexOauthClient')
+    def test_fetch_resources_when_catalog_not_fetched(
+            self,
+            mock_edflex_oauth_client,
+            mock_get_sync_state,
+            mock_save_resource_batch,
+            mock_resource_filter,
+            mock_category_filter,
+            mock_delete_stale,
+            mock_delete_in_batches,
+            mock_now,
+            mock_cache_catalog_ids,
+    ):
+        # arrange:
+        mock_edflex_oauth_client().get_catalogs.return_value = [{'id': 'catalog_id', 'title': 'Catalog title'}]
+        mock_edflex_oauth_client().get_catalog_items.return_value = None
+        mock_resource_filter.return_value.values_list.return_value = [('resource_id', 'now', None)]
+
+        # act:
+        fetch_resources('client_id', 'client_secret', 'en', 'base_api_url')
+
+        # assert:
+        mock_save_resource_batch.assert_not_called()
+        mock_category_filter.assert_called_once_with(catalog_id='catalog_id')
+        mock_category_filter().update.assert_called_once_with(last_seen='now')
+        # the resources of the catalog are kept until it's fetched
+        mock_delete_stale.assert_not_called()
+        mock_delete_in_batches.assert_not_called()
+        mock_edflex_oauth_client().commit_validators.assert_not_called()
+        self.assertEqual(mock_get_sync_state().completed_catalogs, '[]')
+
+    @mock.patch('edflex.tasks.cache_catalog_ids')
+    @mock.patch('edflex.tasks.delete_in_batches')
+    @mock.patch('edflex.tasks.delete_stale')
+    @mock.patch('edflex.models.Resource.objects.filter')
+    @mock.patch('edflex.tasks.save_resource_batch',
+                side_effect=lambda sync_name, client, catalog, ids, **kwargs: len(ids))
+    @mock.patch('edflex.tasks.get_sync_state')
+    @mock.patch('edflex.tasks.EdflexOauthClient')
+    def test_fetch_resources_resumes_interrupted_sync(
+            self,
+            mock_edflex_oauth_client,
+            mock_get_sync_state,
+            mock_save_resource_batch,
+            mock_resource_filter,
+            mock_delete_stale,
+            mock_delete_in_batches,
+            mock_cache_catalog_ids,
+    ):
+        # arrange:
+        started = datetime(2026, 1, 1)
+        state = mock_get_sync_state.return_value = mock.Mock(
+            started=started, completed_catalogs='["catalog_id_1"]', catalog_ids='[]', finished=None
+        )
+        mock_edflex_oauth_client().get_catalogs.return_value = [
+            {'id': 'catalog_id_1', 'title': 'Catalog title1'},
+            {'id': 'catalog_id_2', 'title': 'Catalog title2'},
+        ]
+        mock_edflex_oauth_client().get_catalog_items.return_value = [
+            {'resource': {'id': 'saved_resource_id'}}, {'resource': {'id': 'resource_id'}}
+        ]
+        mock_resource_filter.return_value.values_list.return_value = [
+            ('saved_resource_id', started, datetime(2026, 1, 2)),
+            ('resource_id', started, datetime(2025, 12, 25)),
+        ]
+
+        # act:
+        fetch_resources('client_id', 'client_secret', 'en', 'base_api_url')
+
+        # assert:
+        mock_edflex_oauth_client().get_catalog_items.assert_called_once_with('catalog_id_2', conditional=True)
+        self.assertEqual(mock_save_resource_batch.call_count, 1)
+        self.assertEqual(mock_save_resource_batch.call_args[0][3], ['resource_id'])
+        self.assertEqual(state.resources_synced, 2)
+        self.assertEqual(json.loads(state.completed_catalogs), ['catalog_id_1', 'catalog_id_2'])
+        mock_delete_stale.assert_any_call(mock_resource_filter(), started)
+        mock_delete_in_batches.assert_called_once()
+        self.assertIsNotNone(state.finished)
+
+    @mock.patch('edflex.tasks.timezone.now', return_value=datetime(2026, 1, 2))
+    @mock.patch('edflex.tasks.SyncState.objects.get_or_create')
+    def test_get_sync_state(self, mock_get_or_create, mock_now):
+        # arrange:
+        config = {'client_id': 'client_id', 'client_secret': 'client_secret', 'locale': 'en',
+                  'base_api_url': 'base_api_url'}
+        interrupted_state = mock.Mock(started=datetime(2026, 1, 1, 12), finished=None, catalog_id='catalog_id')
+        finished_state = mock.Mock(started=datetime(2026, 1, 1, 12), finished=datetime(2026, 1, 1, 13))
+        mock_get_or_create.side_effect = [(interrupted_state, False), (finished_state, False)]
+
+        # act:
+        resumed = get_sync_state(config)
+        restarted = get_sync_state(config)
+
+        # assert:
+        mock_get_or_create.assert_called_with(
+            base_api_url='base_api_url', client_id='client_id', locale='en', defaults={'started': datetime(2026, 1, 2)}
+        )
+        self.assertEqual(resumed.started, datetime(2026, 1, 1, 12))
+        interrupted_state.save.assert_not_called()
+        self.assertEqual(restarted.started, datetime(2026, 1, 2))
+        self.assertEqual(restarted.completed_catalogs, '[]')
+        self.assertIsNone(restarted.finished)
+        finished_state.save.assert_called_once_with()
+
+    @mock.patch('edflex.tasks.delete_in_batches')
+    @mock.patch('edflex.models.Resource.objects.filter')
+    def test_delete_stale(self, mock_resource_filter, mock_delete_in_batches):
+        # act:
+        delete_stale(Resource.objects.filter(catalog_id='catalog_id'), 'sync_started')
+
+        # assert:
+        stale_filter = mock_resource_filter().filter.call_args[0][0]
+        self.assertEqual(stale_filter.connector, 'OR')
+        self.assertEqual(stale_filter.children, [('last_seen__lt', 'sync_started'), ('last_seen__isnull', True)])
+        mock_delete_in_batches.assert_called_once_with(mock_resource_filter().filter())
+
+    @mock.patch('edflex.models.Resource.objects.filter')
+    def test_delete_in_batches(self, mock_resource_filter):
+        # arrange:
+        queryset = mock.Mock(model=Resource)
+        queryset.values_list.return_value.__getitem__ = mock.Mock(side_effect=[[1, 2], [3], []])
+
         # act:
-        fetch_edflex_data()
+        delete_in_batches(queryset)
 
         # assert:
-        mock_site_configuration_filter.assert_called_once_with(enabled=True)
-        mock_fetch_resources.assert_called_once_with('client_id', 'client_secret', 'en', 'base_api_url')
+        self.assertEqual(mock_resource_filter.call_args_list, [mock.call(id__in=[1, 2]), mock.call(id__in=[3])])
+        self.assertEqual(mock_resource_filter().delete.call_count, 2)
 
-    @mock.patch('edflex.models.Resource.objects.exclude',
-                return_value=mock.Mock(delete=mock.Mock()))
-    @mock.patch('edflex.models.Category.objects.exclude',
-                return_value=mock.Mock(delete=mock.Mock()))
+    @mock.patch('edflex.tasks.get_sync_state', return_value=mock.Mock(
+        started='now',
+        completed_catalogs='[]',
+        catalog_ids='["catalog_id_1", "removed_catalog_id", "shared_catalog_id"]'
+    ))
+    @mock.patch('edflex.tasks.cache_catalog_ids')
+    @mock.patch('edflex.tasks.timezone.now', return_value='now')
+    @mock.patch('edflex.tasks.delete_in_batches')
+    @mock.patch('edflex.tasks.delete_stale')
+    @mock.patch('edflex.models.Category.objects.filter')
+    @mock.patch('edflex.tasks.SyncState.objects.exclude', return_value=mock.Mock(
+        values_list=mock.Mock(return_value=['["shared_catalog_id"]'])
+    ))
     @mock.patch('edflex.models.Resource.objects.filter',
-                return_value=mock.Mock(exclude=mock.Mock(return_value=mock.Mock(delete=mock.Mock()))))
-    @mock.patch('edflex.models.Category.objects.update_or_create',
-                return_value=(mock.Mock(id='obj_category_id'), mock.Mock()))
-    @mock.patch('edflex.models.Resource.objects.update_or_create',
-                return_value=(mock.Mock(id='obj_resource_id'), mock.Mock()))
+                return_value=mock.Mock(values_list=mock.Mock(return_value=[])))
+    @mock.patch('edflex.tasks.save_catalog_resources',
+                side_effect=lambda catalog, r_resources: (
+                    ['obj_resource_id' for r_resource in r_resources], ['obj_category_id']
+                ))
     @mock.patch('edflex.tasks.EdflexOauthClient', return_value=mock.Mock(
         get_catalogs=mock.Mock(return_value=[{'id': 'catalog_id_1', 'title': 'Catalog title1'},
                                              {'id': 'catalog_id_2', 'title': 'Catalog title2'}
                                              ]),
-        get_catalog=mock.Mock(return_value={'id': 'catalog_id',
-                                            'title': 'Catalog title',
-                                            'items': [
-                                                {'resource': {'id': 'resource_id'}}
-                                            ]}),
+        get_catalog_items=mock.Mock(return_value=[{'resource': {'id': 'resource_id'}}]),
         get_resource=mock.Mock(return_value={'id': 'resource_id',
                                              'title': 'title',
                                              'type': 'type',
@@ -404,14 +1455,20 @@ class TestTasks(TestCase):
                                                  {'id': 'category_id', 'name': 'Category name'}
                                              ]})
     ))
+    @mock.patch('edflex.tasks.fetch_resource_details', side_effect=fetch_resource_details_in_order)
     def test_fetch_resources(
             self,
+            mock_fetch_resource_details,
             mock_edflex_oauth_client,
-            mock_resources_update_or_create,
-            mock_categories_update_or_create,
+            mock_save_catalog_resources,
             mock_resource_filter,
-            mock_category_exclude,
-            mock_resource_exclude,
+            mock_sync_state_exclude,
+            mock_category_filter,
+            mock_delete_stale,
+            mock_delete_in_batches,
+            mock_now,
+            mock_cache_catalog_ids,
+            mock_get_sync_state,
     ):
         # act:
         fetch_resources('client_id', 'client_secret', 'en', 'base_api_url')
@@ -426,47 +1483,301 @@ class TestTasks(TestCase):
             }
         )
         mock_edflex_oauth_client().get_catalogs.assert_called_once_with()
-        self.assertEqual(mock_edflex_oauth_client().get_catalog.call_count, 2)
-        mock_edflex_oauth_client().get_resource.assert_any_call('resource_id')
-
-        self.assertEqual(mock_resources_update_or_create.call_count, 2)
-        mock_resources_update_or_create.assert_any_call(
-            catalog_id='catalog_id_1',
-            resource_id='resource_id',
-            defaults={
-                'title': 'title',
+        self.assertEqual(mock_edflex_oauth_client().get_catalog_items.call_count, 2)
+        # nothing is stored yet, the catalogs are listed in full
+        mock_edflex_oauth_client().get_catalog_items.assert_any_call('catalog_id_1', conditional=False)
+        mock_edflex_oauth_client().get_resource.assert_any_call('resource_id', conditional=False)
+        self.assertEqual(mock_edflex_oauth_client().commit_validators.call_count, 2)
+
+        self.assertEqual(mock_save_catalog_resources.call_count, 2)
+        self.assertEqual(
+            mock_save_catalog_resources.call_args_list[0][0][0],
+            {'id': 'catalog_id_1', 'title': 'Catalog title1'}
+        )
+
+        mock_resource_filter.assert_any_call(catalog_id='catalog_id_2')
+        self.assertEqual(mock_delete_stale.call_args_list, [
+            mock.call(mock_resource_filter(), 'now'),
+            mock.call(mock_resource_filter(), 'now'),
+            mock.call(mock_category_filter(), 'now'),
+        ])
+
+        # only the catalogs removed from this tenant and not listed by another one are deleted
+        mock_sync_state_exclude.assert_called_once_with(id=mock_get_sync_state().id)
+        mock_resource_filter.assert_any_call(catalog_id__in={'removed_catalog_id'})
+        mock_delete_in_batches.assert_called_once_with(mock_resource_filter())
+        mock_category_filter.assert_called_once_with(
+            catalog_id__in={'catalog_id_1', 'catalog_id_2', 'removed_catalog_id'}
+        )
+
+        mock_cache_catalog_ids.assert_called_once_with(
+            {
+                'client_id': 'client_id',
+                'client_secret': 'client_secret',
+                'locale': 'en',
+                'base_api_url': 'base_api_url'
+            },
+            ['catalog_id_1', 'catalog_id_2']
+        )
+        state = mock_get_sync_state()
+        self.assertEqual(json.loads(state.completed_catalogs), ['catalog_id_1', 'catalog_id_2'])
+        self.assertEqual(json.loads(state.catalog_ids), ['catalog_id_1', 'catalog_id_2'])
+        self.assertEqual(state.finished, 'now')
+
+    @mock.patch('edflex.tasks.timezone.now', return_value='now')
+    @mock.patch('edflex.tasks.Category.objects.filter')
+    @mock.patch('edflex.tasks.Resource.objects.filter')
+    @mock.patch('edflex.tasks.index_resources')
+    @mock.patch('edflex.tasks.transaction.atomic')
+    @mock.patch('edflex.tasks.Resource.categories.through.objects')
+    @mock.patch('edflex.tasks.bulk_upsert', side_effect=lambda model, key_field, catalog_id, rows, keep=(): {
+        key: 'pk_{}'.format(key) for key in list(rows) + list(keep)
+    })
+    def test_save_catalog_resources(
+            self,
+            mock_bulk_upsert,
+            mock_through_objects,
+            mock_atomic,
+            mock_index_resources,
+            mock_resource_filter,
+            mock_category_filter,
+            mock_now
+    ):
+        # arrange:
+        mock_through_objects.filter.return_value.values_list.return_value = [
+            ('link_1', 'pk_resource_id', 'pk_category_id'),
+            ('link_2', 'pk_resource_id', 'pk_old_category_id'),
+            ('link_3', 'pk_other_resource_id', 'pk_old_category_id'),
+            ('link_4', 'pk_kept_resource_id', 'pk_kept_category_id'),
+        ]
+        catalog = {'id': 'catalog_id', 'title': 'Catalog title'}
+        r_resources = [
+            ('resource_id', {'id': 'resource_id',
+                             'title': 'long ' * 60 + 'title',
+                             'type': 'type',
+                             'language': 'language',
+                             'categories': [
+                                 {'id': 'category_id', 'name': 'Category name'},
+                                 {'id': 'new_category_id', 'name': 'New category name'},
+                                 {'id': 'empty_category_id', 'name': ''},
+                             ]}),
+            ('resource_without_title', {'id': 'resource_without_title'}),
+            ('missing_resource_id', None),
+            ('kept_resource_id', NOT_MODIFIED),
+        ]
+
+        # act:
+        resource_ids, category_ids = save_catalog_resources(catalog, r_resources)
+
+        # assert:
+        self.assertEqual(sorted(resource_ids), ['pk_kept_resource_id', 'pk_missing_resource_id', 'pk_resource_id'])
+        self.assertEqual(sorted(category_ids), ['pk_category_id', 'pk_kept_category_id', 'pk_new_category_id'])
+        mock_bulk_upsert.assert_any_call(Category, 'category_id', 'catalog_id', {
+            'category_id': {'name': 'Category name', 'catalog_title': 'Catalog title'},
+            'new_category_id': {'name': 'New category name', 'catalog_title': 'Catalog title'},
+        })
+        mock_bulk_upsert.assert_any_call(Resource, 'resource_id', 'catalog_id', {
+            'resource_id': {
+                'title': 'long ' * 60 + 'title',
                 'r_type': 'type',
-                'language': 'language'
-            }
+                'language': 'language',
+                'data': json.dumps(r_resources[0][1], sort_keys=True),
+            },
+        }, keep={'kept_resource_id', 'missing_resource_id'})
+        self.assertEqual(
+            sorted(mock_through_objects.filter.call_args_list[0][1]['resource_id__in']),
+            ['pk_kept_resource_id', 'pk_missing_resource_id', 'pk_resource_id']
+        )
+        mock_through_objects.filter.assert_any_call(id__in=['link_2'])
+        mock_through_objects.filter().delete.assert_called_once_with()
+        created_links = mock_through_objects.bulk_create.call_args[0][0]
+        self.assertEqual(
+            [(link.resource_id, link.category_id) for link in created_links],
+            [('pk_resource_id', 'pk_new_category_id')]
+        )
+        mock_index_resources.assert_called_once_with({'pk_resource_id'})
+        self.assertEqual(
+            sorted(mock_resource_filter.call_args_list[0][1]['id__in']), ['pk_kept_resource_id', 'pk_resource_id']
+        )
+        # the resource which failed to be fetched is only marked as seen
+        self.assertEqual(mock_resource_filter.call_args_list[1][1]['id__in'], ['pk_missing_resource_id'])
+        self.assertEqual(mock_resource_filter().update.call_args_list, [
+            mock.call(data_fetched='now', last_seen='now'),
+            mock.call(last_seen='now'),
+        ])
+        self.assertEqual(
+            sorted(mock_category_filter.call_args[1]['id__in']),
+            ['pk_category_id', 'pk_kept_category_id', 'pk_new_category_id']
         )
+        mock_category_filter().update.assert_called_once_with(last_seen='now')
+
+    @mock.patch('edflex.tasks.timezone.now', return_value='now')
+    @mock.patch('edflex.models.Category.objects.bulk_create')
+    @mock.patch('edflex.models.Category.objects.filter')
+    def test_bulk_upsert(self, mock_category_filter, mock_category_bulk_create, mock_now):
+        # arrange:
+        mock_category_filter.return_value.values.return_value = [
+            {'id': 1, 'category_id': 'same', 'name': 'Same', 'catalog_title': 'Catalog'},
+            {'id': 2, 'category_id': 'changed', 'name': 'Old name', 'catalog_title': 'Catalog'},
+            {'id': 4, 'category_id': 'kept', 'name': 'Kept', 'catalog_title': 'Catalog'},
+        ]
+        mock_category_filter.return_value.values_list.return_value = [('same', 1), ('changed', 2), ('new', 3)]
+
+        # act:
+        result = bulk_upsert(Category, 'category_id', 'catalog_id', {
+            'same': {'name': 'Same', 'catalog_title': 'Catalog'},
+            'changed': {'name': 'New name', 'catalog_title': 'Catalog'},
+            'new': {'name': 'New', 'catalog_title': 'Catalog'},
+        }, keep={'kept', 'missing'})
 
-        self.assertEqual(mock_categories_update_or_create.call_count, 2)
-        mock_categories_update_or_create.assert_any_call(
-            category_id='category_id',
-            catalog_id='catalog_id_1',
-            defaults={'name': 'Category name',
-                      'catalog_title': 'Catalog title1'}
+        # assert:
+        self.assertEqual(result, {'same': 1, 'changed': 2, 'new': 3, 'kept': 4})
+        self.assertEqual(
+            sorted(mock_category_filter.call_args_list[0][1]['category_id__in']),
+            ['changed', 'kept', 'missing', 'new', 'same']
         )
+        mock_category_filter.assert_any_call(catalog_id='catalog_id', category_id__in=['new'])
+        mock_category_filter.assert_any_call(id=2)
+        mock_category_filter().update.assert_called_once_with(modified='now', name='New name', catalog_title='Catalog')
+        new_objs = mock_category_bulk_create.call_args[0][0]
+        self.assertEqual([(obj.category_id, obj.name) for obj in new_objs], [('new', 'New')])
 
-        mock_resource_filter.assert_any_call(catalog_id='catalog_id_2')
-        mock_resource_filter().exclude.assert_any_call(id__in=['obj_resource_id'])
-        mock_resource_filter().exclude().delete.assert_called()
+    @mock.patch('edflex.models.Resource.objects.filter')
+    @mock.patch('edflex.tasks.save_catalog_resources')
+    @mock.patch('edflex.tasks.EdflexOauthClient', return_value=mock.Mock(
+        get_catalogs=mock.Mock(return_value=[{'id': 'catalog_id_1', 'title': 'Catalog title1'}]),
+        get_catalog_items=mock.Mock(return_value=NOT_MODIFIED),
+    ))
+    def test_fetch_new_resources_and_delete_old_resources_when_catalog_not_modified(
+            self,
+            mock_edflex_oauth_client,
+            mock_save_catalog_resources,
+            mock_resource_filter,
+    ):
+        # arrange:
+        mock_resource_filter.return_value.values_list.return_value = [('resource_id', 7)]
+
+        # act:
+        fetch_new_resources_and_delete_old_resources('client_id', 'client_secret', 'en', 'base_api_url')
+
+        # assert:
+        mock_edflex_oauth_client().get_catalog_items.assert_called_once_with('catalog_id_1', conditional=True)
+        mock_resource_filter.assert_called_once_with(catalog_id='catalog_id_1')
+        mock_save_catalog_resources.assert_not_called()
+        mock_edflex_oauth_client().commit_validators.assert_not_called()
+
+    @mock.patch('edflex.models.Resource.objects.filter')
+    @mock.patch('edflex.tasks.save_catalog_resources')
+    @mock.patch('edflex.tasks.EdflexOauthClient', return_value=mock.Mock(
+        get_catalogs=mock.Mock(return_value=[{'id': 'catalog_id_1', 'title': 'Catalog title1'}]),
+        get_catalog_items=mock.Mock(return_value=[]),
+    ))
+    def test_fetch_new_resources_and_delete_old_resources_when_catalog_has_no_rows(
+            self,
+            mock_edflex_oauth_client,
+            mock_save_catalog_resources,
+            mock_resource_filter,
+    ):
+        # arrange:
+        mock_resource_filter.return_value.values_list.return_value = []
+
+        # act:
+        fetch_new_resources_and_delete_old_resources('client_id', 'client_secret', 'en', 'base_api_url')
+
+        # assert:
+        # the validators of a catalog removed and listed again don't match any row, it's listed in full
+        mock_edflex_oauth_client().get_catalog_items.assert_called_once_with('catalog_id_1', conditional=False)
+        mock_edflex_oauth_client().commit_validators.assert_called_once_with()
+
+    @mock.patch('edflex.tasks.cache_catalog_ids')
+    @mock.patch('edflex.tasks.delete_in_batches')
+    @mock.patch('edflex.tasks.get_sync_state', return_value=mock.Mock(started='now', completed_catalogs='[]'))
+    @mock.patch('edflex.tasks.EdflexOauthClient', return_value=mock.Mock(get_catalogs=mock.Mock(return_value=[])))
+    def test_syncs_keep_cached_catalog_ids_when_catalogs_not_fetched(
+            self,
+            mock_edflex_oauth_client,
+            mock_get_sync_state,
+            mock_delete_in_batches,
+            mock_cache_catalog_ids,
+    ):
+        # act:
+        fetch_resources('client_id', 'client_secret', 'en', 'base_api_url')
+        fetch_new_resources_and_delete_old_resources('client_id', 'client_secret', 'en', 'base_api_url')
+
+        # assert:
+        mock_cache_catalog_ids.assert_not_called()
+        mock_delete_in_batches.assert_not_called()
+
+    @mock.patch('edflex.tasks.save_catalog_resources')
+    @mock.patch('edflex.tasks.fetch_resource_details', return_value=[
+        ('resource_id_1', {'id': 'resource_id_1'}), ('resource_id_2', None)
+    ])
+    def test_save_resource_batch_discards_catalog_validators_on_failed_fetch(
+            self,
+            mock_fetch_resource_details,
+            mock_save_catalog_resources,
+    ):
+        # arrange:
+        edflex_client = mock.Mock()
+        catalog = {'id': 'catalog_id', 'title': 'Catalog title'}
+
+        # act:
+        result = save_resource_batch('fetch_resources', edflex_client, catalog, ['resource_id_1', 'resource_id_2'])
+
+        # assert:
+        self.assertEqual(result, 2)
+        mock_fetch_resource_details.assert_called_once_with(
+            edflex_client, ['resource_id_1', 'resource_id_2'], conditional_ids=(), catalog_id='catalog_id'
+        )
+        mock_save_catalog_resources.assert_called_once_with(catalog, mock_fetch_resource_details.return_value)
+        edflex_client.discard_catalog_validators.assert_called_once_with('catalog_id')
+
+    @mock.patch('edflex.tasks.EDFLEX_FETCH_RATE_LIMIT', 5)
+    @mock.patch('edflex.tasks.EDFLEX_FETCH_CONCURRENCY', 3)
+    def test_fetch_resource_details(self):
+        # arrange:
+        edflex_client = mock.Mock()
 
-        mock_resource_exclude.assert_any_call(catalog_id__in=['catalog_id_1', 'catalog_id_2'])
-        mock_resource_exclude().delete.assert_called()
+        # act:
+        result = fetch_resource_details(
+            edflex_client, ['resource_id'], conditional_ids={'resource_id'}, catalog_id='catalog_id'
+        )
 
-        mock_category_exclude.assert_any_call(id__in=['obj_category_id', 'obj_category_id'])
-        mock_category_exclude().delete.assert_called()
+        # assert:
+        self.assertEqual(result, edflex_client.get_resources())
+        call = edflex_client.get_resources.call_args_list[0]
+        self.assertEqual(call[0], (['resource_id'],))
+        self.assertEqual(call[1]['conditional_ids'], {'resource_id'})
+        self.assertEqual(call[1]['concurrency'], 3)
+        self.assertEqual(call[1]['rate_limiter'].interval, 0.2)
+        self.assertEqual(call[1]['catalog_id'], 'catalog_id')
 
     @mock.patch('edflex.tasks.get_user_model', return_value=mock.Mock(
         objects=mock.Mock(filter=mock.Mock(return_value=mock.Mock(
             first=mock.Mock(return_value=mock.Mock(id='user_id'))
         )))
     ))
-    @mock.patch('edflex.tasks.CourseOverview.objects.all', return_value=[mock.Mock(id='course_overview_id')])
+    @mock.patch('edflex.tasks.EdflexBlock.objects.filter', return_value=mock.Mock(
+        order_by=mock.Mock(return_value=mock.Mock(
+            values_list=mock.Mock(return_value=[('course-v1:org+course+run', 'usage_key', 'resource_id')])
+        ))
+    ))
+    @mock.patch('edflex.tasks.UsageKey.from_string', return_value='usage_key_object')
     @mock.patch('edflex.tasks.modulestore', return_value=mock.Mock(
         update_item=mock.Mock(),
-        publish=mock.Mock()
+        publish=mock.Mock(),
+        get_item=mock.Mock(return_value=mock.Mock(
+            save=mock.Mock(),
+            location=mock.Mock(block_type='edflex', for_branch=mock.Mock()),
+            resource={'id': 'resource_id',
+                      'title': 'title',
+                      'type': 'video',
+                      'language': 'fr',
+                      'categories': [
+                          {'id': 'category_id',
+                           'name': 'Category name'}
+                      ]}
+        ))
     ))
     @mock.patch('edflex.tasks.EdflexOauthClient', return_value=mock.Mock(
         get_resource=mock.Mock(return_value={'id': 'resource_id',
@@ -479,34 +1790,15 @@ class TestTasks(TestCase):
                                              ]})
     ))
     @mock.patch('edflex.tasks.get_edflex_configuration_for_org')
-    @mock.patch('edflex.tasks.get_course', return_value=mock.Mock(
-        location=mock.Mock(org='course_org'),
-        get_children=mock.Mock(return_value=[mock.Mock(
-            get_children=mock.Mock(return_value=[mock.Mock(
-                get_children=mock.Mock(return_value=[mock.Mock(
-                    get_children=mock.Mock(return_value=[mock.Mock(
-                        save=mock.Mock(),
-                        location=mock.Mock(block_type='edflex', for_branch=mock.Mock()),
-                        resource={'id': 'resource_id',
-                                  'title': 'title',
-                                  'type': 'video',
-                                  'language': 'fr',
-                                  'categories': [
-                                      {'id': 'category_id',
-                                       'name': 'Category name'}
-                                  ]}
-                    )])
-                )])
-            )])
-        )])
-    ))
+    @mock.patch('edflex.tasks.fetch_resource_details', side_effect=fetch_resource_details_in_order)
     def test_update_resources(
             self,
-            mock_get_course,
+            mock_fetch_resource_details,
             mock_get_edflex_configuration_for_org,
             mock_edflex_oauth_client,
             mock_modulestore,
-            mock_course_overview_all,
+            mock_usage_key_from_string,
+            mock_edflex_block_filter,
             mock_get_user_model,
     ):
         # act:
@@ -514,26 +1806,16 @@ class TestTasks(TestCase):
 
         # assert:
         mock_get_user_model().objects.filter().first.assert_called_once_with()
-        mock_course_overview_all.assert_called_once_with()
+        mock_edflex_block_filter.assert_called_once_with(resource_id__isnull=False)
 
         mock_edflex_oauth_client.assert_called_once()
-        mock_get_edflex_configuration_for_org.assert_called_once_with('course_org')
-
-        mock_get_course.assert_called_with('course_overview_id', depth=4)
-        mock_get_course().get_children.assert_called()
-
-        section = mock_get_course().get_children()[0]
-        section.get_children.assert_called()
-
-        subsection = section.get_children()[0]
-        subsection.get_children.assert_called()
+        mock_get_edflex_configuration_for_org.assert_called_once_with('org')
 
-        unit = subsection.get_children()[0]
-        unit.get_children.assert_called()
+        mock_usage_key_from_string.assert_called_once_with('usage_key')
+        mock_modulestore().get_item.assert_called_once_with('usage_key_object')
+        xblock = mock_modulestore().get_item()
 
-        xblock = unit.get_children()[0]
-
-        mock_edflex_oauth_client().get_resource.assert_called_with('resource_id')
+        mock_edflex_oauth_client().get_resource.assert_called_with('resource_id', conditional=False)
         xblock.location.for_branch.assert_called_with('draft-branch')
         xblock.save.assert_called()
         mock_modulestore().update_item.assert_called_with(xblock, 'user_id', asides=[])
@@ -557,10 +1839,27 @@ class TestTasks(TestCase):
             first=mock.Mock(return_value=mock.Mock(id='user_id'))
         )))
     ))
-    @mock.patch('edflex.tasks.CourseOverview.objects.all', return_value=[mock.Mock(id='course_overview_id')])
+    @mock.patch('edflex.tasks.EdflexBlock.objects.filter', return_value=mock.Mock(
+        order_by=mock.Mock(return_value=mock.Mock(
+            values_list=mock.Mock(return_value=[('course-v1:org+course+run', 'usage_key', 'resource_id')])
+        ))
+    ))
+    @mock.patch('edflex.tasks.UsageKey.from_string', return_value='usage_key_object')
     @mock.patch('edflex.tasks.modulestore', return_value=mock.Mock(
         update_item=mock.Mock(),
-        publish=mock.Mock()
+        publish=mock.Mock(),
+        get_item=mock.Mock(return_value=mock.Mock(
+            save=mock.Mock(),
+            location=mock.Mock(block_type='edflex', for_branch=mock.Mock()),
+            resource={'id': 'resource_id',
+                      'title': 'title',
+                      'type': 'video',
+                      'language': 'fr',
+                      'categories': [
+                          {'id': 'category_id',
+                           'name': 'Category name'}
+                      ]}
+        ))
     ))
     @mock.patch('edflex.tasks.EdflexOauthClient', return_value=mock.Mock(
         get_resource=mock.Mock(return_value={'id': 'resource_id',
@@ -573,34 +1872,15 @@ class TestTasks(TestCase):
                                              ]})
     ))
     @mock.patch('edflex.tasks.get_edflex_configuration_for_org')
-    @mock.patch('edflex.tasks.get_course', return_value=mock.Mock(
-        location=mock.Mock(org='course_org'),
-        get_children=mock.Mock(return_value=[mock.Mock(
-            get_children=mock.Mock(return_value=[mock.Mock(
-                get_children=mock.Mock(return_value=[mock.Mock(
-                    get_children=mock.Mock(return_value=[mock.Mock(
-                        save=mock.Mock(),
-                        location=mock.Mock(block_type='edflex', for_branch=mock.Mock()),
-                        resource={'id': 'resource_id',
-                                  'title': 'title',
-                                  'type': 'video',
-                                  'language': 'fr',
-                                  'categories': [
-                                      {'id': 'category_id',
-                                       'name': 'Category name'}
-                                  ]}
-                    )])
-                )])
-            )])
-        )])
-    ))
+    @mock.patch('edflex.tasks.fetch_resource_details', side_effect=fetch_resource_details_in_order)
     def test_update_resources_when_resource_has_not_changed(
             self,
-            mock_get_course,
+            mock_fetch_resource_details,
             mock_get_edflex_configuration_for_org,
             mock_edflex_oauth_client,
             mock_modulestore,
-            mock_course_overview_all,
+            mock_usage_key_from_string,
+            mock_edflex_block_filter,
             mock_get_user_model,
     ):
         # act:
@@ -608,84 +1888,129 @@ class TestTasks(TestCase):
 
         # assert:
         mock_get_user_model().objects.filter().first.assert_called_once_with()
-        mock_course_overview_all.assert_called_once_with()
+        mock_edflex_block_filter.assert_called_once_with(resource_id__isnull=False)
 
         mock_edflex_oauth_client.assert_called_once()
-        mock_get_edflex_configuration_for_org.assert_called_once_with('course_org')
-
-        mock_get_course.assert_called_with('course_overview_id', depth=4)
-        mock_get_course().get_children.assert_called()
-
-        section = mock_get_course().get_children()[0]
-        section.get_children.assert_called()
-
-        subsection = section.get_children()[0]
-        subsection.get_children.assert_called()
+        mock_get_edflex_configuration_for_org.assert_called_once_with('org')
 
-        unit = subsection.get_children()[0]
-        unit.get_children.assert_called()
+        mock_modulestore().get_item.assert_called_with('usage_key_object')
+        xblock = mock_modulestore().get_item()
 
-        xblock = unit.get_children()[0]
-
-        mock_edflex_oauth_client().get_resource.assert_called_with('resource_id')
+        mock_edflex_oauth_client().get_resource.assert_called_with('resource_id', conditional=False)
         xblock.location.for_branch.assert_not_called()
         xblock.save.assert_not_called()
         mock_modulestore().update_item.assert_not_called()
         mock_modulestore().publish.assert_not_called()
 
-    @mock.patch('edflex.tasks.EDFLEX_CLIENT_ID', None)
-    @mock.patch('edflex.tasks.EDFLEX_CLIENT_SECRET', None)
-    @mock.patch('edflex.tasks.EDFLEX_BASE_API_URL', None)
-    @mock.patch('edflex.tasks.fetch_new_resources_and_delete_old_resources')
-    def test_fetch_new_edflex_data_with_site_configurations(self, mock_fetch_new_resources_and_delete_old_resources):
+    @mock.patch('edflex.tasks.get_user_model', return_value=mock.Mock(
+        objects=mock.Mock(filter=mock.Mock(return_value=mock.Mock(
+            first=mock.Mock(return_value=mock.Mock(id='user_id'))
+        )))
+    ))
+    @mock.patch('edflex.tasks.EdflexBlock.objects.filter', return_value=mock.Mock(
+        order_by=mock.Mock(return_value=mock.Mock(
+            values_list=mock.Mock(return_value=[
+                ('course-v1:org+course1+run', 'usage_key_1', 'resource_id'),
+                ('course-v1:org+course2+run', 'usage_key_2', 'resource_id'),
+                ('course-v1:org+course2+run', 'usage_key_3', 'other_resource_id'),
+            ])
+        ))
+    ))
+    @mock.patch('edflex.tasks.update_block_resource')
+    @mock.patch('edflex.tasks.EdflexOauthClient', return_value=mock.Mock(
+        get_resource=mock.Mock(side_effect=lambda resource_id, conditional: {'id': resource_id})
+    ))
+    @mock.patch('edflex.tasks.get_edflex_configuration_for_org', return_value={
+        'client_id': '100',
+        'client_secret': 'test_client_secret',
+        'locale': 'en',
+        'base_api_url': 'https://test.base.url'
+    })
+    @mock.patch('edflex.tasks.fetch_resource_details', side_effect=fetch_resource_details_in_order)
+    def test_update_resources_fetches_each_resource_once(
+            self,
+            mock_fetch_resource_details,
+            mock_get_edflex_configuration_for_org,
+            mock_edflex_oauth_client,
+            mock_update_block_resource,
+            mock_edflex_block_filter,
+            mock_get_user_model,
+    ):
+        # act:
+        update_resources()
+
+        # assert:
+        mock_get_edflex_configuration_for_org.assert_called_once_with('org')
+        mock_edflex_oauth_client.assert_called_once()
+        self.assertEqual(mock_edflex_oauth_client().get_resource.call_count, 2)
+        user = mock_get_user_model().objects.filter().first()
+        self.assertEqual(
+            mock_update_block_resource.call_args_list,
+            [
+                mock.call('usage_key_1', {'id': 'resource_id'}, user),
+                mock.call('usage_key_2', {'id': 'resource_id'}, user),
+                mock.call('usage_key_3', {'id': 'other_resource_id'}, user),
+            ]
+        )
+
+    @mock.patch('edflex.tasks.EdflexBlock.objects')
+    @mock.patch('edflex.tasks.transaction.atomic')
+    @mock.patch('edflex.tasks.modulestore')
+    def test_index_course_blocks(self, mock_modulestore, mock_atomic, mock_edflex_block_objects):
         # arrange:
-        with mock.patch('openedx.core.djangoapps.site_configuration.models.SiteConfiguration.objects.filter',
-                        return_value=[mock.Mock(), mock.Mock(), mock.Mock()]) as site_configuration_filter:
-            # act:
-            fetch_new_edflex_data()
+        mock_modulestore().get_items.return_value = [
+            mock.Mock(
+                location=mock.Mock(for_branch=mock.Mock(return_value='usage_key')),
+                resource={'id': 'resource_id'},
+                catalog='catalog_id'
+            )
+        ]
 
-            # assert:
-            site_configuration_filter.assert_called_once_with(enabled=True)
-            self.assertEqual(mock_fetch_new_resources_and_delete_old_resources.call_count, 3)
+        # act:
+        index_course_blocks('course_key')
 
-    @mock.patch('edflex.tasks.EDFLEX_CLIENT_ID', 'client_id')
-    @mock.patch('edflex.tasks.EDFLEX_CLIENT_SECRET', 'client_secret')
-    @mock.patch('edflex.tasks.EDFLEX_LOCALE', ['en'])
-    @mock.patch('edflex.tasks.EDFLEX_BASE_API_URL', 'base_api_url')
-    @mock.patch('edflex.tasks.fetch_new_resources_and_delete_old_resources')
-    @mock.patch('openedx.core.djangoapps.site_configuration.models.SiteConfiguration.objects.filter', return_value=[])
-    def test_fetch_new_edflex_data_with_default_settings(
+        # assert:
+        mock_modulestore().branch_setting.assert_called_once_with('published-only', 'course_key')
+        mock_modulestore().get_items.assert_called_once_with('course_key', qualifiers={'category': 'edflex'})
+        mock_edflex_block_objects.filter.assert_called_once_with(course_key='course_key')
+        mock_edflex_block_objects.filter().delete.assert_called_once_with()
+        blocks = mock_edflex_block_objects.bulk_create.call_args[0][0]
+        self.assertEqual(
+            [(block.course_key, block.usage_key, block.resource_id, block.catalog_id) for block in blocks],
+            [('course_key', 'usage_key', 'resource_id', 'catalog_id')]
+        )
+
+    @mock.patch('edflex.tasks.chord')
+    @mock.patch('edflex.tasks.log_sync_results')
+    @mock.patch('edflex.tasks.fetch_new_tenant_resources')
+    @mock.patch('edflex.tasks.get_tenant_configurations', return_value=[{'client_id': '1'}])
+    def test_fetch_new_edflex_data(
             self,
-            mock_site_configuration_filter,
-            mock_fetch_new_resources_and_delete_old_resources
+            mock_get_tenant_configurations,
+            mock_fetch_new_tenant_resources,
+            mock_log_sync_results,
+            mock_chord
     ):
         # act:
         fetch_new_edflex_data()
 
         # assert:
-        mock_site_configuration_filter.assert_called_once_with(enabled=True)
-        mock_fetch_new_resources_and_delete_old_resources.assert_called_once_with(
-            'client_id', 'client_secret', 'en', 'base_api_url'
-        )
+        mock_fetch_new_tenant_resources.s.assert_called_once_with({'client_id': '1'})
+        mock_chord.assert_called_once_with([mock_fetch_new_tenant_resources.s()])
+        mock_log_sync_results.s.assert_called_once_with('fetch_new_edflex_data')
 
-    @mock.patch('edflex.models.Resource.objects.filter',
-                return_value=mock.Mock(
-                    exclude=mock.Mock(return_value=mock.Mock(delete=mock.Mock())),
-                    first=mock.Mock(return_value=None)
+    @mock.patch('edflex.models.Resource.objects.filter', return_value=mock.Mock(
+        values_list=mock.Mock(return_value=[('old_resource_id', 7)])
+    ))
+    @mock.patch('edflex.tasks.save_catalog_resources',
+                side_effect=lambda catalog, r_resources: (
+                    ['obj_resource_id' for r_resource in r_resources], ['obj_category_id']
                 ))
-    @mock.patch('edflex.models.Category.objects.update_or_create',
-                return_value=(mock.Mock(id='obj_category_id'), mock.Mock()))
-    @mock.patch('edflex.models.Resource.objects.update_or_create',
-                return_value=(mock.Mock(id='obj_resource_id'), mock.Mock()))
     @mock.patch('edflex.tasks.EdflexOauthClient', return_value=mock.Mock(
         get_catalogs=mock.Mock(return_value=[{'id': 'catalog_id_1', 'title': 'Catalog title1'},
                                              {'id': 'catalog_id_2', 'title': 'Catalog title2'}
                                              ]),
-        get_catalog=mock.Mock(return_value={'id': 'catalog_id',
-                                            'title': 'Catalog title',
-                                            'items': [
-                                                {'resource': {'id': 'resource_id'}}
-                                            ]}),
+        get_catalog_items=mock.Mock(return_value=[{'resource': {'id': 'resource_id'}}]),
         get_resource=mock.Mock(return_value={'id': 'resource_id',
                                              'title': 'title',
                                              'type': 'type',
@@ -694,11 +2019,12 @@ class TestTasks(TestCase):
                                                  {'id': 'category_id', 'name': 'Category name'}
                                              ]})
     ))
+    @mock.patch('edflex.tasks.fetch_resource_details', side_effect=fetch_resource_details_in_order)
     def test_fetch_new_resources_and_delete_old_resources(
             self,
+            mock_fetch_resource_details,
             mock_edflex_oauth_client,
-            mock_resources_update_or_create,
-            mock_categories_update_or_create,
+            mock_save_catalog_resources,
             mock_resource_filter,
     ):
         # act:
@@ -714,61 +2040,41 @@ class TestTasks(TestCase):
             }
         )
         mock_edflex_oauth_client().get_catalogs.assert_called_once_with()
-        self.assertEqual(mock_edflex_oauth_client().get_catalog.call_count, 2)
+        self.assertEqual(mock_edflex_oauth_client().get_catalog_items.call_count, 2)
+        mock_edflex_oauth_client().get_catalog_items.assert_any_call('catalog_id_1', conditional=True)
+        self.assertEqual(mock_edflex_oauth_client().commit_validators.call_count, 2)
 
-        mock_resource_filter.assert_any_call(
-            resource_id='resource_id',
-            catalog_id='catalog_id_2'
-        )
-        mock_resource_filter().first.assert_called()
-        mock_edflex_oauth_client().get_resource.assert_any_call('resource_id')
+        mock_resource_filter.assert_any_call(catalog_id='catalog_id_2')
+        mock_resource_filter().values_list.assert_called_with('resource_id', 'id')
+        mock_edflex_oauth_client().get_resource.assert_any_call('resource_id', conditional=False)
 
-        self.assertEqual(mock_resources_update_or_create.call_count, 2)
-        mock_resources_update_or_create.assert_any_call(
-            catalog_id='catalog_id_1',
-            resource_id='resource_id',
-            defaults={
-                'title': 'title',
-                'r_type': 'type',
-                'language': 'language'
-            }
+        self.assertEqual(mock_save_catalog_resources.call_count, 2)
+        self.assertEqual(
+            mock_save_catalog_resources.call_args_list[0][0][0],
+            {'id': 'catalog_id_1', 'title': 'Catalog title1'}
         )
 
-        self.assertEqual(mock_categories_update_or_create.call_count, 2)
-        mock_categories_update_or_create.assert_any_call(
-            category_id='category_id',
-            catalog_id='catalog_id_1',
-            defaults={'name': 'Category name',
-                      'catalog_title': 'Catalog title1'}
+        self.assertEqual(
+            [call for call in mock_resource_filter.call_args_list if call == mock.call(id__in=[7])],
+            [mock.call(id__in=[7])] * 2
         )
+        self.assertEqual(mock_resource_filter().delete.call_count, 2)
 
-        mock_resource_filter.assert_any_call(catalog_id='catalog_id_2')
-        mock_resource_filter().exclude.assert_any_call(id__in=['obj_resource_id'])
-        mock_resource_filter().exclude().delete.assert_called()
-
-    @mock.patch('edflex.models.Resource.objects.filter',
-                return_value=mock.Mock(
-                    exclude=mock.Mock(return_value=mock.Mock(delete=mock.Mock())),
-                    first=mock.Mock(return_value=(mock.Mock(id='old_resource_id')))
-                ))
-    @mock.patch('edflex.models.Category.objects.update_or_create')
-    @mock.patch('edflex.models.Resource.objects.update_or_create')
+    @mock.patch('edflex.models.Resource.objects.filter', return_value=mock.Mock(
+        values_list=mock.Mock(return_value=[('resource_id', 7)])
+    ))
+    @mock.patch('edflex.tasks.save_catalog_resources')
     @mock.patch('edflex.tasks.EdflexOauthClient', return_value=mock.Mock(
         get_catalogs=mock.Mock(return_value=[{'id': 'catalog_id_1', 'title': 'Catalog title1'},
                                              {'id': 'catalog_id_2', 'title': 'Catalog title2'}
                                              ]),
-        get_catalog=mock.Mock(return_value={'id': 'catalog_id',
-                                            'title': 'Catalog title',
-                                            'items': [
-                                                {'resource': {'id': 'resource_id'}}
-                                            ]}),
+        get_catalog_items=mock.Mock(return_value=[{'resource': {'id': 'resource_id'}}]),
         get_resource=mock.Mock()
     ))
     def test_fetch_new_resources_and_delete_old_resources_when_no_new_resources(
             self,
             mock_edflex_oauth_client,
-            mock_resources_update_or_create,
-            mock_categories_update_or_create,
+            mock_save_catalog_resources,
             mock_resource_filter,
     ):
         # act:
@@ -784,22 +2090,48 @@ class TestTasks(TestCase):
             }
         )
         mock_edflex_oauth_client().get_catalogs.assert_called_once_with()
-        self.assertEqual(mock_edflex_oauth_client().get_catalog.call_count, 2)
+        self.assertEqual(mock_edflex_oauth_client().get_catalog_items.call_count, 2)
 
-        mock_resource_filter.assert_any_call(
-            resource_id='resource_id',
-            catalog_id='catalog_id_2'
+        self.assertEqual(
+            mock_resource_filter.call_args_list,
+            [mock.call(catalog_id='catalog_id_1'), mock.call(catalog_id='catalog_id_2')]
         )
-        mock_resource_filter().first.assert_called()
+        self.assertEqual(mock_resource_filter().values_list.call_count, 2)
         mock_edflex_oauth_client().get_resource.assert_not_called()
 
-        mock_resources_update_or_create.assert_not_called()
+        mock_save_catalog_resources.assert_not_called()
+        mock_resource_filter().delete.assert_not_called()
+        self.assertEqual(mock_edflex_oauth_client().commit_validators.call_count, 2)
 
-        mock_categories_update_or_create.assert_not_called()
 
-        mock_resource_filter.assert_any_call(catalog_id='catalog_id_2')
-        mock_resource_filter().exclude.assert_any_call(id__in=['old_resource_id'])
-        mock_resource_filter().exclude().delete.assert_called()
+class TestEdflexResources(TestCase):
+
+    def setUp(self):
+        edflex._resources.clear()
+        edflex._templates.clear()
+
+    @mock.patch('edflex.edflex.loader.load_unicode', return_value='content')
+    def test_load_resource(self, mock_load_unicode):
+        # act:
+        load_resource('static/css/edflex.css')
+        result = load_resource('static/css/edflex.css')
+
+        # assert:
+        mock_load_unicode.assert_called_once_with('static/css/edflex.css')
+        self.assertEqual(result, 'content')
+
+    @mock.patch('edflex.edflex.Template')
+    @mock.patch('edflex.edflex.loader.load_unicode', return_value='template')
+    def test_render_template(self, mock_load_unicode, mock_template):
+        # act:
+        render_template('static/html/edflex.html', {'key': 'value'})
+        result = render_template('static/html/edflex.html', {'key': 'other value'})
+
+        # assert:
+        mock_load_unicode.assert_called_once_with('static/html/edflex.html')
+        mock_template.assert_called_once_with('template')
+        self.assertEqual(mock_template().render.call_count, 2)
+        self.assertEqual(result, mock_template().render())
 
 
 class TestEdflex(TestCase):
@@ -837,13 +2169,13 @@ class TestEdflex(TestCase):
             ['format', 'category', 'catalog', 'language', 'resource', 'weight']
         )
 
-    @mock.patch('edflex.edflex.loader.render_django_template', return_value='html')
+    @mock.patch('edflex.edflex.render_template', return_value='html')
     @mock.patch('edflex.edflex.EdflexXBlock.update_student_context')
     @mock.patch('edflex.edflex.Fragment', return_value=mock.Mock(initialize_js=mock.Mock(),
                                                                  add_javascript_url=mock.Mock(),
                                                                  add_javascript=mock.Mock(),
                                                                  add_css=mock.Mock()))
-    def test_student_view(self, mock_fragment, mock_update_student_context, mock_render_django_template):
+    def test_student_view(self, mock_fragment, mock_update_student_context, mock_render_template):
         # arrange:
         test_instance = self.create_one(resource={'type': 'video'})
 
@@ -851,12 +2183,13 @@ class TestEdflex(TestCase):
         test_instance.student_view()
 
         # assert:
+        test_instance.runtime.local_resource_url.assert_called_with(test_instance, 'public/images/sprite.svg')
         mock_update_student_context.assert_called_with(
-            {'svg_sprite': test_instance.resource_string('public/images/sprite.svg')})
+            {'svg_sprite_url': test_instance.runtime.local_resource_url()})
         mock_fragment.assert_called_once()
-        mock_render_django_template.assert_called_with(
+        mock_render_template.assert_called_with(
             'static/html/edflex.html',
-            {'svg_sprite': test_instance.resource_string('public/images/sprite.svg')}
+            {'svg_sprite_url': test_instance.runtime.local_resource_url()}
         )
         mock_fragment().add_css.assert_called_with(
             test_instance.resource_string("static/css/edflex.css")
@@ -869,7 +2202,7 @@ class TestEdflex(TestCase):
         )
         mock_fragment().initialize_js.assert_called_with('EdflexXBlock')
 
-    @mock.patch('edflex.edflex.loader.render_django_template', return_value='html')
+    @mock.patch('edflex.edflex.render_template', return_value='html')
     @mock.patch('edflex.edflex.EdflexXBlock.update_student_context')
     @mock.patch('edflex.edflex.Fragment',
                 return_value=mock.Mock(initialize_js=mock.Mock(),
@@ -880,13 +2213,13 @@ class TestEdflex(TestCase):
             self,
             mock_fragment,
             mock_update_student_context,
-            mock_render_django_template
+            mock_render_template
     ):
         # arrange:
         test_instance = self.create_one(resource={'type': 'mooc'})
         test_context = {
             'key': 'value',
-            'svg_sprite': test_instance.resource_string('public/images/sprite.svg')
+            'svg_sprite_url': test_instance.runtime.local_resource_url()
         }
 
         # act:
@@ -895,12 +2228,39 @@ class TestEdflex(TestCase):
         # assert:
         mock_update_student_context.assert_called_with(test_context)
         mock_fragment.assert_called_once()
-        mock_render_django_template.assert_called_with('static/html/edflex.html', test_context)
+        mock_render_template.assert_called_with('static/html/edflex.html', test_context)
         mock_fragment().add_css.assert_called_with(test_instance.resource_string("static/css/edflex.css"))
         mock_fragment().add_javascript_url.assert_not_called()
         mock_fragment().add_javascript.assert_called_with(test_instance.resource_string("static/js/src/edflex.js"))
         mock_fragment().initialize_js.assert_called_with('EdflexXBlock')
 
+    @mock.patch('edflex.edflex.EDFLEX_INLINE_SVG_SPRITE', True)
+    def test_get_svg_sprite_context_inline(self):
+        # arrange:
+        test_instance = self.create_one()
+
+        # act:
+        result = test_instance.get_svg_sprite_context()
+
+        # assert:
+        test_instance.runtime.local_resource_url.assert_not_called()
+        self.assertEqual(
+            result,
+            {'svg_sprite': test_instance.resource_string('public/images/sprite.svg'), 'svg_sprite_url': ''}
+        )
+
+    def test_svg_sprite_is_well_formed(self):
+        # arrange:
+        test_instance = self.create_one()
+
+        # act:
+        sprite = minidom.parseString(test_instance.resource_string('public/images/sprite.svg').encode('utf-8'))
+
+        # assert:
+        symbol_ids = [symbol.getAttribute('id') for symbol in sprite.getElementsByTagName('symbol')]
+        self.assertIn('video', symbol_ids)
+        self.assertTrue(all(symbol_ids))
+
     def test_update_student_context(self):
         # arrange:
         test_instance = self.create_one(resource={'type': 'mooc'}, score=1)
@@ -925,14 +2285,14 @@ class TestEdflex(TestCase):
             }
         )
 
-    @mock.patch('edflex.edflex.loader.load_unicode', return_value='unicode')
-    @mock.patch('edflex.edflex.loader.render_django_template', return_value='html')
+    @mock.patch('edflex.edflex.load_resource', return_value='unicode')
+    @mock.patch('edflex.edflex.render_template', return_value='html')
     @mock.patch('edflex.edflex.Fragment', return_value=mock.Mock(initialize_js=mock.Mock(),
                                                                  add_javascript_url=mock.Mock(),
                                                                  add_javascript=mock.Mock(),
                                                                  add_css=mock.Mock()))
     @mock.patch('edflex.edflex.EdflexXBlock.update_studio_context')
-    def test_studio_view(self, mock_update_studio_context, mock_self, mock_render_django_template, mock_load_unicode):
+    def test_studio_view(self, mock_update_studio_context, mock_self, mock_render_template, mock_load_resource):
         # arrange:
         test_instance = self.create_one()
         test_context = {'key': 'value'}
@@ -942,9 +2302,9 @@ class TestEdflex(TestCase):
 
         # assert:
         mock_update_studio_context.assert_called_with(test_context)
-        mock_render_django_template.assert_called_with('static/html/studio_edit.html', test_context)
-        mock_load_unicode.assert_called_with('static/js/src/studio_edit.js')
-        mock_self().add_javascript.assert_called_with(mock_load_unicode())
+        mock_render_template.assert_called_with('static/html/studio_edit.html', test_context)
+        mock_load_resource.assert_called_with('static/js/src/studio_edit.js')
+        mock_self().add_javascript.assert_called_with(mock_load_resource())
         mock_self().initialize_js.assert_called_once()
         self.assertEqual(mock_self().add_css.call_count, 2)
 
@@ -953,14 +2313,14 @@ class TestEdflex(TestCase):
             values_list=mock.Mock(return_value=mock.Mock(distinct=mock.Mock()))))
     ))
     @mock.patch('edflex.edflex.Category.objects.filter', return_value=mock.Mock(
-        order_by=mock.Mock(return_value=mock.Mock(distinct=mock.Mock(return_value=mock.Mock(values=mock.Mock()))))))
+        order_by=mock.Mock(return_value=mock.Mock(values=mock.Mock()))))
     @mock.patch('edflex.edflex.get_edflex_configuration_for_org', return_value='configuration')
-    @mock.patch('edflex.edflex.EdflexOauthClient.get_catalogs')
-    @mock.patch('edflex.edflex.EdflexOauthClient')
+    @mock.patch('edflex.edflex.get_catalog_ids', return_value=[])
+    @mock.patch('edflex.edflex.ResourceCategory.objects.filter')
     def test_update_studio_context(
             self,
-            mock_edflex_oauth_client,
-            mock_get_catalogs,
+            mock_resource_category_filter,
+            mock_get_catalog_ids,
             mock_get_edflex_configuration_for_org,
             mock_category_filter,
             mock_resource_filter
@@ -974,12 +2334,12 @@ class TestEdflex(TestCase):
 
         # assert:
         mock_get_edflex_configuration_for_org.assert_called_once_with(test_instance.location.org)
-        mock_edflex_oauth_client.assert_called_with('configuration')
-        mock_get_catalogs.assert_called_once()
-        mock_category_filter.assert_called_with(resources__catalog_id__in=[])
+        mock_get_catalog_ids.assert_called_once_with('configuration')
+        mock_resource_category_filter.assert_called_with(resource__catalog_id__in=[])
+        mock_resource_category_filter().values.assert_called_with('category_id')
+        mock_category_filter.assert_called_with(id__in=mock_resource_category_filter().values())
         mock_category_filter().order_by.assert_called_with('catalog_title', 'name')
-        mock_category_filter().order_by().distinct.assert_called_once()
-        mock_category_filter().order_by().distinct().values.assert_called_once()
+        mock_category_filter().order_by().values.assert_called_once()
         mock_resource_filter.assert_called_with(catalog_id__in=[], language__isnull=False)
         mock_resource_filter().order_by.assert_called_with('language')
         mock_resource_filter().order_by().values_list.assert_called_with('language', flat=True)
@@ -988,19 +2348,19 @@ class TestEdflex(TestCase):
             result,
             {
                 'languages': mock_resource_filter().order_by().values_list().distinct(),
-                'categories': mock_category_filter().order_by().distinct().values(),
+                'categories': mock_category_filter().order_by().values(),
                 'weight': 1.0,
                 'key': 'value'
             }
         )
 
     @mock.patch('edflex.models.Resource.objects.filter')
-    @mock.patch('edflex.edflex.EdflexOauthClient')
+    @mock.patch('edflex.edflex.get_catalog_ids')
     @mock.patch('edflex.edflex.get_edflex_configuration_for_org')
     def test_get_list_resources_when_not_set_required_parameters(
             self,
             mock_get_edflex_configuration_for_org,
-            mock_edflex_oauth_client,
+            mock_get_catalog_ids,
             mock_resource_filter
     ):
         # arrange:
@@ -1012,7 +2372,7 @@ class TestEdflex(TestCase):
 
         # assert:
         mock_get_edflex_configuration_for_org.assert_not_called()
-        mock_edflex_oauth_client.assert_not_called()
+        mock_get_catalog_ids.assert_not_called()
         mock_resource_filter.assert_not_called()
         self.assertEqual(response.json, {'resources': []})
 
@@ -1020,20 +2380,21 @@ class TestEdflex(TestCase):
     @mock.patch('edflex.models.Resource.objects.filter', return_value=mock.Mock(
         filter=mock.Mock(return_value=mock.Mock(
             filter=mock.Mock(return_value=mock.Mock(
-                distinct=mock.Mock(return_value=mock.Mock(
-                    order_by=mock.Mock(return_value=mock.Mock(
-                        values=mock.Mock(return_value=[{'resource_id': 'resource_id', 'title': 'title'}]))))))))
+                order_by=mock.Mock(return_value=mock.Mock(
+                    values=mock.Mock(return_value=[{'resource_id': 'resource_id', 'title': 'title'}]))))))
         )))
-    @mock.patch('edflex.edflex.EdflexOauthClient', return_value=mock.Mock(get_catalogs=mock.Mock(return_value=[])))
+    @mock.patch('edflex.edflex.get_catalog_ids', return_value=[])
     @mock.patch('edflex.edflex.get_edflex_configuration_for_org', return_value={
         'client_id': '100',
         'client_secret': 'test_client_secret',
         'base_api_url': "https://test.base.url"
     })
+    @mock.patch('edflex.edflex.ResourceCategory.objects.filter')
     def test_get_list_resources(
             self,
+            mock_resource_category_filter,
             mock_get_edflex_configuration_for_org,
-            mock_edflex_oauth_client,
+            mock_get_catalog_ids,
             mock_resource_filter,
             mock_category_get
     ):
@@ -1046,28 +2407,140 @@ class TestEdflex(TestCase):
 
         # assert:
         mock_get_edflex_configuration_for_org.assert_called_once_with(test_instance.location.org)
-        mock_edflex_oauth_client.assert_called_once_with(
+        mock_get_catalog_ids.assert_called_once_with(
             {
                 'client_id': '100',
                 'client_secret': 'test_client_secret',
                 'base_api_url': "https://test.base.url"
             }
         )
-        mock_edflex_oauth_client().get_catalogs.assert_called_once_with()
         mock_resource_filter.assert_called_with(
             r_type='format',
         )
         mock_category_get.assert_called_with(id='category_id')
-        mock_resource_filter().filter.assert_called_with(categories__id='id', catalog_id='catalog_id')
+        mock_resource_category_filter.assert_called_with(category_id='id')
+        mock_resource_category_filter().values.assert_called_with('resource_id')
+        mock_resource_filter().filter.assert_called_with(
+            id__in=mock_resource_category_filter().values(),
+            catalog_id='catalog_id'
+        )
         mock_resource_filter().filter().filter.assert_called_with(language='language')
-        mock_resource_filter().filter().filter().distinct.assert_called_once()
-        mock_resource_filter().filter().filter().distinct().order_by.assert_called_with('title')
-        mock_resource_filter().filter().filter().distinct().order_by().values.assert_called_with('resource_id', 'title')
+        mock_resource_filter().filter().filter().order_by.assert_called_with('title')
+        mock_resource_filter().filter().filter().order_by().values.assert_called_with('resource_id', 'title')
         self.assertEqual(
             response.json,
             {'resources': [{'resource_id': 'resource_id', 'title': 'title'}]}
         )
 
+    @mock.patch('edflex.edflex.EDFLEX_RESOURCES_PAGE_SIZE', 2)
+    @mock.patch('edflex.edflex.search')
+    @mock.patch('edflex.edflex.EdflexXBlock.filter_resources')
+    def test_search_resources(self, mock_filter_resources, mock_search):
+        # arrange:
+        test_instance = self.create_one()
+        resources = mock_search.return_value
+        resources.filter.return_value = resources
+        resources.order_by.return_value.values.return_value = [
+            {'id': 3, 'resource_id': 'resource_id_3', 'title': 'Python', 'rank': 6},
+            {'id': 1, 'resource_id': 'resource_id_1', 'title': 'Python basics', 'rank': 3},
+            {'id': 2, 'resource_id': 'resource_id_2', 'title': 'Python basics', 'rank': 3},
+        ]
+        data = {
+            'format': 'format',
+            'category_id': 'category_id',
+            'language': 'language',
+            'term': ' python ',
+            'cursor': {'rank': 9, 'title': 'Django', 'id': 5},
+            'limit': 100,
+        }
+
+        # act:
+        response = test_instance.search_resources(mock.Mock(method="POST", body=json.dumps(data)))
+
+        # assert:
+        mock_filter_resources.assert_called_once_with('format', 'category_id', 'language')
+        mock_search.assert_called_once_with(mock_filter_resources.return_value, 'python', 'language')
+        resources.filter.assert_called_once()
+        resources.order_by.assert_called_once_with('-rank', 'title', 'id')
+        resources.order_by().values.assert_called_once_with('resource_id', 'rank', 'title', 'id')
+        self.assertEqual(
+            response.json,
+            {
+                'resources': [
+                    {'resource_id': 'resource_id_3', 'title': 'Python'},
+                    {'resource_id': 'resource_id_1', 'title': 'Python basics'},
+                ],
+                'next_cursor': {'rank': 3, 'title': 'Python basics', 'id': 1},
+            }
+        )
+
+    @mock.patch('edflex.edflex.EdflexXBlock.filter_resources')
+    def test_search_resources_last_page(self, mock_filter_resources):
+        # arrange:
+        test_instance = self.create_one()
+        resources = mock_filter_resources.return_value
+        resources.filter.return_value = resources
+        resources.order_by.return_value.values.return_value = [
+            {'id': 1, 'resource_id': 'resource_id_1', 'title': 'Python basics'},
+        ]
+        data = {'format': 'format', 'resource_id': 'resource_id_1', 'limit': 1}
+
+        # act:
+        response = test_instance.search_resources(mock.Mock(method="POST", body=json.dumps(data)))
+
+        # assert:
+        resources.filter.assert_called_once_with(resource_id='resource_id_1')
+        self.assertEqual(
+            response.json,
+            {'resources': [{'resource_id': 'resource_id_1', 'title': 'Python basics'}], 'next_cursor': None}
+        )
+
+    @mock.patch('edflex.edflex.EdflexXBlock.filter_resources')
+    def test_search_resources_when_not_set_format(self, mock_filter_resources):
+        # arrange:
+        test_instance = self.create_one()
+
+        # act:
+        response = test_instance.search_resources(mock.Mock(method="POST", body=json.dumps({'term': 'python'})))
+
+        # assert:
+        mock_filter_resources.assert_not_called()
+        self.assertEqual(response.json, {'resources': [], 'next_cursor': None})
+
+    @mock.patch('edflex.edflex.timezone.now', return_value=datetime(2021, 3, 10))
+    @mock.patch('edflex.edflex.Resource.objects.filter')
+    @mock.patch('edflex.edflex.get_catalog_ids', return_value=['catalog_id'])
+    @mock.patch('edflex.edflex.EdflexOauthClient')
+    @mock.patch('edflex.edflex.get_edflex_configuration_for_org', return_value='configuration')
+    def test_get_resource_when_stored(
+            self,
+            mock_get_edflex_configuration_for_org,
+            mock_edflex_oauth_client,
+            mock_get_catalog_ids,
+            mock_resource_filter,
+            mock_now
+    ):
+        # arrange:
+        test_instance = self.create_one()
+        stored_resources = mock_resource_filter.return_value.filter.return_value
+        stored_resources.values_list.return_value.first.return_value = '{"id": "resource_id", "title": "title"}'
+        data = {'resource': 'resource_id'}
+
+        # act:
+        response = test_instance.get_resource(mock.Mock(method="POST", body=json.dumps(data)))
+
+        # assert:
+        mock_get_catalog_ids.assert_called_once_with('configuration')
+        mock_resource_filter.assert_called_once_with(resource_id='resource_id', catalog_id__in=['catalog_id'])
+        mock_resource_filter().filter.assert_called_once_with(data_fetched__gte=datetime(2021, 3, 2))
+        stored_resources.values_list.assert_called_once_with('data', flat=True)
+        mock_edflex_oauth_client.assert_not_called()
+        self.assertEqual(response.json, {'id': 'resource_id', 'title': 'title'})
+
+    @mock.patch('edflex.edflex.timezone.now', return_value='now')
+    @mock.patch('edflex.edflex.EDFLEX_RESOURCE_DATA_MAX_AGE', 0)
+    @mock.patch('edflex.edflex.Resource.objects.filter')
+    @mock.patch('edflex.edflex.get_catalog_ids', return_value=['catalog_id'])
     @mock.patch('edflex.edflex.EdflexOauthClient', return_value=mock.Mock(
         get_resource=mock.Mock(return_value={'id': 'resource_id', 'title': 'title'})
     ))
@@ -1076,9 +2549,17 @@ class TestEdflex(TestCase):
         'client_secret': 'test_client_secret',
         'base_api_url': "https://test.base.url"
     })
-    def test_get_resource(self, mock_get_edflex_configuration_for_org, mock_edflex_oauth_client):
+    def test_get_resource(
+            self,
+            mock_get_edflex_configuration_for_org,
+            mock_edflex_oauth_client,
+            mock_get_catalog_ids,
+            mock_resource_filter,
+            mock_now
+    ):
         # arrange:
         test_instance = self.create_one()
+        mock_resource_filter.return_value.filter.return_value.values_list.return_value.first.return_value = None
         data = {'resource': 'resource_id'}
 
         # act:
@@ -1086,12 +2567,17 @@ class TestEdflex(TestCase):
 
         # assert:
         mock_get_edflex_configuration_for_org.assert_called_once_with(test_instance.location.org)
+        mock_resource_filter().update.assert_called_once_with(
+            data='{"id": "resource_id", "title": "title"}', data_fetched='now'
+        )
         mock_edflex_oauth_client.assert_called_once_with(
             {
                 'client_id': '100',
                 'client_secret': 'test_client_secret',
                 'base_api_url': "https://test.base.url"
-            }
+            },
+            timeout=5,
+            max_retries=0
         )
         mock_edflex_oauth_client().get_resource.assert_called_with('resource_id')
         self.assertEqual(
@@ -1128,8 +2614,8 @@ class TestEdflex(TestCase):
         self.assertEqual(response.json, {'status': 'ok'})
 
     @mock.patch('edflex.edflex.Fragment', return_value='frag')
-    @mock.patch('edflex.edflex.loader.render_django_template', return_value='html')
-    def test_author_view(self, mock_render_django_template, mock_fragment):
+    @mock.patch('edflex.edflex.render_template', return_value='html')
+    def test_author_view(self, mock_render_template, mock_fragment):
         # arrange:
         test_instance = self.create_one()
 
@@ -1137,8 +2623,11 @@ class TestEdflex(TestCase):
         result = test_instance.author_view()
 
         # assert:
-        mock_render_django_template.assert_called_with("static/html/author_view.html", None)
-        mock_fragment.assert_called_with(mock_render_django_template())
+        mock_render_template.assert_called_with(
+            "static/html/author_view.html",
+            {'svg_sprite_url': test_instance.runtime.local_resource_url(), 'resource': {}}
+        )
+        mock_fragment.assert_called_with(mock_render_template())
         self.assertEqual(result, 'frag')
 
     def test_max_score(self):
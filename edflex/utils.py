@@ -1,12 +1,95 @@
+import logging
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from itertools import islice
+
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
+from django.utils import six
 from openedx.core.djangoapps.site_configuration import helpers as configuration_helpers
 
+from .api import EDFLEX_API_HANDLER_MAX_RETRIES, EDFLEX_API_HANDLER_TIMEOUT, EdflexOauthClient
+
+# codepoints of the emoji, their modifiers and joiners stripped from the imported texts:
+# the Emoji and Emoji_Component properties of the Unicode 16.0 emoji data, digits, # and * aside
+EMOJI_CODEPOINT_RANGES = (
+    (0x00A9, 0x00A9), (0x00AE, 0x00AE), (0x200D, 0x200D), (0x203C, 0x203C),
+    (0x2049, 0x2049), (0x20E3, 0x20E3), (0x2122, 0x2122), (0x2139, 0x2139),
+    (0x2194, 0x2199), (0x21A9, 0x21AA), (0x231A, 0x231B), (0x2328, 0x2328),
+    (0x23CF, 0x23CF), (0x23E9, 0x23F3), (0x23F8, 0x23FA), (0x24C2, 0x24C2),
+    (0x25AA, 0x25AB), (0x25B6, 0x25B6), (0x25C0, 0x25C0), (0x25FB, 0x25FE),
+    (0x2600, 0x2604), (0x260E, 0x260E), (0x2611, 0x2611), (0x2614, 0x2615),
+    (0x2618, 0x2618), (0x261D, 0x261D), (0x2620, 0x2620), (0x2622, 0x2623),
+    (0x2626, 0x2626), (0x262A, 0x262A), (0x262E, 0x262F), (0x2638, 0x263A),
+    (0x2640, 0x2640), (0x2642, 0x2642), (0x2648, 0x2653), (0x265F, 0x2660),
+    (0x2663, 0x2663), (0x2665, 0x2666), (0x2668, 0x2668), (0x267B, 0x267B),
+    (0x267E, 0x267F), (0x2692, 0x2697), (0x2699, 0x2699), (0x269B, 0x269C),
+    (0x26A0, 0x26A1), (0x26A7, 0x26A7), (0x26AA, 0x26AB), (0x26B0, 0x26B1),
+    (0x26BD, 0x26BE), (0x26C4, 0x26C5), (0x26C8, 0x26C8), (0x26CE, 0x26CF),
+    (0x26D1, 0x26D1), (0x26D3, 0x26D4), (0x26E9, 0x26EA), (0x26F0, 0x26F5),
+    (0x26F7, 0x26FA), (0x26FD, 0x26FD), (0x2702, 0x2702), (0x2705, 0x2705),
+    (0x2708, 0x270D), (0x270F, 0x270F), (0x2712, 0x2712), (0x2714, 0x2714),
+    (0x2716, 0x2716), (0x271D, 0x271D), (0x2721, 0x2721), (0x2728, 0x2728),
+    (0x2733, 0x2734), (0x2744, 0x2744), (0x2747, 0x2747), (0x274C, 0x274C),
+    (0x274E, 0x274E), (0x2753, 0x2755), (0x2757, 0x2757), (0x2763, 0x2764),
+    (0x2795, 0x2797), (0x27A1, 0x27A1), (0x27B0, 0x27B0), (0x27BF, 0x27BF),
+    (0x2934, 0x2935), (0x2B05, 0x2B07), (0x2B1B, 0x2B1C), (0x2B50, 0x2B50),
+    (0x2B55, 0x2B55), (0x3030, 0x3030), (0x303D, 0x303D), (0x3297, 0x3297),
+    (0x3299, 0x3299), (0xFE0E, 0xFE0F), (0x1F004, 0x1F004), (0x1F0CF, 0x1F0CF),
+    (0x1F170, 0x1F171), (0x1F17E, 0x1F17F), (0x1F18E, 0x1F18E), (0x1F191, 0x1F19A),
+    (0x1F1E6, 0x1F1FF), (0x1F201, 0x1F202), (0x1F21A, 0x1F21A), (0x1F22F, 0x1F22F),
+    (0x1F232, 0x1F23A), (0x1F250, 0x1F251), (0x1F300, 0x1F321), (0x1F324, 0x1F393),
+    (0x1F396, 0x1F397), (0x1F399, 0x1F39B), (0x1F39E, 0x1F3F0), (0x1F3F3, 0x1F3F5),
+    (0x1F3F7, 0x1F4FD), (0x1F4FF, 0x1F53D), (0x1F549, 0x1F54E), (0x1F550, 0x1F567),
+    (0x1F56F, 0x1F570), (0x1F573, 0x1F57A), (0x1F587, 0x1F587), (0x1F58A, 0x1F58D),
+    (0x1F590, 0x1F590), (0x1F595, 0x1F596), (0x1F5A4, 0x1F5A5), (0x1F5A8, 0x1F5A8),
+    (0x1F5B1, 0x1F5B2), (0x1F5BC, 0x1F5BC), (0x1F5C2, 0x1F5C4), (0x1F5D1, 0x1F5D3),
+    (0x1F5DC, 0x1F5DE), (0x1F5E1, 0x1F5E1), (0x1F5E3, 0x1F5E3), (0x1F5E8, 0x1F5E8),
+    (0x1F5EF, 0x1F5EF), (0x1F5F3, 0x1F5F3), (0x1F5FA, 0x1F64F), (0x1F680, 0x1F6C5),
+    (0x1F6CB, 0x1F6D2), (0x1F6D5, 0x1F6D7), (0x1F6DC, 0x1F6E5), (0x1F6E9, 0x1F6E9),
+    (0x1F6EB, 0x1F6EC), (0x1F6F0, 0x1F6F0), (0x1F6F3, 0x1F6FC), (0x1F7E0, 0x1F7EB),
+    (0x1F7F0, 0x1F7F0), (0x1F90C, 0x1F93A), (0x1F93C, 0x1F945), (0x1F947, 0x1F9FF),
+    (0x1FA70, 0x1FA7C), (0x1FA80, 0x1FA89), (0x1FA8F, 0x1FAC6), (0x1FACE, 0x1FADC),
+    (0x1FADF, 0x1FAE9), (0x1FAF0, 0x1FAF8), (0xE0020, 0xE007F),
+)
+TEXT_MAX_LENGTH = 255
+# max number of rows in one bulk query
+BULK_BATCH_SIZE = 500
+
 # default settings
 EDFLEX_CLIENT_ID = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_CLIENT_ID')
 EDFLEX_CLIENT_SECRET = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_CLIENT_SECRET')
 EDFLEX_LOCALE = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_LOCALE', ['en'])[0]
 EDFLEX_BASE_API_URL = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_BASE_API_URL')
+# inline the SVG sprite into every fragment instead of serving it as a static asset
+EDFLEX_INLINE_SVG_SPRITE = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_INLINE_SVG_SPRITE', False)
+# lifetime of the cached catalog ids of a tenant, refreshed by every sync
+EDFLEX_CATALOG_IDS_CACHE_TIMEOUT = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get(
+    'EDFLEX_CATALOG_IDS_CACHE_TIMEOUT', 60 * 60 * 24
+)
+# age in seconds after which a stored resource payload is fetched again from Edflex
+EDFLEX_RESOURCE_DATA_MAX_AGE = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get(
+    'EDFLEX_RESOURCE_DATA_MAX_AGE', 60 * 60 * 24 * 8
+)
+# max number of resources returned by a page of the Studio resource picker
+EDFLEX_RESOURCES_PAGE_SIZE = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_RESOURCES_PAGE_SIZE', 50)
+# number of resources fetched in parallel for a tenant
+EDFLEX_FETCH_CONCURRENCY = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_FETCH_CONCURRENCY', 4)
+# max number of resource requests per second for a tenant, 0 - unlimited
+EDFLEX_FETCH_RATE_LIMIT = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_FETCH_RATE_LIMIT', 0)
+# lifetime in seconds of the sync lease of a tenant, renewed while the sync runs
+EDFLEX_SYNC_LEASE_TIMEOUT = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get('EDFLEX_SYNC_LEASE_TIMEOUT', 60 * 5)
+# max age in seconds of an interrupted full sync resumed by the next run, older ones start over
+EDFLEX_SYNC_RESUME_MAX_AGE = settings.XBLOCK_SETTINGS.get('EdflexXBlock', {}).get(
+    'EDFLEX_SYNC_RESUME_MAX_AGE', 60 * 60 * 24
+)
+
+log = logging.getLogger('edflex_xblock')
 
 
 def get_edflex_configuration_for_org(org):
@@ -44,3 +127,182 @@ def get_edflex_configuration():
         'locale': locale,
         'base_api_url': base_api_url
     }
+
+
+def get_catalog_ids_cache_key(config):
+    return u'edflex.catalog_ids.{base_api_url}.{client_id}.{locale}'.format(**config)
+
+
+def cache_catalog_ids(config, catalog_ids):
+    cache.set(get_catalog_ids_cache_key(config), list(catalog_ids), EDFLEX_CATALOG_IDS_CACHE_TIMEOUT)
+
+
+def get_catalog_ids(config):
+    """
+    Return the ids of the catalogs available with the `config` credentials.
+
+    The ids are cached by the sync tasks, Edflex is only called on a cache miss.
+    """
+    catalog_ids = cache.get(get_catalog_ids_cache_key(config))
+
+    if catalog_ids is None:
+        edflex_client = EdflexOauthClient(
+            config, timeout=EDFLEX_API_HANDLER_TIMEOUT, max_retries=EDFLEX_API_HANDLER_MAX_RETRIES
+        )
+        catalog_ids = [r_catalog['id'] for r_catalog in edflex_client.get_catalogs()]
+        if catalog_ids:
+            cache_catalog_ids(config, catalog_ids)
+
+    return catalog_ids
+
+
+def get_sync_lock_key(config):
+    return u'edflex.sync_lock.{base_api_url}.{client_id}.{locale}'.format(**config)
+
+
+class SyncLease(object):
+    """
+    Lease on the sync of the tenant with the `config` credentials.
+
+    The lease expires `timeout` seconds after it was last renewed, a heartbeat
+    thread renews it while it's held. A long sync thus keeps its lease, and
+    the lease of a crashed worker is freed within `timeout`.
+    """
+
+    def __init__(self, config, timeout=None):
+        self.key = get_sync_lock_key(config)
+        self.timeout = timeout or EDFLEX_SYNC_LEASE_TIMEOUT
+        self.token = uuid.uuid4().hex
+        self.released = threading.Event()
+        self.heartbeat = None
+
+    def acquire(self):
+        if not cache.add(self.key, self.token, self.timeout):
+            return False
+
+        self.heartbeat = threading.Thread(target=self.keep_alive)
+        self.heartbeat.daemon = True
+        self.heartbeat.start()
+        return True
+
+    def renew(self):
+        """
+        Extend the lease, return False when it expired and was taken over.
+        """
+        if cache.get(self.key) != self.token:
+            return False
+
+        cache.set(self.key, self.token, self.timeout)
+        return True
+
+    def keep_alive(self):
+        while not self.released.wait(self.timeout / 3.0):
+            if not self.renew():
+                log.warning(u"Edflex sync lease <{}> lost before the end of the sync".format(self.key))
+                return
+
+    def release(self):
+        self.released.set()
+        if self.heartbeat is not None:
+            self.heartbeat.join()
+
+        if cache.get(self.key) == self.token:
+            cache.delete(self.key)
+
+
+@contextmanager
+def sync_lock(config):
+    """
+    Hold the sync lease of the tenant with the `config` credentials.
+
+    Yield whether the lease was acquired, it isn't while another sync of the
+    tenant is running.
+    """
+    lease = SyncLease(config)
+    acquired = lease.acquire()
+
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            lease.release()
+
+
+def chunks(items, size=BULK_BATCH_SIZE):
+    items = iter(items)
+    chunk = list(islice(items, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(items, size))
+
+
+class RateLimiter(object):
+    """
+    Thread-safe limiter spacing calls out to at most `rate` per second.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_call = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+
+        with self.lock:
+            now = time.time()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _compile_codepoint_ranges(ranges, prefix=u''):
+    """
+    Compile a regex matching `prefix` or a codepoint of one of the `ranges`.
+
+    Narrow Python builds store the astral codepoints as surrogate pairs,
+    which are matched by a high surrogate followed by a low surrogate range.
+    """
+    char_ranges = []
+    surrogate_ranges = []
+
+    for start, end in ranges:
+        if end <= sys.maxunicode:
+            char_ranges.append(u'{}-{}'.format(re.escape(six.unichr(start)), re.escape(six.unichr(end))))
+            continue
+
+        high_start, low_start = divmod(start - 0x10000, 0x400)
+        high_end, low_end = divmod(end - 0x10000, 0x400)
+        for high in range(high_start, high_end + 1):
+            surrogate_ranges.append(u'{}[{}-{}]'.format(
+                six.unichr(0xD800 + high),
+                six.unichr(0xDC00 + (low_start if high == high_start else 0)),
+                six.unichr(0xDC00 + (low_end if high == high_end else 0x3FF)),
+            ))
+
+    return re.compile(u'|'.join([prefix, u'[{}]'.format(u''.join(char_ranges))] + surrogate_ranges))
+
+
+EMOJI_RE = _compile_codepoint_ranges(EMOJI_CODEPOINT_RANGES, prefix=u'[#*0-9]\uFE0F?\u20E3')
+WHITESPACE_RE = re.compile(r'\s+', re.UNICODE)
+
+
+def clean_text(text, max_length=TEXT_MAX_LENGTH):
+    """
+    Normalize a text imported from Edflex.
+
+    Emoji are stripped, whitespace runs are collapsed into a single space
+    and the text is truncated to `max_length`, the length of the CharField
+    storing it. Texts stored in a TextField pass `max_length=None`.
+    """
+    if not text:
+        return text
+
+    text = EMOJI_RE.sub(u'', text)
+    text = WHITESPACE_RE.sub(u' ', text).strip()
+    if max_length is not None:
+        text = text[:max_length].rstrip()
+    return text